@@ -29,6 +29,10 @@ def create_app(config_class=Config):
     from app.controllers import register_controllers, landing
     register_controllers(app)
 
+    if app.config.get('MEDSAM2_WARMUP'):
+        from app.controllers.medsam2 import warm_up
+        warm_up()
+
     @app.cli.command("download-medsam")
     def download_medsam():
         """Download the MedSAM model."""
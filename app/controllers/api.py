@@ -4,7 +4,10 @@ from PIL import Image
 from app.services.AnnotationService import AnnotationService
 from app.services.BoundingBoxSegmentationService import BoundingBoxSegmentationService
 from app.services.DatasetService import DatasetService
-from app.services.FileService import FileService
+from app.services.FileService import FileService, RESOURCE_FIELDS
+from app.services.MaskInterpolationService import MaskInterpolationService, decode_mask, rle_encode
+from app.services.ModelRegistry import ModelRegistry
+from app.services.PaginationService import PaginationService
 from app.services.UserService import UserService
 import io
 bp = Blueprint("api", __name__)
@@ -39,6 +42,13 @@ def ai():
 
     return 
 
+@bp.route("/models", methods=["GET"])
+def models():
+    """Load state, load time and memory of every model this process knows."""
+    if not session.get("user_id"):
+        return {"error": "Not authenticated"}, 401
+    return jsonify(ModelRegistry.status()), 200
+
 # USER
 @bp.route("/user/create", methods=["POST"])
 def createUser():
@@ -81,6 +91,57 @@ def createDataset():
 def readDataset(dataset_id):
     return jsonify(DatasetService.read(dataset_id=dataset_id).serialize()), 200
 
+@bp.route("/dataset/<int:dataset_id>/resources", methods=["GET"])
+def listDatasetResources(dataset_id):
+    """
+    Keyset-paginated files of a dataset.
+    ?cursor= from the previous page's next_cursor, ?limit=, ?order=id|instance,
+    ?fields=resource_id,path,... to return only those fields.
+    """
+    if not DatasetService.read_for_user(dataset_id, session.get("user_id")):
+        return {"error": "Dataset not found"}, 404
+    try:
+        fields = PaginationService.fields(request.args.get("fields"), RESOURCE_FIELDS)
+        page = FileService.page(dataset_id, request.args.get("cursor"),
+                                request.args.get("limit"), request.args.get("order", "id"))
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+    annotations = {}
+    if fields is None or "annotations" in fields:
+        # One query for the whole page instead of one per resource
+        grouped = AnnotationService.by_resource([resource.id for resource, _ in page.items])
+        for resource_id, items in grouped.items():
+            annotations[resource_id] = AnnotationService.serialize_many(items)
+
+    return jsonify(page.serialize(lambda row: FileService.project(
+        row[0], fields, instance_number=row[1], annotations=annotations.get(row[0].id)
+    ))), 200
+
+@bp.route("/dataset/<int:dataset_id>/interpolate-masks", methods=["POST"])
+def interpolateDatasetMasks(dataset_id):
+    """
+    Fill every unannotated slice between the annotated ones in one call.
+    Body: {"masks": {"<resource_id>": <RLE {"size", "counts"} or base64 image>, ...}}
+    with at least two key slices. Returns {"masks": {"<resource_id>": RLE}}
+    for each interpolated slice, in the same RLE layout as /medsam2.
+    """
+    user_id = session.get("user_id")
+    if not DatasetService.read_for_user(dataset_id, user_id):
+        return {"error": "Dataset not found"}, 404
+    data = request.get_json(silent=True) or {}
+    raw = data.get("masks")
+    if not isinstance(raw, dict) or len(raw) < 2:
+        return {"error": "At least two key masks are required"}, 400
+
+    try:
+        key_masks = {int(resource_id): decode_mask(mask) for resource_id, mask in raw.items()}
+        filled = MaskInterpolationService.fill_series(dataset_id, user_id, key_masks)
+    except (ValueError, TypeError, KeyError) as e:
+        return {"error": f"Invalid masks: {str(e)}"}, 400
+
+    return jsonify({"masks": {str(resource_id): rle_encode(mask) for resource_id, mask in filled.items()}}), 200
+
 @bp.route("/dataset", methods=["POST"])
 def updateDataset():
     pass
@@ -103,7 +164,38 @@ def createImage():
 
 @bp.route("/image/<int:image_id>", methods=["GET"])
 def readImage(image_id):
-    return jsonify(FileService.read(resource_id=image_id).serialize()), 200
+    row = FileService.find_with_dicom(image_id, session.get("user_id"))
+    if not row:
+        return {"error": "Image not found"}, 404
+    resource, dicom = row
+    fields = request.args.get("fields")
+    if not fields:
+        # DICOM images carry their header fields, as FileService.read gives them
+        return jsonify((dicom or resource).serialize()), 200
+
+    # Projection: only the requested fields, annotations fetched only if asked for
+    try:
+        fields = PaginationService.fields(fields, RESOURCE_FIELDS)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    instance_number = dicom.instance_number if dicom is not None else None
+    annotations = None
+    if "annotations" in fields:
+        annotations = AnnotationService.serialize_many(AnnotationService.by_resource([image_id])[image_id])
+    return jsonify(FileService.project(resource, fields, instance_number, annotations)), 200
+
+@bp.route("/image/<int:image_id>/annotations", methods=["GET"])
+def listImageAnnotations(image_id):
+    """Keyset-paginated annotations of an image (?cursor=, ?limit=)."""
+    if not FileService.find_for_user(image_id, session.get("user_id")):
+        return {"error": "Image not found"}, 404
+    try:
+        page = AnnotationService.page(image_id, request.args.get("cursor"), request.args.get("limit"))
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    result = page.serialize()
+    result["items"] = AnnotationService.serialize_many(page.items)
+    return jsonify(result), 200
 
 @bp.route("/image", methods=["POST"])
 def updateImage():
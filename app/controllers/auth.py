@@ -1,5 +1,6 @@
 from flask import Blueprint, render_template, request, session, redirect, url_for, flash, current_app, send_from_directory
 from app.services.UserService import UserService
+from app.services.DatasetService import DatasetService
 from app.models.User import User
 import random
 from werkzeug.utils import secure_filename
@@ -88,20 +89,14 @@ def profile():
         flash("Your session has expired. Please log in again.", "error")
         return redirect(url_for("auth.login"))
 
-    # Total images owned by this user
+    # Total images uploaded by this user (rendered batch outputs are not counted)
     try:
-        imageCount = user.resources.count()
+        imageCount = user.resources.filter_by(type='AImage').count()
     except Exception:
-        imageCount = len(user.resources)
-
-    # Count all images inside datasets tagged "Done"
-    done_count = 0
-    # user.datasets is a dynamic relationship; filter_by works here
-    for ds in user.datasets.filter_by(tags="Done"):
-        try:
-            done_count += ds.files.count()
-        except Exception:
-            done_count += len(ds.files)
+        imageCount = len([r for r in user.resources if r.type == 'AImage'])
+
+    # Count all images inside datasets tagged "Done" in one aggregate query
+    done_count = DatasetService.file_count(user.id, tags="Done")
 
     annotationCount = done_count
     pendingCount    = imageCount - done_count
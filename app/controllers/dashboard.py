@@ -1,6 +1,7 @@
-from flask import Blueprint, render_template, session, redirect, url_for, request, flash, abort
+from flask import Blueprint, render_template, session, redirect, url_for, request, flash, abort, jsonify
+from app.controllers.uploads import flash_ingest_results, wants_json
 from app.services.DatasetService import DatasetService
-from app.services.FileService import FileService
+from app.services.IngestService import IngestService
 
 bp = Blueprint("dashboard", __name__, url_prefix='/dashboard')
 
@@ -12,6 +13,7 @@ def index():
     user_id = session['user_id']
     # Fetch all datasets belonging to the user
     all_datasets = DatasetService.list_for_user(user_id)
+    DatasetService.summarize(all_datasets, user_id)
 
     # Partition into To Do vs Done
     todo_datasets = [ds for ds in all_datasets if ds.tags == 'To Do']
@@ -38,19 +40,8 @@ def upload_to_dataset(ds_id):
     if not files or all(file.filename == '' for file in files):
         flash('No files selected', 'error')
         return redirect(url_for('dashboard.index'))
-    success_count = 0
-    error_messages = []
-    for f in files:
-        if f and f.filename:
-            try:
-                FileService.upload(f, type='AImage', dataset_id=ds_id)
-                success_count += 1
-            except ValueError as e:
-                error_messages.append(f"{f.filename}: {str(e)}")
-            except Exception as e:
-                error_messages.append(f"{f.filename}: An error occurred during upload")
-    if success_count > 0:
-        flash(f"Successfully uploaded {success_count} files.", 'success')
-    if error_messages:
-        flash('\n'.join(error_messages), 'error')
+    results = IngestService.ingest(files, ds_id)
+    if wants_json():
+        return jsonify([r.serialize() for r in results])
+    flash_ingest_results(results)
     return redirect(url_for('dashboard.index'))
@@ -3,13 +3,21 @@ import base64
 import io
 import os
 import sys
+import threading
 from PIL import Image
 
 import cv2
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, jsonify, request, session
 import numpy as np
 import torch
 
+from segment_anything.utils.amg import area_from_rle, mask_to_rle_pytorch
+
+from app.models.Resource import Resource
+from app.services.EmbeddingCacheService import EmbeddingCacheService
+from app.services.ModelRegistry import ModelRegistry
+from app.services.SliceService import SliceService
+
 # from app.vendors.MedSAM2.sam2_train.build_sam import build_sam2
 # from app.vendors.MedSAM2.sam2_train.sam2_image_predictor import SAM2ImagePredictor
 # Get the absolute path to the app directory
@@ -29,19 +37,51 @@ DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
 CONFIG_FILENAME = 'sam2_hiera_s.yaml'
 CHECKPOINT_PATH = os.path.join(vendors_dir, 'checkpoints', 'sam2_hiera_small.pt')
 
+MODEL_NAME = f"medsam2_hiera_s:{DEVICE}"
+
+def _load_model():
+    # Imported here so that importing the blueprint (every CLI command and
+    # worker start) does not pay for the SAM2 package or the checkpoint
+    from sam2_train.build_sam import build_sam2
+
+    print(f"Using CONFIG_FILENAME: {CONFIG_FILENAME}")
+    print(f"Using CHECKPOINT_PATH: {CHECKPOINT_PATH}")
+    if not os.path.exists(CHECKPOINT_PATH):
+        raise FileNotFoundError(f"MedSAM2 checkpoint not found: {CHECKPOINT_PATH}")
+
+    model = build_sam2(CONFIG_FILENAME, CHECKPOINT_PATH, device=DEVICE, mode="eval")
+    model.to(DEVICE)
+    model.eval()
+    return model
+
+ModelRegistry.register(MODEL_NAME, _load_model)
+
+# --- Predictor built on first use (shared model through the process-wide registry) ---
+_predictor = None
+_predictor_lock = threading.Lock()
+_predict_lock = threading.Lock()
 
-# Print paths for debugging
-print(f"Using CONFIG_FILENAME: {CONFIG_FILENAME}")
-print(f"Using CHECKPOINT_PATH: {CHECKPOINT_PATH}")
-print(f"Checking if checkpoint exists: {os.path.exists(CHECKPOINT_PATH)}")
-from sam2_train.build_sam import build_sam2
-from sam2_train.sam2_image_predictor import SAM2ImagePredictor
+# Arrays stored per embedding-cache entry for SAM2ImagePredictor
+SAM2_FEATURE_NAMES = ("image_embed", "high_res_0", "high_res_1", "orig_hw")
 
-# --- Load model once ---
-model = build_sam2(CONFIG_FILENAME, CHECKPOINT_PATH, device=DEVICE, mode="eval")
-model.to(DEVICE)
-model.eval()
-predictor = SAM2ImagePredictor(model)
+def _get_predictor():
+    global _predictor
+    if _predictor is None:
+        with _predictor_lock:
+            if _predictor is None:
+                from sam2_train.sam2_image_predictor import SAM2ImagePredictor
+                _predictor = SAM2ImagePredictor(ModelRegistry.get(MODEL_NAME))
+    return _predictor
+
+def warm_up():
+    """Load the model in a background thread so the first request does not wait."""
+    def _run():
+        try:
+            _get_predictor()
+        except Exception as e:
+            print(f"MedSAM2 warm-up failed: {str(e)}")
+
+    threading.Thread(target=_run, name="medsam2-warmup", daemon=True).start()
 
 def _data_url_to_array(data_url):
     header, encoded = data_url.split(",", 1)
@@ -92,30 +132,106 @@ def _create_overlay(arr, mask, point_coords=None, point_labels=None, box=None, d
     return png_data
 
     
-def _serialize_masks(masks, scores):
-    """Serialize masks and scores for JSON transmission"""
-    all_masks = []
-    all_scores = []
-
-    for i, mask in enumerate(masks):
-        # Convert each mask to a flat list of booleans
-        # Ensure we're working with a boolean type mask
-        bool_mask = mask.astype(bool)
-        mask_flat = bool_mask.flatten().tolist()
-        all_masks.append(mask_flat)
-        all_scores.append(float(scores[i]))
-    
-    return all_masks, all_scores
+def _serialize_masks(masks, scores, mask_format="rle"):
+    """
+    Serialize masks and scores for JSON transmission.
+
+    "rle" (default) returns uncompressed COCO-style RLE dicts
+    ({"size": [h, w], "counts": [...]}, column-major, first run is zeros),
+    a few hundred integers per mask instead of h*w booleans. "list" keeps
+    the old flat boolean lists for existing clients.
+    """
+    all_scores = [float(s) for s in scores]
+    bool_masks = np.asarray(masks).astype(bool)
+
+    if mask_format == "list":
+        return [m.flatten().tolist() for m in bool_masks], all_scores
+
+    rles = mask_to_rle_pytorch(torch.from_numpy(bool_masks))
+    for rle in rles:
+        rle["area"] = area_from_rle(rle)
+    return rles, all_scores
+
+@bp.route("/status", methods=["GET"])
+def status():
+    """Readiness of the MedSAM2 model: idle, loading, ready or error."""
+    state = ModelRegistry.status(MODEL_NAME)
+    return jsonify(state), 200 if state["state"] == "ready" else 503
+
+def _request_image(data):
+    """
+    RGB pixels a prediction runs on, plus the embedding-cache key for them.
+
+    Clients send a resource_id (with optional slice_index, window_center /
+    window_width and apply_filters) so the server decodes the slice from its
+    own cache, with the same session filter chain the viewer shows. A base64
+    "image" data URL is still accepted for callers without a stored resource.
+    """
+    cache = EmbeddingCacheService.cache()
+    if data.get("resource_id") is None:
+        arr = _data_url_to_array(data["image"])
+        return arr, cache.key(arr, {"model": MODEL_NAME})
+
+    resource = Resource.query.get(int(data["resource_id"]))
+    # Other users' slices are reported as missing, not forbidden
+    if resource is None or resource.owner_id != session.get("user_id"):
+        raise LookupError("Resource not found")
+
+    index = int(data.get("slice_index", 0))
+    window = None
+    if data.get("window_center") is not None and data.get("window_width") is not None:
+        window = (float(data["window_center"]), float(data["window_width"]))
+    chain = []
+    if data.get("apply_filters", True):
+        chain = session.get(f"batch_{resource.dataset_id}_processes", [])
+
+    frame = SliceService.load(resource, index, window, chain)
+    if frame.ndim == 2:
+        arr = cv2.cvtColor(frame, cv2.COLOR_GRAY2RGB)
+    else:
+        arr = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    stamp = SliceService.stamp(resource, index, window, chain)
+    return arr, cache.key_for({"model": MODEL_NAME, "frame": stamp})
+
+def _set_image(predictor, arr, key):
+    """set_image, restoring cached SAM2 backbone features when the key was seen before."""
+    cache = EmbeddingCacheService.cache()
+    cached = cache.get(key, SAM2_FEATURE_NAMES)
+    if cached is not None:
+        predictor.reset_predictor()
+        predictor._features = {
+            "image_embed": torch.from_numpy(cached["image_embed"]).to(DEVICE),
+            "high_res_feats": [
+                torch.from_numpy(cached["high_res_0"]).to(DEVICE),
+                torch.from_numpy(cached["high_res_1"]).to(DEVICE),
+            ],
+        }
+        predictor._orig_hw = [tuple(int(v) for v in cached["orig_hw"])]
+        predictor._is_image_set = True
+        return
+
+    predictor.set_image(arr)
+    features = predictor._features
+    cache.put(key, {
+        "image_embed": features["image_embed"].detach().cpu().numpy(),
+        "high_res_0": features["high_res_feats"][0].detach().cpu().numpy(),
+        "high_res_1": features["high_res_feats"][1].detach().cpu().numpy(),
+        "orig_hw": np.array(predictor._orig_hw[0]),
+    })
 
 @bp.route("/predict_combined", methods=["POST"])
 def predict_combined():
     data = request.json
-    arr = _data_url_to_array(data["image"])
+    try:
+        arr, embed_key = _request_image(data)
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 404
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid image input: {str(e)}"}), 400
     
     try:
-        # Set image
-        predictor.set_image(arr)
-        
+        predictor = _get_predictor()
+
         # Get inputs if provided
         point_coords = np.array(data.get("point_coords", [])) if "point_coords" in data else None
         point_labels = np.array(data.get("point_labels", [])) if "point_labels" in data else None
@@ -125,30 +241,19 @@ def predict_combined():
         multimask_output = data.get("multimask_output", False)
         
         # Predict based on available inputs
+        prompts = {}
         if point_coords is not None and point_labels is not None:
-            if box is not None:
-                # Combined points and box
-                masks, scores, _ = predictor.predict(
-                    point_coords=point_coords,
-                    point_labels=point_labels,
-                    box=box,
-                    multimask_output=multimask_output
-                )
-            else:
-                # Only points
-                masks, scores, _ = predictor.predict(
-                    point_coords=point_coords,
-                    point_labels=point_labels,
-                    multimask_output=multimask_output
-                )
-        elif box is not None:
-            # Only box
-            masks, scores, _ = predictor.predict(
-                box=box,
-                multimask_output=multimask_output
-            )
-        else:
+            prompts["point_coords"] = point_coords
+            prompts["point_labels"] = point_labels
+        if box is not None:
+            prompts["box"] = box
+        if not prompts:
             return jsonify({"error": "No input provided. Need point coordinates or box."}), 400
+
+        # The predictor holds per-image state, so one request uses it at a time
+        with _predict_lock:
+            _set_image(predictor, arr, embed_key)
+            masks, scores, _ = predictor.predict(multimask_output=multimask_output, **prompts)
         
         # Choose the best mask based on model scores for the overlay preview
         best_mask_idx = np.argmax(scores)
@@ -166,16 +271,15 @@ def predict_combined():
         
         # For multi-mask output, serialize all masks and scores
         if multimask_output and len(masks) > 1:
-            all_masks, all_scores = _serialize_masks(masks, scores)
+            mask_format = data.get("mask_format", "rle")
+            all_masks, all_scores = _serialize_masks(masks, scores, mask_format)
             
-            # Make sure mask data is properly formatted for the frontend
-            print(f"Sending {len(all_masks)} masks to frontend")
-            print(f"First mask shape: {masks[0].shape}, data type: {masks[0].dtype}")
-            print(f"Serialized mask length: {len(all_masks[0])}")
+            print(f"Sending {len(all_masks)} masks to frontend ({mask_format})")
             
             return jsonify({
                 "overlay": _array_to_data_url(overlay),
                 "score": float(scores[best_mask_idx]),
+                "mask_format": mask_format,
                 "all_masks": all_masks,
                 "all_scores": all_scores
             })
@@ -1,26 +1,35 @@
 import base64
+import hashlib
 import os
 import io
-import zipfile
 from io import BytesIO
 import json
+from urllib.parse import quote
 
 import cv2
 import numpy as np
-import pydicom
 from flask import (
     Blueprint, current_app, render_template, request,
-    redirect, session, url_for, send_file, abort, flash, jsonify
+    redirect, session, url_for, send_file, abort, flash, jsonify,
+    stream_with_context
 )
 from PIL import Image
-from skimage import measure
-from skimage.transform import resize
-from scipy.interpolate import interp1d
 
 from app.models.Resource import Resource
 from app.services.FileService import FileService
 from app.services.medsam_service import MedSAMService
-from app.filters import DicomFilters, Thresholding, GMM, apply_segmentation
+from app.services.WorkspaceService import WorkspaceService
+from app.services.FilterCacheService import FilterCacheService
+from app.services.SliceService import SliceService
+from app.services.SliceMaskService import SliceMaskService
+from app.services.BatchJobService import BatchJobService
+from app.services.ContourInterpolationService import ContourInterpolationService
+from app.services.DecodeService import DecodeTimeout
+from app.services.DicomService import DicomService
+from app.services.ExportService import ExportService
+from app.services.MeshService import MeshService, MESH_FORMATS, MESH_VERSION
+from app.services.SeriesVolumeService import SeriesVolumeService
+from app.filters import FILTER_NAMES, get_filter, apply_filter as run_filter
 
 # Blueprint for image processing routes
 bp = Blueprint('processing', __name__, url_prefix='/process')
@@ -28,72 +37,60 @@ bp = Blueprint('processing', __name__, url_prefix='/process')
 # Initialize MedSAM service (will be initialized lazily when needed)
 medsam_service = MedSAMService()
 
-# Filter names available in workspace
-FILTER_NAMES = [
-    'Original', 'CLAHE', 'Gamma', 'Gaussian', 'Median',
-    'Non-Local Means', 'Threshold (Otsu)', 'Threshold (Binary)',
-    'GMM', 'Segment'
-]
 
-# Global state to track undo/redo and history
-global_original_image = None
-global_current_image = None
-global_history = []
-global_processes = []
+@bp.errorhandler(DecodeTimeout)
+def decode_timeout(e):
+    """A series-wide decode ran past its per-request time budget."""
+    return jsonify({'error': str(e)}), 503
 
 
-def get_allowed_filters():
+def get_allowed_filters(processes):
     """Disable certain filters after threshold operations."""
-    blocking = {'Threshold (Otsu)', 'Threshold (Binary)'}
-    if global_processes and global_processes[-1] in blocking:
-        return ['Original']
+    if processes:
+        last = get_filter(processes[-1])
+        if last is not None and last.blocking:
+            return ['Original']
     return FILTER_NAMES
 
 
-def read_and_process(path, mime_type, dataset_id=None):
-    """Convert raw image or DICOM to base64 PNG for thumbnail."""
-    base_folder = current_app.config['UPLOAD_FOLDER']
-    if dataset_id:
-        base_folder = os.path.join(base_folder, str(dataset_id))
-    full_path = os.path.join(base_folder, path)
+def _apply_operation(ws, img, op):
+    """Apply one logged workspace operation to img."""
+    if op['name'] == 'Original':
+        return ws.original
+    if op['name'] == 'MedSAM':
+        mask = WorkspaceService.unpack_mask(op['payload'])
+        return medsam_service.overlay_mask(img, mask)
+    return run_filter(op['name'], img)
+
 
-    if mime_type == 'application/dicom':
-        dcm = pydicom.dcmread(full_path)
-        arr = dcm.pixel_array
-        arr = cv2.normalize(arr, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)
-        _, buf = cv2.imencode('.png', arr)
-        return base64.b64encode(buf).decode('utf-8')
+def _replay(ws):
+    """Rebuild the current frame of ws from its original and operation log."""
+    img = ws.original
+    for op in ws.operations:
+        img = _apply_operation(ws, img, op)
+    return img
 
-    img = cv2.imread(full_path)
-    _, buf = cv2.imencode('.png', img)
-    return base64.b64encode(buf).decode('utf-8')
+
+def _load_workspace_image(file):
+    base_folder = current_app.config['UPLOAD_FOLDER']
+    if file.dataset_id:
+        base_folder = os.path.join(base_folder, str(file.dataset_id))
+    img_path = os.path.join(base_folder, file.path)
+    return cv2.imread(img_path)
 
 
 @bp.route('/<int:file_id>')
 def process(file_id):
     """Workspace – show the last-processed image plus history & controls."""
-    global global_original_image, global_current_image, global_history, global_processes
     file = Resource.query.get_or_404(file_id)
 
-    # Build actual filesystem path
-    base_folder = current_app.config['UPLOAD_FOLDER']
-    if file.dataset_id:
-        base_folder = os.path.join(base_folder, str(file.dataset_id))
-    img_path = os.path.join(base_folder, file.path)
-    original = cv2.imread(img_path)
-    if original is None:
+    # Only touch the disk when this session has no workspace for the file
+    ws = WorkspaceService.open(file_id, lambda: _load_workspace_image(file))
+    if ws is None:
         abort(404, description='Image file not found')
 
-    # Reset history on new file
-    if session.get('last_file') != file_id:
-        global_original_image = original.copy()
-        global_current_image = original.copy()
-        global_history.clear()
-        global_processes.clear()
-        session['last_file'] = file_id
-
     # Encode current for display
-    _, buf = cv2.imencode('.png', global_current_image)
+    _, buf = cv2.imencode('.png', ws.current)
     img_b64 = base64.b64encode(buf).decode('utf-8')
 
     return render_template(
@@ -101,67 +98,55 @@ def process(file_id):
         file=file,
         img=img_b64,
         filter_names=FILTER_NAMES,
-        allowed_filters=get_allowed_filters(),
-        processes=global_processes,
-        files=FileService.getUserFiles(type='AImage', dataset_id=file.dataset_id),
-        read_and_process=read_and_process
+        allowed_filters=get_allowed_filters(ws.processes),
+        processes=ws.processes,
+        files=FileService.getUserFiles(type='AImage', dataset_id=file.dataset_id)
     )
 
 
 @bp.route('/<int:file_id>/apply', methods=['POST'])
 def apply_filter(file_id):
     """Apply one filter to the current image in the workspace."""
-    global global_current_image, global_history, global_processes
+    ws = WorkspaceService.get(file_id)
+    if ws is None:
+        return redirect(url_for('processing.process', file_id=file_id))
+
     name = request.form.get('filter_name')
-    if name not in get_allowed_filters():
+    if name not in get_allowed_filters(ws.processes):
         return redirect(url_for('processing.process', file_id=file_id))
 
-    global_history.append(global_current_image.copy())
     if name == 'Original':
-        global_current_image = global_original_image.copy()
+        result = ws.original
     else:
-        base = global_current_image
-        fmap = DicomFilters.apply_filters(base)
-        thr = Thresholding(base)
-        fmap['Threshold (Otsu)'] = thr.apply_otsu_threshold()
-        fmap['Threshold (Binary)'] = thr.apply_binary_threshold(127)
-        gmm = GMM(base); gmm.fit_gmm(n_components=2)
-        fmap['GMM'] = gmm.apply_gmm_threshold()
-        fmap['Segment'] = apply_segmentation(base)
-        global_current_image = fmap.get(name, base)
-
-    global_processes.append(name)
+        result = run_filter(name, ws.current)
+
+    WorkspaceService.push(file_id, ws, name, result)
     return redirect(url_for('processing.process', file_id=file_id))
 
 
 @bp.route('/<int:file_id>/undo')
 def undo(file_id):
     """Undo the last single-image operation."""
-    global global_current_image, global_history, global_processes
-    if global_history:
-        global_current_image = global_history.pop()
-        global_processes.pop()
+    ws = WorkspaceService.get(file_id)
+    if ws is not None:
+        WorkspaceService.undo(file_id, ws, _replay)
     return redirect(url_for('processing.process', file_id=file_id))
 
 
 @bp.route('/<int:file_id>/reset')
 def reset(file_id):
     """Reset the single-image workspace to original."""
-    global global_original_image, global_current_image, global_history, global_processes
-    global_current_image = global_original_image.copy()
-    global_history.clear()
-    global_processes.clear()
-    session.pop('last_file', None)
+    WorkspaceService.reset(file_id)
     return redirect(url_for('processing.process', file_id=file_id))
 
 
 @bp.route('/<int:file_id>/download')
 def download_processed(file_id):
     """Download the currently processed single image."""
-    global global_current_image
-    if global_current_image is None:
+    ws = WorkspaceService.get(file_id)
+    if ws is None:
         abort(404)
-    success, buf = cv2.imencode('.png', global_current_image)
+    success, buf = cv2.imencode('.png', ws.current)
     if not success:
         abort(500)
     bio = io.BytesIO(buf.tobytes())
@@ -240,21 +225,55 @@ def batch_download(ds_id):
         abort(403)
 
     files = FileService.getUserFiles(type='AImage', dataset_id=ds_id)
-    memory_zip = BytesIO()
-    with zipfile.ZipFile(memory_zip, 'w') as zipf:
-        for f in files:
-            base_folder = current_app.config['UPLOAD_FOLDER']
-            if f.dataset_id:
-                base_folder = os.path.join(base_folder, str(f.dataset_id))
-            filepath = os.path.join(base_folder, f.path)
-            zipf.write(filepath, arcname=f.path)
-    memory_zip.seek(0)
-    return send_file(
-        memory_zip,
+    base_folder = os.path.join(current_app.config['UPLOAD_FOLDER'], str(ds_id))
+
+    # ?processed=1 exports the slides rendered through the batch filter chain
+    if request.args.get('processed', type=int):
+        procs = session.get(f'batch_{ds_id}_processes', [])
+        entries = ExportService.processed_entries(files, base_folder, procs)
+        download_name = f'{ds.name}_processed.zip'
+    else:
+        entries = ExportService.raw_entries(files, base_folder)
+        download_name = f'{ds.name}_images.zip'
+
+    response = current_app.response_class(
+        stream_with_context(ExportService.stream_zip(entries)),
         mimetype='application/zip',
-        as_attachment=True,
-        download_name=f'{ds.name}_images.zip'
     )
+    response.headers['Content-Disposition'] = f"attachment; filename*=UTF-8''{quote(download_name)}"
+    return response
+
+
+@bp.route('/batch/<int:ds_id>/render', methods=['POST'])
+def batch_render(ds_id):
+    """Start a background job rendering the batch chain for every slide."""
+    if not session.get('user_id'):
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    from app.services.DatasetService import DatasetService
+    ds = DatasetService.read_for_user(ds_id, session['user_id'])
+    if not ds:
+        return jsonify({'error': 'Dataset not found'}), 404
+
+    files = FileService.getUserFiles(type='AImage', dataset_id=ds_id)
+    if not files:
+        return jsonify({'error': 'No files found in dataset'}), 400
+
+    procs = session.get(f'batch_{ds_id}_processes', [])
+    job = BatchJobService.start(ds, procs, files)
+    return jsonify(job.serialize()), 202
+
+
+@bp.route('/batch/jobs/<job_id>')
+def batch_job(job_id):
+    """Poll the progress of a batch render job."""
+    if not session.get('user_id'):
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    state = BatchJobService.read(job_id)
+    if not state or state['owner_id'] != session['user_id']:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(state)
 
 
 # ── Raw image bytes endpoint for slideshow ────────────────────────────────
@@ -264,109 +283,47 @@ def image(file_id):
     """
     Returns the slide image with all batch filters applied in order
     before sending it back as a PNG (or original mime-type).
+
+    Renders are served from the content-addressed filter cache, and the
+    ETag lets browsers revalidate unchanged slides without re-downloading.
     """
     try:
-        print(f"Starting image endpoint for file_id: {file_id}")  # Early debug log
-        
         file = Resource.query.get_or_404(file_id)
-        print(f"Found file: {file.path}, mime: {file.mime}")  # Debug log
 
         # figure out dataset folder
         base = current_app.config['UPLOAD_FOLDER']
         if file.dataset_id:
             base = os.path.join(base, str(file.dataset_id))
         path = os.path.join(base, file.path)
-        print(f"Full file path: {path}")  # Debug log
 
         # Check if file exists
         if not os.path.exists(path):
             print(f"File does not exist: {path}")  # Debug log
             return jsonify({'error': 'File not found'}), 404
 
-        # load raw
-        raw = None
-        if file.mime == 'application/dicom' or file.path.lower().endswith('.dcm'):
-            try:
-                print(f"Reading DICOM file: {path}")  # Debug log
-                dcm = pydicom.dcmread(path, force=True)
-                print(f"Successfully read DICOM file")  # Debug log
-                
-                if not hasattr(dcm, 'pixel_array'):
-                    print("DICOM file has no pixel array")  # Debug log
-                    return jsonify({'error': 'DICOM file has no pixel data'}), 500
-                    
-                arr = dcm.pixel_array
-                print(f"DICOM array shape: {arr.shape}, dtype: {arr.dtype}")  # Debug log
-                
-                # Handle different array shapes
-                if len(arr.shape) == 3:  # Multi-slice DICOM
-                    print("Multi-slice DICOM detected, using first slice")  # Debug log
-                    arr = arr[0]  # Take first slice
-                elif len(arr.shape) != 2:
-                    print(f"Unexpected array shape: {arr.shape}")  # Debug log
-                    return jsonify({'error': 'Unexpected DICOM array shape'}), 500
-                    
-                # Normalize to 8-bit
-                raw = cv2.normalize(arr, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)
-                print(f"Normalized array shape: {raw.shape}, dtype: {raw.dtype}")  # Debug log
-                
-                # Convert to 3-channel if grayscale
-                if len(raw.shape) == 2:
-                    raw = cv2.cvtColor(raw, cv2.COLOR_GRAY2BGR)
-                    print("Converted grayscale to BGR")  # Debug log
-                    
-            except Exception as e:
-                print(f"Error reading DICOM file {path}: {str(e)}")  # Debug log
-                return jsonify({'error': f'Error reading DICOM file: {str(e)}'}), 500
-        else:
-            raw = cv2.imread(path)
-            if raw is None:
-                print(f"Failed to load image: {path}")  # Debug log
-                return jsonify({'error': 'File not found'}), 404
-
-        if raw is None:
-            print(f"Failed to process image: {path}")  # Debug log
-            return jsonify({'error': 'Failed to process image'}), 500
-
-        # replay batch filters
         key = f'batch_{file.dataset_id}_processes'
         procs = session.get(key, [])
-        img = raw.copy()
-        
-        for name in procs:
-            if name == 'Original':
-                img = raw.copy()
-            elif name == 'GMM':
-                # Special handling for GMM
-                gmm = GMM(img)
-                gmm.fit_gmm(n_components=2)
-                img = gmm.apply_gmm_threshold()
-                print("GMM output shape:", img.shape, "dtype:", img.dtype, "min:", img.min(), "max:", img.max())
-                # Convert binary image to 3-channel if needed
-                if len(img.shape) == 2:
-                    img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
-            else:
-                fmap = DicomFilters.apply_filters(img)
-                thr = Thresholding(img)
-                fmap['Threshold (Otsu)'] = thr.apply_otsu_threshold()
-                fmap['Threshold (Binary)'] = thr.apply_binary_threshold(127)
-                fmap['Segment'] = apply_segmentation(img)
-                if name in fmap:
-                    img = fmap[name]
-                else:
-                    print(f"Warning: Unknown filter name: {name}")
-
-        # send out as PNG
+
+        etag = FilterCacheService.etag(path, procs)
+        if request.if_none_match.contains(etag):
+            response = current_app.response_class(status=304)
+            response.set_etag(etag)
+            return response
+
+        # replay batch filters, reusing the longest cached prefix of the chain
+        is_dicom = SliceService.is_dicom(file)
         try:
-            _, buf = cv2.imencode('.png', img)
-            bio = BytesIO(buf.tobytes())
-            bio.seek(0)
-            print(f"Successfully encoded image to PNG, size: {len(buf.tobytes())} bytes")  # Debug log
-            return send_file(bio, mimetype='image/png')
-        except Exception as e:
-            print(f"Error encoding image to PNG: {str(e)}")  # Debug log
-            return jsonify({'error': f'Error encoding image: {str(e)}'}), 500
-            
+            etag, data = FilterCacheService.render(path, is_dicom, procs)
+        except ValueError as e:
+            print(f"Error rendering {path}: {str(e)}")  # Debug log
+            return jsonify({'error': str(e)}), 500 if is_dicom else 404
+
+        response = send_file(BytesIO(data), mimetype='image/png')
+        response.set_etag(etag)
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response
+
     except Exception as e:
         print(f"Unexpected error in image endpoint: {str(e)}")  # Debug log
         return jsonify({'error': f'Unexpected error: {str(e)}'}), 500
@@ -375,8 +332,6 @@ def image(file_id):
 @bp.route('/<int:file_id>/segment', methods=['POST'])
 def segment_with_medsam(file_id):
     """Apply MedSAM segmentation using the provided rectangle coordinates."""
-    global global_current_image
-    
     try:
         # Get rectangle coordinates from request
         data = request.get_json()
@@ -386,17 +341,19 @@ def segment_with_medsam(file_id):
             return jsonify({'error': 'Invalid box coordinates'}), 400
             
         # Get the current image
-        if global_current_image is None:
+        ws = WorkspaceService.get(file_id)
+        if ws is None:
             return jsonify({'error': 'No image loaded'}), 400
             
         # Apply MedSAM segmentation
-        mask = medsam_service.segment_image(global_current_image, box)
+        mask = medsam_service.segment_image(ws.current, box)
         
         # Overlay the mask on the image
-        result = medsam_service.overlay_mask(global_current_image, mask)
+        result = medsam_service.overlay_mask(ws.current, mask)
         
-        # Update the current image
-        global_current_image = result
+        # Update the current image; the packed mask keeps the step replayable
+        WorkspaceService.push(file_id, ws, 'MedSAM', result,
+                              payload=WorkspaceService.pack_mask(mask))
         
         # Encode the result for display
         _, buf = cv2.imencode('.png', result)
@@ -465,32 +422,18 @@ def dicom_info(file_id):
     if file.mime != 'application/dicom' and not file.path.lower().endswith('.dcm'):
         return jsonify({'error': 'Not a DICOM file'}), 400
         
-    # figure out dataset folder
-    base = current_app.config['UPLOAD_FOLDER']
-    if file.dataset_id:
-        base = os.path.join(base, str(file.dataset_id))
-    path = os.path.join(base, file.path)
+    path = SliceService.path(file)
     
     try:
-        print(f"Reading DICOM file: {path}")  # Debug log
-        dcm = pydicom.dcmread(path, force=True)
-        print(f"Successfully read DICOM file")  # Debug log
-        
-        if hasattr(dcm, 'pixel_array'):
-            if len(dcm.pixel_array.shape) == 3:  # Multi-slice DICOM
-                num_slices = dcm.pixel_array.shape[0]
-            else:  # Single-slice DICOM
-                num_slices = 1
-        else:
-            num_slices = 1
-            
+        # Header fields stored at upload; no pixel data is decoded
+        dicom = DicomService.metadata(file, path)
         return jsonify({
-            'total_slices': num_slices,  # Changed from num_slices to total_slices to match frontend
-            'rows': dcm.Rows if hasattr(dcm, 'Rows') else None,
-            'columns': dcm.Columns if hasattr(dcm, 'Columns') else None,
-            'modality': dcm.Modality if hasattr(dcm, 'Modality') else None,
-            'study_date': str(dcm.StudyDate) if hasattr(dcm, 'StudyDate') else None,
-            'patient_name': str(dcm.PatientName) if hasattr(dcm, 'PatientName') else None
+            'total_slices': dicom.number_of_frames or 1,  # Changed from num_slices to total_slices to match frontend
+            'rows': dicom.rows,
+            'columns': dicom.columns,
+            'modality': dicom.modality,
+            'study_date': dicom.study_date,
+            'patient_name': dicom.patient_name
         })
     except Exception as e:
         print(f"Error reading DICOM file {path}: {str(e)}")  # Debug log
@@ -516,82 +459,44 @@ def dataset_info(ds_id):
     if not dicom_files:
         return jsonify({'error': 'No DICOM files in dataset'}), 400
 
-    # Check the first DICOM file to determine if it's multi-slice
-    base = current_app.config['UPLOAD_FOLDER']
-    if ds.id:
-        base = os.path.join(base, str(ds.id))
-    
     try:
         first_dicom = dicom_files[0]
-        path = os.path.join(base, first_dicom.path)
-        
-        # Log the path and check if file exists
-        print(f"Attempting to read DICOM file at: {path}")
-        if not os.path.exists(path):
-            return jsonify({'error': f'DICOM file not found at path: {path}'}), 404
-            
+        path = SliceService.path(first_dicom)
+
         try:
-            # Try reading with force=True to handle missing DICOM header
-            dcm = pydicom.dcmread(path, force=True)
-            print(f"Successfully read DICOM file: {path}")
+            # Header fields stored at upload; no pixel data is decoded
+            dicom = DicomService.metadata(first_dicom, path)
+        except FileNotFoundError:
+            return jsonify({'error': f'DICOM file not found at path: {path}'}), 404
         except Exception as e:
             print(f"Error reading DICOM file {path}: {str(e)}")
             return jsonify({'error': f'Error reading DICOM file: {str(e)}'}), 500
         
         # For CT series, each file is a slice, so the total number of files is the number of slices
         is_multi_slice = len(dicom_files) > 1
-        print(f"Number of DICOM files: {len(dicom_files)}")
         
         # Get additional DICOM metadata
         metadata = {
             'is_multi_slice': is_multi_slice,
             'total_files': len(files),
             'dicom_files': len(dicom_files),
-            'first_file_slices': 1,  # Each file is one slice
+            'first_file_slices': dicom.number_of_frames or 1,
             'total_slices': len(dicom_files),  # Total number of slices in the series
             'file_path': first_dicom.path,
-            'modality': str(dcm.get('Modality', 'Unknown')),
-            'rows': dcm.get('Rows', 'Unknown'),
-            'columns': dcm.get('Columns', 'Unknown'),
-            'bits_allocated': dcm.get('BitsAllocated', 'Unknown'),
-            'samples_per_pixel': dcm.get('SamplesPerPixel', 'Unknown'),
+            'modality': dicom.modality or 'Unknown',
+            'rows': dicom.rows if dicom.rows is not None else 'Unknown',
+            'columns': dicom.columns if dicom.columns is not None else 'Unknown',
+            'bits_allocated': dicom.bits_allocated if dicom.bits_allocated is not None else 'Unknown',
+            'samples_per_pixel': dicom.samples_per_pixel if dicom.samples_per_pixel is not None else 'Unknown',
             'warning': 'DICOM header was missing, file was read in forced mode'
         }
         
-        print(f"DICOM metadata: {metadata}")
         return jsonify(metadata)
         
     except Exception as e:
         print(f"Error processing DICOM file: {str(e)}")
         return jsonify({'error': f'Error processing DICOM file: {str(e)}'}), 500
 
-def extract_contours_from_dicom(dicom_path, method='adaptive', user_threshold=50):
-    try:
-        dcm = pydicom.dcmread(dicom_path, force=True)
-        if not hasattr(dcm, 'pixel_array'):
-            return []
-        img = dcm.pixel_array
-        img = cv2.normalize(img, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)
-
-        if method == 'adaptive':
-            mask = cv2.adaptiveThreshold(
-                img, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
-                cv2.THRESH_BINARY, 51, 2
-            )
-        elif method == 'canny':
-            mask = cv2.Canny(img, 50, 150)
-        elif method == 'manual':
-            _, mask = cv2.threshold(img, user_threshold, 255, cv2.THRESH_BINARY)
-        else:  # fallback to Otsu
-            _, mask = cv2.threshold(img, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-
-        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        contour_points = [c.squeeze().tolist() for c in contours if c.shape[0] >= 3]
-        return contour_points
-    except Exception as e:
-        print(f"Error extracting contours: {e}")
-        return []
-
 @bp.route('/contours/<int:file_id>')
 def get_contours(file_id):
     method = request.args.get('method', 'adaptive')
@@ -600,28 +505,57 @@ def get_contours(file_id):
     except Exception:
         user_threshold = 50
     file = Resource.query.get_or_404(file_id)
-    base = current_app.config['UPLOAD_FOLDER']
-    if file.dataset_id:
-        base = os.path.join(base, str(file.dataset_id))
-    path = os.path.join(base, file.path)
-    contours = extract_contours_from_dicom(path, method=method, user_threshold=user_threshold)
+    try:
+        # Memoized per file, method and threshold: scrolling back is a cache hit
+        slice_mask = SliceMaskService.slice(file, method, user_threshold)
+        contours = slice_mask.serialize_contours() if slice_mask is not None else []
+    except Exception as e:
+        print(f"Error extracting contours: {e}")
+        contours = []
     return jsonify({'contours': contours})
 
-def extract_mask_from_dicom(dicom_path, method='adaptive', user_threshold=50):
-    dcm = pydicom.dcmread(dicom_path, force=True)
-    if not hasattr(dcm, 'pixel_array'):
-        return None
-    img = dcm.pixel_array
-    img = cv2.normalize(img, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)
-    if method == 'adaptive':
-        mask = cv2.adaptiveThreshold(img, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 51, 2)
-    elif method == 'canny':
-        mask = cv2.Canny(img, 50, 150)
-    elif method == 'manual':
-        _, mask = cv2.threshold(img, user_threshold, 255, cv2.THRESH_BINARY)
+def _series_volume(ds_id, files=None):
+    """The dataset's assembled slice volume (shared cache), or None."""
+    if files is None:
+        files = FileService.getUserFiles(type='AImage', dataset_id=ds_id)
+    return SeriesVolumeService.load(ds_id, files)
+
+def _mesh_format():
+    """
+    Payload requested by the 3D viewer: ?format=json (vertex and face
+    lists, the default) or ?format=glb (binary glTF), and whether GLB
+    positions are quantized (?quantize=true). Raises ValueError.
+    """
+    fmt = request.args.get('format', 'json').lower()
+    if fmt not in ('json', 'glb'):
+        raise ValueError("format must be one of: json, glb")
+    return fmt, request.args.get('quantize', 'false').lower() == 'true'
+
+def _mesh_etag(ds_id, files, kind, params):
+    """
+    ETag of a mesh response: the series' on-disk stamp plus every parameter
+    the mesh depends on, so an unchanged dataset revalidates without decoding.
+    """
+    stamp = SeriesVolumeService.stamp(ds_id, files)
+    payload = json.dumps([MESH_VERSION, ds_id, stamp, kind, params], sort_keys=True)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+def _not_modified(etag):
+    response = current_app.response_class(status=304)
+    response.set_etag(etag)
+    return response
+
+def _mesh_response(verts, faces, fmt, quantize, etag, extras=None):
+    """JSON lists or a GLB body, private and revalidated by ETag on every use."""
+    if fmt == 'glb':
+        response = send_file(BytesIO(MeshService.glb(verts, faces, quantize, extras)),
+                             mimetype=MESH_FORMATS['glb'])
     else:
-        _, mask = cv2.threshold(img, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-    return (mask > 0).astype(np.uint8)
+        response = jsonify(dict({'vertices': verts.tolist(), 'faces': faces.tolist()}, **(extras or {})))
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
 
 @bp.route('/mesh/<int:ds_id>')
 def get_mesh(ds_id):
@@ -630,93 +564,87 @@ def get_mesh(ds_id):
         user_threshold = int(request.args.get('threshold', 50))
     except Exception:
         user_threshold = 50
+    try:
+        lod = request.args.get('lod', 'medium')
+        max_grid, target_faces = MeshService.lod(lod)
+        fmt, quantize = _mesh_format()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
     files = FileService.getUserFiles(type='AImage', dataset_id=ds_id)
-    masks = []
-    for f in files:
-        base = current_app.config['UPLOAD_FOLDER']
-        if f.dataset_id:
-            base = os.path.join(base, str(f.dataset_id))
-        path = os.path.join(base, f.path)
-        mask = extract_mask_from_dicom(path, method, user_threshold)
-        if mask is not None:
-            masks.append(mask)
-    if not masks:
-        return jsonify({'error': 'No valid masks found'}), 400
+    etag = _mesh_etag(ds_id, files, 'mesh', [method, user_threshold, lod, fmt, quantize])
+    if request.if_none_match.contains(etag):
+        return _not_modified(etag)
 
-    volume = np.stack(masks, axis=0)
-    # Downsample to 64x64 for speed
-    volume_small = resize(volume, (volume.shape[0], 64, 64), order=0, preserve_range=True, anti_aliasing=False).astype(volume.dtype)
-    verts, faces, normals, values = measure.marching_cubes(volume_small, level=0.5)
-    return jsonify({
-        'vertices': verts.tolist(),
-        'faces': faces.tolist()
-    })
+    series = _series_volume(ds_id, files)
+    if series is None:
+        return jsonify({'error': 'No valid masks found'}), 400
 
-def resample_contour(contour, num_points=100):
-    contour = np.array(contour)
-    dists = np.sqrt(np.sum(np.diff(contour, axis=0)**2, axis=1))
-    dists = np.insert(dists, 0, 0)
-    arc_length = np.cumsum(dists)
-    arc_length /= arc_length[-1]
-    fx = interp1d(arc_length, contour[:,0], kind='linear')
-    fy = interp1d(arc_length, contour[:,1], kind='linear')
-    uniform_dist = np.linspace(0, 1, num_points)
-    resampled = np.stack([fx(uniform_dist), fy(uniform_dist)], axis=-1)
-    return resampled
-
-def interpolate_contours(contour1, contour2, num_slices):
-    contour1 = resample_contour(contour1)
-    contour2 = resample_contour(contour2)
-    interpolated = []
-    for i in range(1, num_slices+1):
-        alpha = i / (num_slices + 1)
-        interp = (1 - alpha) * contour1 + alpha * contour2
-        interpolated.append(interp.tolist())
-    return interpolated
+    volume = np.stack([m.mask for m in SliceMaskService.series(series, files, method, user_threshold)], axis=0)
+    volume, spacing = MeshService.downsample(volume, series.spacing, max_grid)
+    verts, faces = MeshService.decimate(*MeshService.surface(volume, spacing), target_faces)
+    return _mesh_response(verts, faces, fmt, quantize, etag)
 
 @bp.route('/interpolate-contours', methods=['POST'])
 def interpolate_contours_api():
-    data = request.get_json()
-    contour1 = data['contour1']  # list of [x, y]
-    contour2 = data['contour2']  # list of [x, y]
-    num_slices = int(data['num_slices'])
-    result = interpolate_contours(contour1, contour2, num_slices)
-    return jsonify({'interpolated': result})
-
-def create_volume_from_contours(contours_list, num_slices, image_shape):
     """
-    Create a 3D volume from a list of contours by interpolating between them.
-    
-    Args:
-        contours_list: List of contour points for each slice
-        num_slices: Number of slices in the volume
-        image_shape: Shape of the 2D image (height, width)
-        
-    Returns:
-        3D numpy array representing the volume
+    Interpolate num_slices slices between two key slices. Takes either
+    contour1/contour2 (one contour each, returns 'interpolated' as one
+    contour per slice) or contours1/contours2 (every contour on each
+    slice, returns 'interpolated' as a list of contours per slice).
     """
-    volume = np.zeros((num_slices, image_shape[0], image_shape[1]), dtype=np.uint8)
-    
-    # For each pair of consecutive slices
-    for i in range(len(contours_list) - 1):
-        contour1 = contours_list[i]
-        contour2 = contours_list[i + 1]
-        
-        if not contour1 or not contour2:
-            continue
-            
-        # Get the interpolated contours between these two slices
-        interpolated = interpolate_contours(contour1[0], contour2[0], num_slices - 1)
-        
-        # For each interpolated contour, create a binary mask
-        for j, contour in enumerate(interpolated):
-            mask = np.zeros(image_shape, dtype=np.uint8)
-            contour_points = np.array(contour, dtype=np.int32)
-            cv2.fillPoly(mask, [contour_points], 1)
-            volume[i * num_slices + j] = mask
-            
-    return volume
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Expected a JSON object'}), 400
+    try:
+        # Through str so 2.5 and true are rejected rather than truncated
+        num_slices = int(str(data.get('num_slices')))
+    except ValueError:
+        num_slices = 0
+    if num_slices < 1:
+        return jsonify({'error': 'num_slices must be a positive integer'}), 400
+    if 'contours1' in data or 'contours2' in data:
+        keys, multi = ('contours1', 'contours2'), True
+    else:
+        keys, multi = ('contour1', 'contour2'), False
+    missing = [key for key in keys if data.get(key) is None]
+    if missing:
+        return jsonify({'error': f"Missing {', '.join(missing)}"}), 400
+
+    try:
+        if multi:
+            frames = ContourInterpolationService.between(data['contours1'], data['contours2'], num_slices)
+            return jsonify({'interpolated': frames.tolist()})
+        # A single explicit pair is always interpolated, however far apart
+        frames = ContourInterpolationService.between([data['contour1']], [data['contour2']], num_slices, match=False)
+    except (ValueError, TypeError) as e:
+        return jsonify({'error': f'Invalid contours: {str(e)}'}), 400
+    return jsonify({'interpolated': [f[0].tolist() if len(f) else [] for f in frames]})
+
+def _contour_volume(series, files, method, user_threshold, num_interp, max_grid=None, max_voxels=None):
+    """
+    Contours of every slice of series (from the shared slice-mask cache;
+    files are the dataset's resources) rasterized, with
+    num_interp interpolated slices between neighbours, into a uint8 volume.
+    The in-plane grid is at most max_grid voxels on its longest side and
+    small enough to keep the volume under max_voxels. Returns
+    (volume, (z, y, x) spacing in mm), or (None, None) without contours.
+    """
+    slices = [m.contours for m in SliceMaskService.series(series, files, method, user_threshold)]
+    if not any(slices):
+        return None, None
+    image_shape = series.shape[1:]
+    depth = (len(slices) - 1) * (num_interp + 1) + 1
+    scale = 1.0
+    if max_grid is not None:
+        scale = min(scale, max_grid / float(max(image_shape)))
+    if max_voxels is not None:
+        scale = min(scale, np.sqrt(max_voxels / float(depth * image_shape[0] * image_shape[1])))
+    out_shape = (max(int(image_shape[0] * scale), 1), max(int(image_shape[1] * scale), 1))
+    volume = ContourInterpolationService.build_volume(slices, num_interp, image_shape, out_shape)
+    z_mm, y_mm, x_mm = series.spacing
+    spacing = (z_mm / (num_interp + 1), y_mm * image_shape[0] / out_shape[0], x_mm * image_shape[1] / out_shape[1])
+    return volume, spacing
 
 def process_volume(volume, options):
     """
@@ -756,40 +684,28 @@ def get_volume(ds_id):
         smooth = request.args.get('smooth', 'false').lower() == 'true'
         smooth_factor = float(request.args.get('smooth_factor', 1.0))
         fill_holes = request.args.get('fill_holes', 'false').lower() == 'true'
+        lod = request.args.get('lod', 'medium')
+        max_grid, target_faces = MeshService.lod(lod)
+        fmt, quantize = _mesh_format()
     except Exception as e:
         return jsonify({'error': f'Invalid parameters: {str(e)}'}), 400
 
     files = FileService.getUserFiles(type='AImage', dataset_id=ds_id)
-    if not files:
-        return jsonify({'error': 'No files found in dataset'}), 400
+    etag = _mesh_etag(ds_id, files, 'volume', [method, user_threshold, num_interp, smooth, smooth_factor,
+                                               fill_holes, lod, fmt, quantize])
+    if request.if_none_match.contains(etag):
+        return _not_modified(etag)
 
-    # Get contours for all slices
-    contours_list = []
-    image_shape = None
-    
-    for f in files:
-        base = current_app.config['UPLOAD_FOLDER']
-        if f.dataset_id:
-            base = os.path.join(base, str(f.dataset_id))
-        path = os.path.join(base, f.path)
-        
-        # Get contours for this slice
-        contours = extract_contours_from_dicom(path, method, user_threshold)
-        if contours:
-            contours_list.append(contours)
-            
-            # Get image shape from first valid contour
-            if image_shape is None:
-                dcm = pydicom.dcmread(path, force=True)
-                if hasattr(dcm, 'pixel_array'):
-                    image_shape = dcm.pixel_array.shape
+    series = _series_volume(ds_id, files)
+    if series is None:
+        return jsonify({'error': 'No files found in dataset'}), 400
 
-    if not contours_list or image_shape is None:
+    # Contours of every slice, rasterized straight onto the level-of-detail grid
+    volume, spacing = _contour_volume(series, files, method, user_threshold, num_interp, max_grid=max_grid,
+                                      max_voxels=current_app.config['VOLUME_MAX_VOXELS'])
+    if volume is None:
         return jsonify({'error': 'No valid contours found'}), 400
 
-    # Create volume from contours
-    volume = create_volume_from_contours(contours_list, num_interp, image_shape)
-    
     # Apply processing
     processed_volume = process_volume(volume, {
         'smooth': smooth,
@@ -798,22 +714,14 @@ def get_volume(ds_id):
         'threshold': user_threshold / 255.0
     })
     
-    # Downsample volume for performance
-    volume_small = resize(processed_volume, (processed_volume.shape[0], 64, 64), 
-                         order=0, preserve_range=True, anti_aliasing=False).astype(processed_volume.dtype)
-    
-    # Generate mesh using marching cubes
-    verts, faces, normals, values = measure.marching_cubes(volume_small, level=0.5)
-    
-    return jsonify({
-        'vertices': verts.tolist(),
-        'faces': faces.tolist(),
-        'volume_shape': processed_volume.shape
-    })
+    # Spacing-aware surface of the occupied region, decimated to the LOD budget
+    verts, faces = MeshService.decimate(*MeshService.surface(processed_volume, spacing), target_faces)
+    return _mesh_response(verts, faces, fmt, quantize, etag,
+                          extras={'volume_shape': list(processed_volume.shape)})
 
 @bp.route('/export-volume/<int:ds_id>')
 def export_volume(ds_id):
-    """Export the 3D volume as an STL file."""
+    """Export the 3D volume as a binary STL, binary PLY, OBJ or GLB file."""
     # Get the same parameters as get_volume
     method = request.args.get('method', 'adaptive')
     try:
@@ -822,6 +730,14 @@ def export_volume(ds_id):
         smooth = request.args.get('smooth', 'false').lower() == 'true'
         smooth_factor = float(request.args.get('smooth_factor', 1.0))
         fill_holes = request.args.get('fill_holes', 'false').lower() == 'true'
+        max_grid, target_faces = MeshService.lod(request.args.get('lod', 'full'))
+        fmt = request.args.get('format', 'stl').lower()
+        if fmt not in MESH_FORMATS:
+            raise ValueError(f"format must be one of: {', '.join(MESH_FORMATS)}")
+        if request.args.get('faces'):
+            target_faces = int(request.args['faces'])
+            if target_faces < 1:
+                raise ValueError("faces must be at least 1")
     except Exception as e:
         return jsonify({'error': f'Invalid parameters: {str(e)}'}), 400
 
@@ -831,31 +747,17 @@ def export_volume(ds_id):
     if not ds:
         return jsonify({'error': 'Dataset not found'}), 404
 
-    # Generate the volume (reuse the code from get_volume)
+    # Generate the volume from the same cached series get_volume uses
     files = FileService.getUserFiles(type='AImage', dataset_id=ds_id)
-    if not files:
+    series = _series_volume(ds_id, files)
+    if series is None:
         return jsonify({'error': 'No files found in dataset'}), 400
 
-    contours_list = []
-    image_shape = None
-    
-    for f in files:
-        base = current_app.config['UPLOAD_FOLDER']
-        if f.dataset_id:
-            base = os.path.join(base, str(f.dataset_id))
-        path = os.path.join(base, f.path)
-        contours = extract_contours_from_dicom(path, method, user_threshold)
-        if contours:
-            contours_list.append(contours)
-            if image_shape is None:
-                dcm = pydicom.dcmread(path, force=True)
-                if hasattr(dcm, 'pixel_array'):
-                    image_shape = dcm.pixel_array.shape
-
-    if not contours_list or image_shape is None:
+    volume, spacing = _contour_volume(series, files, method, user_threshold, num_interp, max_grid=max_grid,
+                                      max_voxels=current_app.config['VOLUME_MAX_VOXELS'])
+    if volume is None:
         return jsonify({'error': 'No valid contours found'}), 400
 
-    volume = create_volume_from_contours(contours_list, num_interp, image_shape)
     processed_volume = process_volume(volume, {
         'smooth': smooth,
         'smooth_factor': smooth_factor,
@@ -863,25 +765,14 @@ def export_volume(ds_id):
         'threshold': user_threshold / 255.0
     })
 
-    # Generate the mesh
-    verts, faces, normals, values = measure.marching_cubes(processed_volume, level=0.5)
-    
-    # Create STL file
-    from stl import mesh
-    volume_mesh = mesh.Mesh(np.zeros(faces.shape[0], dtype=mesh.Mesh.dtype))
-    for i, f in enumerate(faces):
-        for j in range(3):
-            volume_mesh.vectors[i][j] = verts[f[j]]
-    
-    # Save to BytesIO
-    stl_data = BytesIO()
-    volume_mesh.save(stl_data)
-    stl_data.seek(0)
-    
+    # Generate the mesh in mm and encode it in one pass over the face array
+    verts, faces = MeshService.decimate(*MeshService.surface(processed_volume, spacing), target_faces)
+    data = MeshService.write(verts, faces, fmt)
+
     # Send the file
     return send_file(
-        stl_data,
-        mimetype='application/octet-stream',
+        BytesIO(data),
+        mimetype=MESH_FORMATS[fmt],
         as_attachment=True,
-        download_name=f'{ds.name}_volume.stl'
-    )
\ No newline at end of file
+        download_name=f'{ds.name}_volume.{fmt}'
+    )
@@ -1,16 +1,35 @@
 import os
+import zipfile
 from flask import (
-    Blueprint, current_app, render_template, send_from_directory,
-    request, redirect, session, url_for, flash, abort
+    Blueprint, current_app, render_template, send_from_directory, send_file,
+    request, redirect, session, url_for, flash, abort, jsonify
 )
 from werkzeug.utils import secure_filename
 
 from app.controllers.processing import FILTER_NAMES
 from app.services.FileService import FileService
 from app.services.DatasetService import DatasetService
+from app.services.IngestService import IngestService
+from app.services.ThumbnailService import ThumbnailService
+from app.services.UploadSessionService import UploadSessionService
 
 bp = Blueprint('uploads', __name__)
 
+
+def wants_json():
+    return request.accept_mimetypes.best == 'application/json'
+
+
+def flash_ingest_results(results):
+    """Summarize a bulk upload as flash messages."""
+    success_count = sum(1 for r in results if r.ok)
+    error_messages = [f"{r.filename}: {r.error}" for r in results if not r.ok]
+    if success_count > 0:
+        flash(f"Successfully uploaded {success_count} files.", 'success')
+    if error_messages:
+        flash('\n'.join(error_messages), 'error')
+
+
 @bp.route('/')
 def root():
     return redirect(url_for('uploads.datasets_index'))
@@ -29,32 +48,16 @@ def datasets_index():
         if 'files' in request.files:
             files = request.files.getlist('files')
             if files and not all(file.filename == '' for file in files):
-                success_count = 0
-                error_messages = []
-                
-                for f in files:
-                    if f and f.filename:
-                        try:
-                            FileService.upload(f, type='AImage', dataset_id=ds.id)
-                            success_count += 1
-                        except ValueError as e:
-                            error_messages.append(f"{f.filename}: {str(e)}")
-                        except Exception as e:
-                            error_messages.append(f"{f.filename}: An error occurred during upload")
-                
-                if success_count > 0:
-                    flash(f"Successfully uploaded {success_count} files.", 'success')
-                if error_messages:
-                    flash('\n'.join(error_messages), 'error')
+                flash_ingest_results(IngestService.ingest(files, ds.id))
         
         return redirect(url_for('uploads.datasets_index'))
     
     datasets = DatasetService.list_for_user(user_id)
+    # File counts and thumbnails for every dataset in a fixed number of queries
+    DatasetService.summarize(datasets, user_id)
     from collections import defaultdict
     grouped = defaultdict(list)
     for ds in datasets:
-        # Load files for each dataset
-        ds.files = FileService.getUserFiles(type='AImage', dataset_id=ds.id)
         key = (ds.patient_id, ds.patient_name)
         grouped[key].append(ds)
     grouped_datasets = [
@@ -81,26 +84,96 @@ def upload_to_dataset(ds_id):
         flash('No files selected', 'error')
         return redirect(url_for('uploads.dataset_detail', ds_id=ds_id))
     
-    success_count = 0
-    error_messages = []
-    
-    for f in files:
-        if f and f.filename:
-            try:
-                FileService.upload(f, type='AImage', dataset_id=ds_id)
-                success_count += 1
-            except ValueError as e:
-                error_messages.append(f"{f.filename}: {str(e)}")
-            except Exception as e:
-                error_messages.append(f"{f.filename}: An error occurred during upload")
-    
-    if success_count > 0:
-        flash(f"Successfully uploaded {success_count} files.", 'success')
-    if error_messages:
-        flash('\n'.join(error_messages), 'error')
-    
+    results = IngestService.ingest(files, ds_id)
+    if wants_json():
+        return jsonify([r.serialize() for r in results])
+    flash_ingest_results(results)
+
     return redirect(url_for('uploads.dataset_detail', ds_id=ds_id))
 
+# Resumable chunked uploads for files over MAX_CONTENT_LENGTH: open a
+# session, PUT the bytes in chunks (any order, retry freely), then finalize.
+
+def _upload_session(upload_id):
+    """The caller's upload session state, or None."""
+    try:
+        state = UploadSessionService.read(upload_id)
+    except KeyError:
+        return None
+    if state is None or state['owner_id'] != session.get('user_id'):
+        return None
+    return state
+
+@bp.route('/datasets/<int:ds_id>/sessions', methods=['POST'])
+def open_upload_session(ds_id):
+    if not session.get('user_id'):
+        return jsonify({"error": "Not logged in"}), 401
+    user_id = session['user_id']
+    if not DatasetService.read_for_user(ds_id, user_id):
+        return jsonify({"error": "Dataset not found"}), 404
+
+    data = request.get_json(silent=True) or {}
+    filename = data.get('filename')
+    try:
+        size = int(data.get('size'))
+    except (TypeError, ValueError):
+        return jsonify({"error": "size is required"}), 400
+    if not filename:
+        return jsonify({"error": "filename is required"}), 400
+    if not (filename.lower().endswith('.zip') or FileService.allowed_file(filename)):
+        return jsonify({"error": "File type not allowed"}), 400
+
+    try:
+        state = UploadSessionService.open(ds_id, user_id, filename, size, data.get('mimetype'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(state), 201
+
+@bp.route('/sessions/<upload_id>', methods=['GET', 'PUT', 'DELETE'])
+def upload_session(upload_id):
+    if not session.get('user_id'):
+        return jsonify({"error": "Not logged in"}), 401
+    state = _upload_session(upload_id)
+    if state is None:
+        return jsonify({"error": "Upload session not found"}), 404
+
+    if request.method == 'GET':
+        return jsonify(UploadSessionService.describe(state))
+    if request.method == 'DELETE':
+        UploadSessionService.discard(upload_id)
+        return '', 204
+
+    # PUT ?offset=N with the raw chunk as the body
+    try:
+        offset = int(request.args.get('offset', ''))
+    except ValueError:
+        return jsonify({"error": "offset is required"}), 400
+    length = request.content_length
+    if length is None:
+        return jsonify({"error": "Content-Length is required"}), 411
+    try:
+        return jsonify(UploadSessionService.write_chunk(upload_id, offset, request.stream, length))
+    except KeyError:
+        return jsonify({"error": "Upload session not found"}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@bp.route('/sessions/<upload_id>/finalize', methods=['POST'])
+def finalize_upload_session(upload_id):
+    if not session.get('user_id'):
+        return jsonify({"error": "Not logged in"}), 401
+    if _upload_session(upload_id) is None:
+        return jsonify({"error": "Upload session not found"}), 404
+    try:
+        results = UploadSessionService.finalize(upload_id)
+    except KeyError:
+        return jsonify({"error": "Upload session not found"}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 409
+    except zipfile.BadZipFile:
+        return jsonify({"error": "Invalid ZIP archive"}), 400
+    return jsonify([r.serialize() for r in results])
+
 @bp.route('/datasets/<int:ds_id>/delete', methods=['POST'])
 def delete_dataset(ds_id):
     if not session.get('user_id'):
@@ -122,6 +195,23 @@ def delete_file(file_id):
     flash('File deleted.', 'info')
     return redirect(url_for('uploads.datasets_index'))
 
+@bp.route('/files/<int:file_id>/thumbnail')
+def file_thumbnail(file_id):
+    if not session.get('user_id'):
+        return redirect(url_for('auth.login'))
+    file = FileService.find(file_id)
+    if not file or file.dataset_id is None or file.dataset.owner_id != session['user_id']:
+        abort(403)
+    try:
+        path = ThumbnailService.ensure(file)
+    except ValueError:
+        abort(404)
+    # Thumbnails only change when the upload does; let the browser revalidate by ETag
+    response = send_file(path, mimetype=ThumbnailService.mimetype(), conditional=True, max_age=86400)
+    response.cache_control.private = True
+    response.cache_control.public = False
+    return response
+
 @bp.route('/<int:ds_id>/<filename>')
 def serve_dataset_file(ds_id, filename):
     if not session.get('user_id'):
@@ -141,8 +231,9 @@ def dataset_detail(ds_id):
     if not ds:
         abort(403)
 
-    # load all files in this dataset
-    files = FileService.getUserFiles(type='AImage', dataset_id=ds_id)
+    # Slice navigation only needs ids, names and paths; large series are
+    # read as plain column rows rather than full Resource objects
+    files = FileService.listing(ds_id, user_id)
 
     return render_template(
         'uploads/dataset_detail.html',
@@ -171,23 +262,7 @@ def edit_dataset(ds_id):
             if 'files' in request.files:
                 files = request.files.getlist('files')
                 if files and not all(file.filename == '' for file in files):
-                    success_count = 0
-                    error_messages = []
-                    
-                    for f in files:
-                        if f and f.filename:
-                            try:
-                                FileService.upload(f, type='AImage', dataset_id=ds_id)
-                                success_count += 1
-                            except ValueError as e:
-                                error_messages.append(f"{f.filename}: {str(e)}")
-                            except Exception as e:
-                                error_messages.append(f"{f.filename}: An error occurred during upload")
-                    
-                    if success_count > 0:
-                        flash(f"Successfully uploaded {success_count} files.", 'success')
-                    if error_messages:
-                        flash('\n'.join(error_messages), 'error')
+                    flash_ingest_results(IngestService.ingest(files, ds_id))
             
             flash('Dataset updated!', 'success')
             return redirect(url_for('uploads.datasets_index'))
@@ -4,20 +4,52 @@ import pydicom
 import numpy as np
 import pandas as pd
 
+# Lookup table for the gamma filter, built once instead of per call
+GAMMA_LUT = np.array([(i / 255.0) ** (1.2) * 255 for i in range(256)]).astype("uint8")
+
+
 class DicomFilters:
+    @staticmethod
+    def normalize(img):
+        """Stretch img to the full 0-255 range as uint8."""
+        return ((img - np.min(img)) / (np.max(img) - np.min(img)) * 255).astype(np.uint8)
+
+    @staticmethod
+    def to_gray(img):
+        if len(img.shape) == 3 and img.shape[2] == 3:
+            return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        return img
+
+    @staticmethod
+    def clahe(img):
+        gray = DicomFilters.to_gray(DicomFilters.normalize(img))
+        return cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8)).apply(gray)
+
+    @staticmethod
+    def gamma(img):
+        return cv2.LUT(DicomFilters.normalize(img), GAMMA_LUT)
+
+    @staticmethod
+    def gaussian(img):
+        return cv2.GaussianBlur(DicomFilters.normalize(img), (5, 5), 0)
+
+    @staticmethod
+    def median(img):
+        return cv2.medianBlur(DicomFilters.normalize(img), 5)
+
+    @staticmethod
+    def non_local_means(img):
+        return cv2.fastNlMeansDenoising(DicomFilters.normalize(img), None, 10, 7, 21)
+
     @staticmethod
     def apply_filters(img):
-        base_img = ((img - np.min(img)) / (np.max(img) - np.min(img)) * 255).astype(np.uint8)
-        if len(base_img.shape) == 3 and base_img.shape[2] == 3:
-            gray = cv2.cvtColor(base_img, cv2.COLOR_BGR2GRAY)
-        else:
-            gray = base_img
+        base_img = DicomFilters.normalize(img)
 
         return {
             "Original": base_img,
-            "CLAHE": cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8)).apply(gray),
-            "Gamma": cv2.LUT(base_img, np.array([(i / 255.0) ** (1.2) * 255 for i in range(256)]).astype("uint8")),
-            "Gaussian": cv2.GaussianBlur(base_img, (5, 5), 0),
-            "Median": cv2.medianBlur(base_img, 5),
-            "Non-Local Means": cv2.fastNlMeansDenoising(base_img, None, 10, 7, 21)
-        }
\ No newline at end of file
+            "CLAHE": DicomFilters.clahe(base_img),
+            "Gamma": DicomFilters.gamma(base_img),
+            "Gaussian": DicomFilters.gaussian(base_img),
+            "Median": DicomFilters.median(base_img),
+            "Non-Local Means": DicomFilters.non_local_means(base_img)
+        }
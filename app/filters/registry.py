@@ -0,0 +1,98 @@
+from collections import OrderedDict
+
+import cv2
+
+from .dicom_filters import DicomFilters
+from .threshold     import Thresholding
+from .gmm           import GMM
+from .segmentation  import apply_segmentation
+
+
+class FilterOp:
+    """
+    A single named image operation plus the metadata callers need to
+    schedule it without running it.
+
+    input:    'any' (BGR or grayscale), 'normalized' (stretched to uint8 first)
+    output:   'gray', 'bgr' or 'same' (matches the input channels)
+    cost:     'cheap', 'moderate' or 'expensive'
+    blocking: True if no further filter can follow except 'Original'
+    """
+
+    def __init__(self, name, fn, input='any', output='same', cost='cheap', blocking=False):
+        self.name = name
+        self.fn = fn
+        self.input = input
+        self.output = output
+        self.cost = cost
+        self.blocking = blocking
+
+    def __call__(self, img):
+        return self.fn(img)
+
+    def __repr__(self):
+        return f"<FilterOp {self.name} cost={self.cost}>"
+
+
+def _otsu(img):
+    return Thresholding(img).apply_otsu_threshold()
+
+
+def _binary(img):
+    return Thresholding(img).apply_binary_threshold(127)
+
+
+def _gmm(img):
+    gmm = GMM(img)
+    gmm.fit_gmm(n_components=2)
+    return gmm.apply_gmm_threshold()
+
+
+FILTERS = OrderedDict((op.name, op) for op in [
+    FilterOp('Original', lambda img: img),
+    FilterOp('CLAHE', DicomFilters.clahe, input='normalized', output='gray'),
+    FilterOp('Gamma', DicomFilters.gamma, input='normalized'),
+    FilterOp('Gaussian', DicomFilters.gaussian, input='normalized'),
+    FilterOp('Median', DicomFilters.median, input='normalized'),
+    FilterOp('Non-Local Means', DicomFilters.non_local_means, input='normalized', cost='expensive'),
+    FilterOp('Threshold (Otsu)', _otsu, output='gray', blocking=True),
+    FilterOp('Threshold (Binary)', _binary, output='gray', blocking=True),
+    FilterOp('GMM', _gmm, output='gray', cost='expensive'),
+    FilterOp('Segment', apply_segmentation, output='bgr', cost='expensive'),
+])
+
+FILTER_NAMES = list(FILTERS)
+
+
+def get_filter(name):
+    return FILTERS.get(name)
+
+
+def apply_filter(name, img):
+    """Run only the named filter on img. Unknown names return img unchanged."""
+    op = FILTERS.get(name)
+    if op is None:
+        print(f"Warning: Unknown filter name: {name}")
+        return img
+    return op(img)
+
+
+def apply_step(raw, img, name):
+    """
+    One step of a batch filter chain. 'Original' restarts from raw and GMM
+    output is widened back to BGR so later steps see a colour frame.
+    """
+    if name == 'Original':
+        return raw.copy()
+    img = apply_filter(name, img)
+    if name == 'GMM' and len(img.shape) == 2:
+        img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+    return img
+
+
+def run_chain(raw, names):
+    """Replay a batch filter chain on raw."""
+    img = raw.copy()
+    for name in names:
+        img = apply_step(raw, img, name)
+    return img
@@ -15,8 +15,8 @@ class Annotation(BaseModel):
     file_id = db.Column(db.Integer, db.ForeignKey('resources.id'), unique=True)
     file = db.relationship('Resource', backref=db.backref('annotation_file', uselist=False), lazy=True, foreign_keys=[file_id])
 
-    def serialize(self):
-        base = self.file.serialize() if self.file else {}
+    def serialize(self, file_annotations=None):
+        base = self.file.serialize(file_annotations) if self.file else {}
         base.update({
             "annotatee_id": self.resource_id,
             "annotation_id": self.id
@@ -6,7 +6,10 @@ class DicomResource(BaseModel):
     __tablename__ = 'dicom_resources'
     
     resource_id = db.Column(db.Integer, db.ForeignKey('resources.id'), nullable=False, primary_key=True)
-    resource = db.relationship('Resource', backref='dicom_resources', uselist=False)
+    resource = db.relationship('Resource', backref=db.backref('dicom_resources', uselist=False, cascade='all, delete-orphan'), uselist=False)
+
+    # Copied from the resource so a dataset's series can be queried without a join
+    dataset_id = db.Column(db.Integer, db.ForeignKey('datasets.id'), index=True)
 
     body_part_examined = db.Column(db.String(255))
     slice_thickness = db.Column(db.String(255))
@@ -17,6 +20,33 @@ class DicomResource(BaseModel):
     patient_sex = db.Column(db.String(255))
 
     series_description = db.Column(db.String(255))
+    study_date = db.Column(db.String(16))
+    patient_name = db.Column(db.String(255))
+
+    # Image header, read without decoding pixel data
+    rows = db.Column(db.Integer)
+    columns = db.Column(db.Integer)
+    number_of_frames = db.Column(db.Integer)
+    bits_allocated = db.Column(db.Integer)
+    samples_per_pixel = db.Column(db.Integer)
+
+    # Series geometry, enough to order and space slices without opening files
+    series_instance_uid = db.Column(db.String(64), index=True)
+    instance_number = db.Column(db.Integer)
+    image_position_x = db.Column(db.Float)
+    image_position_y = db.Column(db.Float)
+    image_position_z = db.Column(db.Float)
+    image_orientation = db.Column(db.String(255))
+    slice_position = db.Column(db.Float)  # ImagePositionPatient projected on the slice normal
+    pixel_spacing_row = db.Column(db.Float)
+    pixel_spacing_col = db.Column(db.Float)
+
+    # Pixel encoding
+    rescale_slope = db.Column(db.Float)
+    rescale_intercept = db.Column(db.Float)
+    window_center = db.Column(db.Float)
+    window_width = db.Column(db.Float)
+    transfer_syntax_uid = db.Column(db.String(64))
 
     def serialize(self):
         base = self.resource.serialize() if self.resource else {}
@@ -28,7 +58,25 @@ class DicomResource(BaseModel):
             "patient_id": self.patient_id,
             "patient_age": self.patient_age,
             "patient_sex": self.patient_sex,
-            "series_description": self.series_description
+            "series_description": self.series_description,
+            "study_date": self.study_date,
+            "patient_name": self.patient_name,
+            "rows": self.rows,
+            "columns": self.columns,
+            "number_of_frames": self.number_of_frames,
+            "bits_allocated": self.bits_allocated,
+            "samples_per_pixel": self.samples_per_pixel,
+            "series_instance_uid": self.series_instance_uid,
+            "instance_number": self.instance_number,
+            "image_position": self.image_position,
+            "image_orientation": self.image_orientation,
+            "slice_position": self.slice_position,
+            "pixel_spacing": [self.pixel_spacing_row, self.pixel_spacing_col],
+            "rescale_slope": self.rescale_slope,
+            "rescale_intercept": self.rescale_intercept,
+            "window_center": self.window_center,
+            "window_width": self.window_width,
+            "transfer_syntax_uid": self.transfer_syntax_uid
         }
 
         base.update(dicom_fields)
@@ -55,8 +103,10 @@ class DicomResource(BaseModel):
         return self.resource.owner_type
 
     @property
-    def dataset_id(self):
-        return self.resource.dataset_id
+    def image_position(self):
+        if self.image_position_x is None:
+            return None
+        return [self.image_position_x, self.image_position_y, self.image_position_z]
 
     @property
     def annotations(self):
@@ -31,7 +31,10 @@ class Resource(BaseModel):
     def __repr__(self):
         return f"<Resource id={self.id} name={self.name}>"
 
-    def serialize(self):
+    def serialize(self, annotations=None):
+        # Callers serializing many resources pass preloaded annotations to avoid a query each
+        if annotations is None:
+            annotations = self.annotations.all()
         return {
             "resource_id": self.id,
             "type": self.type,
@@ -40,6 +43,6 @@ class Resource(BaseModel):
             "path": self.path,
             "owner_id": self.owner_id,
             "dataset_id": self.dataset_id,
-            "annotations": [a.serialize() for a in self.annotations.all()],
+            "annotations": [a.serialize() for a in annotations],
             "created_at": self.created_at.isoformat() if self.created_at else None
         }
@@ -3,6 +3,7 @@ from app.models.TeamUser import TeamUser
 from .BaseModel import BaseModel
 from app.models.Dataset import Dataset
 from app.models.Resource import Resource
+from app.models.Annotation import Annotation
 
 class User(BaseModel):
     __tablename__ = "users"
@@ -38,11 +39,17 @@ class User(BaseModel):
         return f"<User id={self.id} username={self.username}>"
 
     def serialize(self):
+        resources = self.resources.all()
+        # One query for every annotation on the user's resources
+        annotations = {res.id: [] for res in resources}
+        if resources:
+            for a in Annotation.query.filter(Annotation.resource_id.in_(list(annotations))):
+                annotations[a.resource_id].append(a)
         return {
             "id": self.id,
             "username": self.username,
             "email": getattr(self, 'email', None),
             "specialty": self.specialty,
             "datasets": [ds.serialize() for ds in self.datasets.all()],
-            "resources": [res.serialize() for res in self.resources.all()],
+            "resources": [res.serialize(annotations[res.id]) for res in resources],
         }
@@ -1,11 +1,13 @@
 import random
 from flask import session
+from sqlalchemy.orm import joinedload
 
 from app.models.Annotation import Annotation
 from app.services.BaseService import Base
 
 from app.extensions import db
 from app.services.FileService import FileService
+from app.services.PaginationService import PaginationService
 
 
 class AnnotationService(Base):
@@ -47,4 +49,31 @@ class AnnotationService(Base):
 
         last_annotation = resource.annotations.order_by(Annotation.updated_at.desc()).first()
         return last_annotation
-        
\ No newline at end of file
+
+    @staticmethod
+    def by_resource(resource_ids):
+        """{resource_id: [Annotation, ...]} for many resources in one query."""
+        grouped = {resource_id: [] for resource_id in resource_ids}
+        if grouped:
+            query = (Annotation.query
+                     .options(joinedload(Annotation.file))
+                     .filter(Annotation.resource_id.in_(list(grouped)))
+                     .order_by(Annotation.id))
+            for annotation in query:
+                grouped[annotation.resource_id].append(annotation)
+        return grouped
+
+    @staticmethod
+    def serialize_many(annotations):
+        """Serialize annotations with their files' own annotations fetched in one query."""
+        nested = AnnotationService.by_resource({a.file_id for a in annotations if a.file_id})
+        return [a.serialize(nested.get(a.file_id, [])) for a in annotations]
+
+    @staticmethod
+    def page(resource_id, cursor=None, limit=None):
+        """One keyset page of a resource's annotations, oldest first."""
+        query = Annotation.query.options(joinedload(Annotation.file)).filter_by(resource_id=resource_id)
+        return PaginationService.keyset(
+            query, [Annotation.id], cursor, PaginationService.limit(limit),
+            lambda a: (a.id,)
+        )
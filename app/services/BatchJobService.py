@@ -0,0 +1,226 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import as_completed
+from concurrent.futures.process import BrokenProcessPool
+from uuid import uuid4
+
+from flask import current_app
+
+from app.extensions import db
+from app.models.Resource import Resource
+from app.services.BaseService import Base
+from app.services.FilterCacheService import FilterCache
+from app.services.WorkerPool import WorkerPool
+
+# Resource.type of the rendered outputs a batch job writes
+PROCESSED_TYPE = 'Processed'
+
+
+def _render_one(path, is_dicom, chain, cache_folder, cache_max_bytes, out_path):
+    """
+    Worker-process entry point: render one slide through the chain, via the
+    shared filter cache, and write the PNG to out_path.
+    """
+    cache = FilterCache(cache_folder, cache_max_bytes)
+    _, data = cache.render(path, is_dicom, chain)
+    with open(out_path, 'wb') as f:
+        f.write(data)
+    return len(data)
+
+
+class BatchJob:
+    def __init__(self, dataset_id, owner_id, chain, total):
+        self.id = uuid4().hex
+        self.dataset_id = dataset_id
+        self.owner_id = owner_id
+        self.chain = list(chain)
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.errors = []
+        self.status = 'queued'
+        self.resource_ids = []
+        self.created_at = time.time()
+        self.finished_at = None
+
+    def serialize(self):
+        return {
+            "job_id": self.id,
+            "dataset_id": self.dataset_id,
+            "owner_id": self.owner_id,
+            "chain": self.chain,
+            "status": self.status,
+            "total": self.total,
+            "done": self.done,
+            "failed": self.failed,
+            "progress": (self.done + self.failed) / self.total if self.total else 1.0,
+            "errors": self.errors[-20:],
+            "resource_ids": self.resource_ids,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+class BatchJobService(Base):
+    @staticmethod
+    def start(ds, chain, files):
+        """
+        Queue a job rendering every file of ds through chain. Work runs on
+        the 'batch' process pool; a monitor thread tracks progress and, once
+        all slides are rendered, stores them as derived resources.
+        """
+        config = current_app.config
+        base_folder = os.path.join(config['UPLOAD_FOLDER'], str(ds.id))
+        os.makedirs(base_folder, exist_ok=True)
+
+        tasks = []
+        for f in files:
+            out_name = f"{uuid4()}.png"
+            tasks.append({
+                "source": os.path.join(base_folder, f.path),
+                "is_dicom": f.mime == 'application/dicom' or f.path.lower().endswith('.dcm'),
+                "name": f.name,
+                "out_name": out_name,
+                "out_path": os.path.join(base_folder, out_name),
+            })
+
+        job = BatchJob(ds.id, ds.owner_id, chain, len(tasks))
+        with _jobs_lock:
+            # Finished jobs stay readable from their state file on disk
+            for stale in [j for j in _jobs.values() if j.finished_at and time.time() - j.finished_at > 3600]:
+                _jobs.pop(stale.id, None)
+            _jobs[job.id] = job
+        BatchJobService._persist(job)
+
+        thread = threading.Thread(
+            target=BatchJobService._run,
+            args=(current_app._get_current_object(), job, tasks),
+            daemon=True,
+        )
+        thread.start()
+        return job
+
+    @staticmethod
+    def read(job_id):
+        """Job state from this process, or from disk if another worker ran it."""
+        job = _jobs.get(job_id)
+        if job is not None:
+            return job.serialize()
+        path = BatchJobService._state_path(job_id)
+        if path is None or not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    @staticmethod
+    def _state_path(job_id):
+        if not job_id.isalnum():
+            return None
+        return os.path.join(current_app.config['BATCH_JOB_FOLDER'], f"{job_id}.json")
+
+    @staticmethod
+    def _persist(job):
+        path = BatchJobService._state_path(job.id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(job.serialize(), f)
+        os.replace(tmp, path)
+
+    @staticmethod
+    def _run(app, job, tasks):
+        with app.app_context():
+            config = app.config
+            job.status = 'running'
+            BatchJobService._persist(job)
+
+            rendered = []
+            try:
+                pool = WorkerPool.get('batch', config['BATCH_WORKERS'])
+                futures = {
+                    pool.submit(
+                        _render_one, t["source"], t["is_dicom"], job.chain,
+                        config['FILTER_CACHE_FOLDER'], config['FILTER_CACHE_MAX_BYTES'],
+                        t["out_path"],
+                    ): t
+                    for t in tasks
+                }
+                last_persist = 0
+                for future in as_completed(futures):
+                    task = futures[future]
+                    try:
+                        future.result()
+                        rendered.append(task)
+                        job.done += 1
+                    except BrokenProcessPool:
+                        raise
+                    except Exception as e:
+                        job.failed += 1
+                        job.errors.append(f"{task['name']}: {str(e)}")
+                    if time.time() - last_persist > 0.5:
+                        BatchJobService._persist(job)
+                        last_persist = time.time()
+
+                # Slides that failed may have left partial files behind
+                stored = {t["out_name"] for t in rendered}
+                BatchJobService._discard_outputs([t for t in tasks if t["out_name"] not in stored])
+                job.resource_ids = BatchJobService._store_outputs(job, rendered)
+                job.status = 'done'
+            except BrokenProcessPool as e:
+                WorkerPool.discard('batch')
+                BatchJobService._discard_outputs(tasks)
+                job.status = 'failed'
+                job.errors.append(f"Worker pool crashed: {str(e)}")
+            except Exception as e:
+                db.session.rollback()
+                BatchJobService._discard_outputs(tasks)
+                job.status = 'failed'
+                job.errors.append(str(e))
+            finally:
+                job.finished_at = time.time()
+                BatchJobService._persist(job)
+                db.session.remove()
+
+    @staticmethod
+    def _discard_outputs(tasks):
+        """Remove the rendered files of tasks that will not be stored as resources."""
+        for task in tasks:
+            try:
+                os.remove(task["out_path"])
+            except OSError:
+                pass
+
+    @staticmethod
+    def _store_outputs(job, rendered):
+        """Replace the dataset's previous derived resources in one transaction."""
+        base_folder = os.path.join(current_app.config['UPLOAD_FOLDER'], str(job.dataset_id))
+        stale = Resource.query.filter_by(dataset_id=job.dataset_id, type=PROCESSED_TYPE).all()
+        stale_paths = [os.path.join(base_folder, r.path) for r in stale]
+        for r in stale:
+            db.session.delete(r)
+
+        resources = []
+        for task in rendered:
+            stem = os.path.splitext(task["name"])[0]
+            resource = Resource(
+                name=f"processed_{stem}.png"[:50],
+                type=PROCESSED_TYPE,
+                mime='image/png',
+                path=task["out_name"],
+                owner_id=job.owner_id,
+                dataset_id=job.dataset_id,
+            )
+            db.session.add(resource)
+            resources.append(resource)
+        db.session.commit()
+
+        for path in stale_paths:
+            if os.path.exists(path):
+                os.remove(path)
+        return [r.id for r in resources]
@@ -8,20 +8,32 @@ import gdown
 from segment_anything import sam_model_registry
 import torch.nn.functional as F
 from app.services.BaseService import Base
+from app.services.EmbeddingCacheService import EmbeddingCacheService
+from app.services.ModelRegistry import ModelRegistry
 
 class BoundingBoxSegmentationService(Base):
     @staticmethod
     def segmentBox(image_buffer, box_coords):
         image_bgr = cv2.imdecode(np.frombuffer(image_buffer, np.uint8), cv2.IMREAD_COLOR)
 
-        segmenter = BoundingBoxSegmenter(os.path.join(current_app.config['MEDSAM_PATH'], "work_dir/MedSAM/medsam_vit_b.pth"))
+        segmenter = BoundingBoxSegmenter(
+            os.path.join(current_app.config['MEDSAM_PATH'], "work_dir/MedSAM/medsam_vit_b.pth"),
+            embedding_cache=EmbeddingCacheService.cache(),
+        )
         return segmenter.apply_medsam_segmentation(image_bgr, box_coords)
 
+def _load_medsam_vit_b(checkpoint_path, device):
+    model = sam_model_registry['vit_b'](checkpoint=checkpoint_path)
+    model.to(device)
+    model.eval()
+    print(f"[MedSAM] Model loaded from {checkpoint_path} on {device}")
+    return model
+
 class BoundingBoxSegmenter:
     """
     Uses MedSAM for bounding-box-based segmentation.
     """
-    def __init__(self, medsam_checkpoint_path, device="cuda" if torch.cuda.is_available() else "cpu"):
+    def __init__(self, medsam_checkpoint_path, device="cuda" if torch.cuda.is_available() else "cpu", embedding_cache=None):
         if not os.path.exists(medsam_checkpoint_path):
             url = "https://drive.google.com/uc?id=1UAmWL88roYR7wKlnApw5Bcuzf2iQgk6_"
             print(f"[MedSAM] Model not found, downloading.")
@@ -32,12 +44,13 @@ class BoundingBoxSegmenter:
         self.scribble_points_fg = []
         self.scribble_points_bg = []
         self.device = device
+        self.embedding_cache = embedding_cache
 
-        # Load MedSAM
-        self.model = sam_model_registry['vit_b'](checkpoint=medsam_checkpoint_path)
-        self.model.to(self.device)
-        self.model.eval()
-        print(f"[MedSAM] Model loaded from {medsam_checkpoint_path} on {self.device}")
+        # Shared, already-warm MedSAM instance (loaded once per process)
+        self.model = ModelRegistry.get(
+            f"medsam_vit_b:{self.device}",
+            lambda: _load_medsam_vit_b(medsam_checkpoint_path, self.device),
+        )
 
         # We will store the raw bounding box, but typically we pass it directly
         self.bounding_box = None
@@ -149,34 +162,6 @@ class BoundingBoxSegmenter:
             # Normalize gradient magnitude
             gradient_magnitude = cv2.normalize(gradient_magnitude, None, 0, 255, cv2.NORM_MINMAX)
             
-            # Enhanced preprocessing pipeline
-            enhanced = cv2.edgePreservingFilter(image_rgb, flags=cv2.NORMCONV_FILTER, 
-                                              sigma_s=30, sigma_r=0.3)
-
-            # Multi-scale CLAHE for better local contrast
-            lab = cv2.cvtColor(enhanced, cv2.COLOR_RGB2LAB)
-            l, a, b = cv2.split(lab)
-            
-            # Apply CLAHE at different scales
-            clahe_strong = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8,8))
-            clahe_weak = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(16,16))
-            
-            l_strong = clahe_strong.apply(l)
-            l_weak = clahe_weak.apply(l)
-            
-            # Blend the two CLAHE results
-            l_enhanced = cv2.addWeighted(l_strong, 0.6, l_weak, 0.4, 0)
-            
-            enhanced = cv2.merge([l_enhanced, a, b])
-            enhanced = cv2.cvtColor(enhanced, cv2.COLOR_LAB2RGB)
-
-            # Rest of the preprocessing remains the same
-            img_1024 = transform.resize(
-                enhanced, (1024, 1024),
-                order=3, preserve_range=True,
-                anti_aliasing=True
-            ).astype(np.uint8)
-
             scaled_box = np.array([[
                 x_min * 1024 / W,
                 y_min * 1024 / H,
@@ -184,13 +169,8 @@ class BoundingBoxSegmenter:
                 y_max * 1024 / H
             ]], dtype=float)
 
-            img_1024_tensor = torch.tensor(img_1024).float()
-            img_1024_tensor = img_1024_tensor / 255.0
-            img_1024_tensor = img_1024_tensor.permute(2, 0, 1).unsqueeze(0)
-            img_1024_tensor = img_1024_tensor.to(self.device)
-
             with torch.no_grad():
-                img_embed = self.model.image_encoder(img_1024_tensor)
+                img_embed = self._image_embedding(image_rgb)
                 # Lower threshold near edges
                 base_threshold = 0.7
                 edge_threshold = 0.5
@@ -336,6 +316,57 @@ class BoundingBoxSegmenter:
             print(f"Traceback: {traceback.format_exc()}")
             return image_bgr
 
+    @torch.no_grad()
+    def _image_embedding(self, image_rgb):
+        """
+        Enhance the image and run the ViT encoder, or reuse the embedding
+        cached for identical pixels and preprocessing.
+        """
+        key = None
+        if self.embedding_cache is not None:
+            key = self.embedding_cache.key(image_rgb, {'model': 'medsam_vit_b', 'preprocess': 'epf_clahe_1024'})
+            cached = self.embedding_cache.get(key, ('embedding',))
+            if cached is not None:
+                return torch.from_numpy(cached['embedding']).to(self.device)
+
+        # Enhanced preprocessing pipeline
+        enhanced = cv2.edgePreservingFilter(image_rgb, flags=cv2.NORMCONV_FILTER, 
+                                          sigma_s=30, sigma_r=0.3)
+
+        # Multi-scale CLAHE for better local contrast
+        lab = cv2.cvtColor(enhanced, cv2.COLOR_RGB2LAB)
+        l, a, b = cv2.split(lab)
+
+        # Apply CLAHE at different scales
+        clahe_strong = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8,8))
+        clahe_weak = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(16,16))
+
+        l_strong = clahe_strong.apply(l)
+        l_weak = clahe_weak.apply(l)
+
+        # Blend the two CLAHE results
+        l_enhanced = cv2.addWeighted(l_strong, 0.6, l_weak, 0.4, 0)
+
+        enhanced = cv2.merge([l_enhanced, a, b])
+        enhanced = cv2.cvtColor(enhanced, cv2.COLOR_LAB2RGB)
+
+        # Rest of the preprocessing remains the same
+        img_1024 = transform.resize(
+            enhanced, (1024, 1024),
+            order=3, preserve_range=True,
+            anti_aliasing=True
+        ).astype(np.uint8)
+
+        img_1024_tensor = torch.tensor(img_1024).float()
+        img_1024_tensor = img_1024_tensor / 255.0
+        img_1024_tensor = img_1024_tensor.permute(2, 0, 1).unsqueeze(0)
+        img_1024_tensor = img_1024_tensor.to(self.device)
+
+        img_embed = self.model.image_encoder(img_1024_tensor)
+        if key is not None:
+            self.embedding_cache.put(key, {'embedding': img_embed.cpu().numpy()})
+        return img_embed
+
     def _calculate_edge_score(self, gray_image, mask):
         """Calculate how well the mask aligns with strong edges in the image."""
         try:
@@ -0,0 +1,148 @@
+import cv2
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+from app.services.BaseService import Base
+
+# Points every contour is resampled to before interpolation
+NUM_POINTS = 100
+
+
+class ContourInterpolationService(Base):
+    """
+    Shape-based interpolation between the contours of two key slices.
+    Contours are resampled to a fixed number of points at even arc length,
+    paired across the two slices, aligned (winding and start point) and
+    blended linearly; every step works on whole (n, NUM_POINTS, 2) arrays.
+    """
+
+    @staticmethod
+    def resample(contours, num_points=NUM_POINTS):
+        """
+        Resample closed contours (each a list of [x, y]) to num_points
+        evenly spaced along their perimeter. Returns (n, num_points, 2).
+        Contours with fewer than 3 points or no perimeter are dropped.
+        All contours go through a single np.interp call: each one's
+        normalized arc length is offset by 2 * its index so the
+        concatenated abscissa stays increasing.
+        """
+        polys = [np.asarray(c, dtype=np.float64).reshape(-1, 2) for c in contours]
+        # A degenerate contour has a flat abscissa, which np.interp would
+        # blend towards the next contour's start point
+        polys = [p for p in polys
+                 if len(p) >= 3 and np.hypot(*np.diff(np.vstack([p, p[:1]]), axis=0).T).sum() > 0]
+        if not polys:
+            return np.zeros((0, num_points, 2))
+
+        closed = [np.vstack([p, p[:1]]) for p in polys]
+        lengths = np.array([len(p) for p in closed])
+        ends = np.cumsum(lengths)
+        starts = ends - lengths
+        group = np.repeat(np.arange(len(closed)), lengths)
+        pts = np.concatenate(closed)
+
+        step = np.empty(len(pts))
+        step[0] = 0
+        step[1:] = np.hypot(*np.diff(pts, axis=0).T)
+        step[starts] = 0  # no segment between one contour's end and the next's start
+        arc = np.cumsum(step)
+        arc -= arc[starts][group]
+        total = arc[ends - 1]
+        x = arc / np.where(total > 0, total, 1)[group] + 2 * group
+
+        t = np.linspace(0, 1, num_points, endpoint=False)
+        targets = (t[None, :] + 2 * np.arange(len(closed))[:, None]).ravel()
+        out = np.stack([np.interp(targets, x, pts[:, 0]), np.interp(targets, x, pts[:, 1])], axis=-1)
+        return out.reshape(len(closed), num_points, 2)
+
+    @staticmethod
+    def align(a, b):
+        """
+        Reorder each contour in b to run the same way round as, and start
+        closest to, its partner in a (both (n, P, 2)). The best cyclic
+        shift maximizes the circular cross-correlation, found with an FFT.
+        """
+        if len(a) == 0:
+            return b
+
+        def signed_area(c):
+            x, y = c[..., 0], c[..., 1]
+            return (x * np.roll(y, -1, axis=-1) - np.roll(x, -1, axis=-1) * y).sum(axis=-1)
+
+        flip = np.sign(signed_area(a)) != np.sign(signed_area(b))
+        b = np.where(flip[:, None, None], b[:, ::-1], b)
+
+        ac = a - a.mean(axis=1, keepdims=True)
+        bc = b - b.mean(axis=1, keepdims=True)
+        corr = np.fft.irfft(np.conj(np.fft.rfft(ac, axis=1)) * np.fft.rfft(bc, axis=1),
+                            n=a.shape[1], axis=1).sum(axis=-1)
+        shift = corr.argmax(axis=1)
+        index = (np.arange(a.shape[1])[None, :] + shift[:, None]) % a.shape[1]
+        return np.take_along_axis(b, index[..., None], axis=1)
+
+    @staticmethod
+    def match(a, b):
+        """
+        Pair the contours of two slices by centroid distance (optimal
+        assignment). Pairs further apart than their combined radii are
+        left unmatched. Returns (indices into a, indices into b).
+        """
+        if len(a) == 0 or len(b) == 0:
+            return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+        ca, cb = a.mean(axis=1), b.mean(axis=1)
+        ra = np.sqrt(((a - ca[:, None]) ** 2).sum(axis=-1).mean(axis=1))
+        rb = np.sqrt(((b - cb[:, None]) ** 2).sum(axis=-1).mean(axis=1))
+        cost = np.linalg.norm(ca[:, None] - cb[None, :], axis=-1)
+        ia, ib = linear_sum_assignment(cost)
+        keep = cost[ia, ib] <= ra[ia] + rb[ib]
+        return ia[keep], ib[keep]
+
+    @staticmethod
+    def between(contours1, contours2, num_slices, num_points=NUM_POINTS, match=True):
+        """
+        Contours of num_slices evenly spaced slices between two key slices,
+        as an array (num_slices, pairs, num_points, 2). Without match,
+        contours are paired in the order given, however far apart.
+        """
+        a = ContourInterpolationService.resample(contours1, num_points)
+        b = ContourInterpolationService.resample(contours2, num_points)
+        if match:
+            ia, ib = ContourInterpolationService.match(a, b)
+        else:
+            ia = ib = np.arange(min(len(a), len(b)))
+        a = a[ia]
+        b = ContourInterpolationService.align(a, b[ib])
+        alpha = (np.arange(1, num_slices + 1) / (num_slices + 1))[:, None, None, None]
+        return (1 - alpha) * a[None] + alpha * b[None]
+
+    @staticmethod
+    def build_volume(slices, num_interp, image_shape, out_shape=None, num_points=NUM_POINTS):
+        """
+        Rasterize key-slice contours plus num_interp interpolated slices
+        between each consecutive pair into one uint8 volume.
+
+        slices holds one list of contours per key slice (empty lists are
+        kept so gaps stay in place). Key slice k lands at depth
+        k * (num_interp + 1), so the result has
+        (len(slices) - 1) * (num_interp + 1) + 1 slices. Contours are in
+        image_shape pixel coordinates and are scaled onto an out_shape grid
+        (default image_shape) as they are drawn.
+        """
+        out_shape = tuple(out_shape or image_shape)
+        step = num_interp + 1
+        depth = (len(slices) - 1) * step + 1 if slices else 0
+        volume = np.zeros((depth,) + out_shape, dtype=np.uint8)
+        scale = np.array([out_shape[1] / image_shape[1], out_shape[0] / image_shape[0]])
+
+        def fill(z, polys):
+            # One polygon per call: a shared fillPoly would XOR overlapping shapes
+            for poly in polys:
+                cv2.fillPoly(volume[z], [np.rint(poly * scale).astype(np.int32)], 1)
+
+        for k, contours in enumerate(slices):
+            fill(k * step, [np.asarray(c, dtype=np.float64).reshape(-1, 2) for c in contours if len(c) >= 3])
+            if num_interp and k + 1 < len(slices) and contours and slices[k + 1]:
+                frames = ContourInterpolationService.between(contours, slices[k + 1], num_interp, num_points)
+                for j in range(num_interp):
+                    fill(k * step + 1 + j, frames[j])
+        return volume
@@ -1,6 +1,9 @@
+from app.models.Annotation import Annotation
 from app.models.Dataset import Dataset
+from app.models.Resource import Resource
 from app.extensions import db
 from datetime import datetime
+from sqlalchemy import func
 
 class DatasetService:
     @staticmethod
@@ -57,6 +60,67 @@ class DatasetService:
                    .all()
         )
 
+    @staticmethod
+    def summarize(datasets, owner_id, type='AImage'):
+        """
+        Attach list-view aggregates to each dataset: file_count,
+        annotation_count and thumbnail (its first file, or None). Runs a
+        fixed three queries however many datasets there are, instead of
+        loading every dataset's files.
+        """
+        ids = [ds.id for ds in datasets]
+        for ds in datasets:
+            ds.file_count = 0
+            ds.annotation_count = 0
+            ds.thumbnail = None
+        if not ids:
+            return datasets
+        by_id = {ds.id: ds for ds in datasets}
+
+        owned_files = (Resource.dataset_id.in_(ids), Resource.type == type, Resource.owner_id == owner_id)
+        file_rows = (
+            db.session.query(Resource.dataset_id, func.count(Resource.id), func.min(Resource.id))
+                      .filter(*owned_files)
+                      .group_by(Resource.dataset_id)
+                      .all()
+        )
+        first_ids = []
+        for dataset_id, count, first_id in file_rows:
+            by_id[dataset_id].file_count = count
+            first_ids.append(first_id)
+
+        if first_ids:
+            for resource in Resource.query.filter(Resource.id.in_(first_ids)):
+                by_id[resource.dataset_id].thumbnail = resource
+
+        annotation_rows = (
+            db.session.query(Resource.dataset_id, func.count(Annotation.id))
+                      .join(Annotation, Annotation.resource_id == Resource.id)
+                      .filter(*owned_files)
+                      .group_by(Resource.dataset_id)
+                      .all()
+        )
+        for dataset_id, count in annotation_rows:
+            by_id[dataset_id].annotation_count = count
+
+        return datasets
+
+    @staticmethod
+    def file_count(owner_id, tags=None, type='AImage'):
+        """
+        Number of files of the given type (uploads, not derived batch
+        outputs) across the user's datasets, optionally only datasets with
+        the given tag.
+        """
+        query = (
+            db.session.query(func.count(Resource.id))
+                      .join(Dataset, Dataset.id == Resource.dataset_id)
+                      .filter(Dataset.owner_id == owner_id, Resource.type == type)
+        )
+        if tags is not None:
+            query = query.filter(Dataset.tags == tags)
+        return query.scalar() or 0
+
     @staticmethod
     def read_for_user(dataset_id, owner_id):
         """
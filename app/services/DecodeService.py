@@ -0,0 +1,94 @@
+import time
+from collections import deque
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from flask import current_app
+
+from app.services.BaseService import Base
+from app.services.WorkerPool import WorkerPool
+
+# Below this many items the pool round-trip costs more than it saves
+INLINE_BELOW = 4
+
+
+class DecodeTimeout(TimeoutError):
+    """The request's decode time budget ran out before every item finished."""
+
+
+class DecodeService(Base):
+    """
+    Series-wide decoding on the shared 'decode' process pool. Work is fanned
+    out across DECODE_WORKERS processes and results come back in input
+    order, each as soon as it and everything before it has finished.
+    """
+
+    @staticmethod
+    def imap(fn, arg_tuples, time_budget=None, return_exceptions=False):
+        """
+        Yield fn(*args) for every args in arg_tuples, in order.
+
+        fn must be a module-level function importable without an app context.
+        time_budget is in seconds; None uses DECODE_TIME_BUDGET and 0 means
+        no limit. When it runs out, pending work is cancelled and
+        DecodeTimeout is raised. With return_exceptions, an item that raised
+        yields its exception instead of aborting the whole run.
+        """
+        config = current_app.config
+        if time_budget is None:
+            time_budget = config['DECODE_TIME_BUDGET']
+        deadline = time.monotonic() + time_budget if time_budget else None
+        workers = config['DECODE_WORKERS']
+        arg_tuples = list(arg_tuples)
+
+        if workers <= 1 or len(arg_tuples) < INLINE_BELOW:
+            yield from DecodeService._inline(fn, arg_tuples, deadline, return_exceptions)
+            return
+
+        pool = WorkerPool.get('decode', workers)
+        # Keep a bounded window in flight so a slow consumer does not pile
+        # up every decoded result in memory
+        window = workers * 4
+        pending = deque()
+        queued = iter(arg_tuples)
+        try:
+            for args in queued:
+                pending.append(pool.submit(fn, *args))
+                if len(pending) >= window:
+                    break
+            while pending:
+                future = pending.popleft()
+                timeout = None
+                if deadline is not None:
+                    timeout = max(deadline - time.monotonic(), 0)
+                try:
+                    result = future.result(timeout=timeout)
+                except FutureTimeout:
+                    raise DecodeTimeout(f"Decoding exceeded the {time_budget}s budget")
+                except BrokenProcessPool:
+                    WorkerPool.discard('decode')
+                    raise
+                except Exception as e:
+                    if not return_exceptions:
+                        raise
+                    result = e
+                for args in queued:
+                    pending.append(pool.submit(fn, *args))
+                    break
+                yield result
+        finally:
+            for future in pending:
+                future.cancel()
+
+    @staticmethod
+    def _inline(fn, arg_tuples, deadline, return_exceptions):
+        for args in arg_tuples:
+            if deadline is not None and time.monotonic() > deadline:
+                raise DecodeTimeout("Decoding exceeded the time budget")
+            try:
+                result = fn(*args)
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                result = e
+            yield result
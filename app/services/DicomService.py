@@ -1,27 +1,113 @@
-
 import os
 from flask import current_app
 from app.models.DicomResource import DicomResource
 from app.services.BaseService import Base
 from app.extensions import db
+import numpy as np
 import pydicom
+from pydicom.multival import MultiValue
+
+
+def _str(value):
+    return str(value) if value not in (None, '') else None
+
+
+def _float(value):
+    # Multi-valued elements (e.g. several WindowCenter presets) use the first
+    if isinstance(value, (list, tuple, MultiValue)):
+        value = value[0] if len(value) else None
+    try:
+        return float(value) if value not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _floats(value, count):
+    try:
+        values = [float(v) for v in value]
+    except (TypeError, ValueError):
+        return None
+    return values if len(values) == count else None
+
+
+def _int(value):
+    try:
+        return int(value) if value not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
+
 
 class DicomService(Base):
-    
+
     @staticmethod
-    def save(resource):
-        dicom = pydicom.dcmread(os.path.join(current_app.config['UPLOAD_FOLDER'], resource.path))
-        dicomResource = DicomResource(
-            resource_id = resource.id,
-            body_part_examined = dicom.get("BodyPartExamined"),
-            slice_thickness = dicom.get("SliceThickness"),
-            modality = dicom.get("Modality"),
-            patient_id = dicom.get("PatientID"),
-            patient_age = dicom.get("PatientAge"),
-            patient_sex = dicom.get("PatientSex"),
-            series_description = dicom.get("SeriesDescription"),
+    def read_header(source):
+        """
+        Parse a DICOM header (path or file-like) without reading the pixel
+        data, so metadata costs a few KB of I/O instead of a full decode.
+        """
+        return pydicom.dcmread(source, stop_before_pixels=True, force=True)
+
+    @staticmethod
+    def header_fields(dicom):
+        """DicomResource column values taken from a parsed header."""
+        position = _floats(dicom.get("ImagePositionPatient"), 3)
+        orientation = _floats(dicom.get("ImageOrientationPatient"), 6)
+        spacing = _floats(dicom.get("PixelSpacing"), 2) or [None, None]
+        slice_position = None
+        if position and orientation:
+            normal = np.cross(orientation[:3], orientation[3:])
+            slice_position = float(np.dot(position, normal))
+        file_meta = getattr(dicom, "file_meta", None)
+        transfer_syntax = file_meta.get("TransferSyntaxUID") if file_meta is not None else None
+
+        return {
+            "body_part_examined": _str(dicom.get("BodyPartExamined")),
+            "slice_thickness": _str(dicom.get("SliceThickness")),
+            "modality": _str(dicom.get("Modality")),
+            "patient_id": _str(dicom.get("PatientID")),
+            "patient_age": _str(dicom.get("PatientAge")),
+            "patient_sex": _str(dicom.get("PatientSex")),
+            "series_description": _str(dicom.get("SeriesDescription")),
+            "study_date": _str(dicom.get("StudyDate")),
+            "patient_name": _str(dicom.get("PatientName")),
+            "rows": _int(dicom.get("Rows")),
+            "columns": _int(dicom.get("Columns")),
+            "number_of_frames": _int(dicom.get("NumberOfFrames")) or 1,
+            "bits_allocated": _int(dicom.get("BitsAllocated")),
+            "samples_per_pixel": _int(dicom.get("SamplesPerPixel")),
+            "series_instance_uid": _str(dicom.get("SeriesInstanceUID")),
+            "instance_number": _int(dicom.get("InstanceNumber")),
+            "image_position_x": position[0] if position else None,
+            "image_position_y": position[1] if position else None,
+            "image_position_z": position[2] if position else None,
+            "image_orientation": "\\".join(f"{v:g}" for v in orientation) if orientation else None,
+            "slice_position": slice_position,
+            "pixel_spacing_row": spacing[0],
+            "pixel_spacing_col": spacing[1],
+            "rescale_slope": _float(dicom.get("RescaleSlope")),
+            "rescale_intercept": _float(dicom.get("RescaleIntercept")),
+            "window_center": _float(dicom.get("WindowCenter")),
+            "window_width": _float(dicom.get("WindowWidth")),
+            "transfer_syntax_uid": _str(transfer_syntax),
+        }
+
+    @staticmethod
+    def build(resource, dicom):
+        """DicomResource for a parsed header, not yet added or committed."""
+        return DicomResource(
+            resource = resource,
+            dataset_id = resource.dataset_id,
+            **DicomService.header_fields(dicom)
         )
 
+    @staticmethod
+    def save(resource):
+        base_folder = current_app.config['UPLOAD_FOLDER']
+        if resource.dataset_id:
+            base_folder = os.path.join(base_folder, str(resource.dataset_id))
+        dicom = DicomService.read_header(os.path.join(base_folder, resource.path))
+        dicomResource = DicomService.build(resource, dicom)
+
         db.session.add(dicomResource)
         db.session.commit()
 
@@ -29,4 +115,46 @@ class DicomService(Base):
 
     @staticmethod
     def read(resource_id):
-        return DicomResource.query.get(resource_id)
\ No newline at end of file
+        return DicomResource.query.get(resource_id)
+
+    @staticmethod
+    def metadata(resource, path):
+        """
+        Stored header metadata for resource. Rows saved before these columns
+        existed (or whose upload-time parse failed) are filled in once from
+        the file header and persisted, so later calls are a single lookup.
+        """
+        dicomResource = DicomResource.query.get(resource.id)
+        if dicomResource is not None and dicomResource.rows is not None:
+            return dicomResource
+
+        fields = DicomService.header_fields(DicomService.read_header(path))
+        if dicomResource is None:
+            dicomResource = DicomResource(resource_id=resource.id, dataset_id=resource.dataset_id, **fields)
+            db.session.add(dicomResource)
+        else:
+            dicomResource.dataset_id = resource.dataset_id
+            for name, value in fields.items():
+                setattr(dicomResource, name, value)
+        db.session.commit()
+
+        return dicomResource
+
+    @staticmethod
+    def series(dataset_id):
+        """
+        The dataset's DICOM slices grouped by series and sorted along the
+        patient axis (slice position, then instance number), in one query.
+        Returns {series_uid: [DicomResource, ...]}.
+        """
+        rows = (DicomResource.query
+                .filter_by(dataset_id=dataset_id)
+                .order_by(DicomResource.series_instance_uid,
+                          DicomResource.slice_position,
+                          DicomResource.instance_number,
+                          DicomResource.resource_id)
+                .all())
+        grouped = {}
+        for row in rows:
+            grouped.setdefault(row.series_instance_uid, []).append(row)
+        return grouped
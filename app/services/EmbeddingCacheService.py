@@ -0,0 +1,161 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from uuid import uuid4
+
+import numpy as np
+from flask import current_app
+
+from app.services.BaseService import Base
+
+
+class EmbeddingCache:
+    """
+    Bounded LRU cache of image-encoder outputs so repeated prompts on the
+    same image only run the prompt encoder and mask decoder.
+
+    An entry is a dict of named numpy arrays (the embedding plus whatever
+    sizes the predictor needs to reuse it). With a folder, entries evicted
+    from memory are spilled to disk as one .npy file per array, and the
+    disk tier is trimmed to max_disk_entries using an in-memory index
+    (scanned from the folder once, at startup) instead of rescanning it.
+    """
+
+    def __init__(self, max_entries, folder=None, max_disk_entries=512):
+        self.max_entries = max_entries
+        self.folder = folder
+        self.max_disk_entries = max_disk_entries
+        self._items = OrderedDict()
+        self._disk = OrderedDict()  # key -> array names on disk, least recently used first
+        self._lock = threading.Lock()
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+            self._index_disk()
+
+    @staticmethod
+    def key(image, settings):
+        """Content hash of the image pixels plus the preprocessing settings."""
+        image = np.ascontiguousarray(image)
+        sha = hashlib.sha1()
+        sha.update(str((image.shape, image.dtype.str)).encode('utf-8'))
+        sha.update(image.data)
+        sha.update(json.dumps(settings, sort_keys=True).encode('utf-8'))
+        return sha.hexdigest()
+
+    @staticmethod
+    def key_for(settings):
+        """Key from settings alone, for callers that already identify the pixels (e.g. by resource)."""
+        payload = json.dumps(settings, sort_keys=True, default=str)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key, names):
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is not None:
+                self._items.move_to_end(key)
+                return entry
+
+        entry = self._load(key, names)
+        if entry is not None:
+            self._remember(key, entry)
+        return entry
+
+    def put(self, key, arrays):
+        self._remember(key, arrays)
+
+    def _remember(self, key, arrays):
+        evicted = []
+        with self._lock:
+            self._items[key] = arrays
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                evicted.append(self._items.popitem(last=False))
+        # Disk writes happen outside the lock and only for evicted entries
+        if self.folder:
+            for old_key, old_arrays in evicted:
+                self._spill(old_key, old_arrays)
+
+    def _path(self, key, name):
+        return os.path.join(self.folder, key[:2], f"{key}.{name}.npy")
+
+    def _index_disk(self):
+        """Build the disk index from the folder, oldest entries first."""
+        entries = {}
+        for root, _, files in os.walk(self.folder):
+            for filename in files:
+                if not filename.endswith('.npy') or '.tmp' in filename:
+                    continue
+                key, name = filename[:-len('.npy')].split('.', 1)
+                try:
+                    mtime = os.path.getmtime(os.path.join(root, filename))
+                except OSError:
+                    continue
+                names, latest = entries.get(key, ([], 0))
+                names.append(name)
+                entries[key] = (names, max(latest, mtime))
+        for key, (names, _) in sorted(entries.items(), key=lambda kv: kv[1][1]):
+            self._disk[key] = names
+
+    def _load(self, key, names):
+        if not self.folder:
+            return None
+        entry = {}
+        for name in names:
+            path = self._path(key, name)
+            try:
+                entry[name] = np.load(path)
+                os.utime(path)
+            except (OSError, ValueError):
+                return None
+        with self._lock:
+            # Files another worker process spilled join this process's index here
+            self._disk[key] = list(names)
+            self._disk.move_to_end(key)
+        return entry
+
+    def _spill(self, key, arrays):
+        with self._lock:
+            if key in self._disk:
+                # Already on disk (it was loaded from there); just refresh its age
+                self._disk.move_to_end(key)
+                return
+        for name, arr in arrays.items():
+            path = self._path(key, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{uuid4().hex}.tmp.npy"
+            np.save(tmp, arr)
+            os.replace(tmp, path)
+
+        trimmed = []
+        with self._lock:
+            self._disk[key] = list(arrays)
+            while len(self._disk) > self.max_disk_entries:
+                trimmed.append(self._disk.popitem(last=False))
+        for old_key, names in trimmed:
+            for name in names:
+                try:
+                    os.remove(self._path(old_key, name))
+                except OSError:
+                    pass
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+class EmbeddingCacheService(Base):
+    @staticmethod
+    def cache():
+        global _cache
+        if _cache is None:
+            with _cache_lock:
+                if _cache is None:
+                    config = current_app.config
+                    _cache = EmbeddingCache(
+                        config['EMBEDDING_CACHE_SIZE'],
+                        folder=config.get('EMBEDDING_CACHE_FOLDER'),
+                        max_disk_entries=config['EMBEDDING_CACHE_DISK_ENTRIES'],
+                    )
+        return _cache
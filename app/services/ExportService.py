@@ -0,0 +1,101 @@
+import os
+import zipfile
+
+from flask import current_app
+
+from app.services.BaseService import Base
+from app.services.DecodeService import DecodeService
+from app.services.FilterCacheService import render_file
+from app.services.SliceService import SliceService
+
+# Bytes read from disk per write into the archive
+CHUNK_SIZE = 1024 * 1024
+
+
+class _ZipSink:
+    """
+    Write-only file object that collects what ZipFile writes so a generator
+    can hand it on. It has no tell()/seek(), so ZipFile switches to
+    streaming mode (sizes and CRCs go in data descriptors after each entry).
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class ExportService(Base):
+    @staticmethod
+    def stream_zip(entries):
+        """
+        Yield a ZIP archive piece by piece while it is being built.
+
+        entries is an iterable of (arcname, source) where source is either a
+        file path, copied in CHUNK_SIZE blocks, or bytes already in memory.
+        Entries are stored uncompressed: DICOM pixel data and PNG/JPEG
+        barely deflate, and stored mode keeps the CPU cost to a copy.
+        Memory stays bounded by one chunk (or one in-memory entry).
+        """
+        sink = _ZipSink()
+        with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED, allowZip64=True) as zf:
+            for arcname, source in entries:
+                if isinstance(source, (bytes, bytearray)):
+                    zf.writestr(arcname, source)
+                else:
+                    info = zipfile.ZipInfo.from_file(source, arcname)
+                    info.compress_type = zipfile.ZIP_STORED
+                    with open(source, 'rb') as src, zf.open(info, 'w') as dst:
+                        for block in iter(lambda: src.read(CHUNK_SIZE), b''):
+                            dst.write(block)
+                            yield sink.drain()
+                yield sink.drain()
+        yield sink.drain()
+
+    @staticmethod
+    def raw_entries(files, base_folder):
+        """(arcname, path) for every stored file that still exists on disk."""
+        for f in files:
+            filepath = os.path.join(base_folder, f.path)
+            if not os.path.exists(filepath):
+                print(f"Skipping missing file in export: {filepath}")
+                continue
+            yield f.path, filepath
+
+    @staticmethod
+    def processed_entries(files, base_folder, chain):
+        """
+        (arcname, png bytes) of every file rendered through the filter chain.
+        Renders run on the decode pool and come back in file order.
+        """
+        config = current_app.config
+        existing = []
+        for f in files:
+            filepath = os.path.join(base_folder, f.path)
+            if not os.path.exists(filepath):
+                print(f"Skipping missing file in export: {filepath}")
+                continue
+            existing.append((f, filepath))
+
+        args = [
+            (filepath, SliceService.is_dicom(f), list(chain),
+             config['FILTER_CACHE_FOLDER'], config['FILTER_CACHE_MAX_BYTES'])
+            for f, filepath in existing
+        ]
+        # No time budget: the archive streams for as long as the client reads
+        results = DecodeService.imap(render_file, args, time_budget=0, return_exceptions=True)
+        for (f, filepath), data in zip(existing, results):
+            if isinstance(data, Exception):
+                print(f"Skipping {filepath} in export: {str(data)}")
+                continue
+            yield f"{os.path.splitext(f.path)[0]}.png", data
@@ -1,14 +1,27 @@
 import os
+import shutil
 from uuid import uuid4
 
 from flask import current_app, session
 from werkzeug.utils import secure_filename
 
+from sqlalchemy import func
+
 from app.extensions import db
+from app.models.DicomResource import DicomResource
 from app.models.Resource import Resource
 from app.services.DicomService import DicomService
+from app.services.PaginationService import PaginationService
+from app.services.ThumbnailService import ThumbnailService
 from app.services.UserService import UserService
 
+# Buffer for copying upload streams to disk
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# Fields a resource listing can be projected to with ?fields=
+RESOURCE_FIELDS = ('resource_id', 'name', 'path', 'mime', 'type', 'owner_id',
+                   'dataset_id', 'created_at', 'instance_number', 'annotations')
+
 class FileService:
     @staticmethod
     def allowed_file(filename):
@@ -39,9 +52,12 @@ class FileService:
         return resource
 
     @staticmethod
-    def upload(file, type, dataset_id=None):
+    def prepare(file, type, dataset_id=None):
         """
-        Save an uploaded file; optionally associate it with a dataset.
+        Validate an uploaded file and build its (unsaved) rows: the Resource
+        and, for DICOMs, a DicomResource parsed from the in-memory stream.
+        Returns (resource, dicom_resource_or_None). Raises ValueError for
+        files that must be rejected.
         """
         if not file or not file.filename:
             raise ValueError("No file provided")
@@ -55,6 +71,16 @@ class FileService:
         # Generate unique filename with same extension
         unique_name = f"{uuid4()}{ext}"
 
+        # Parse the DICOM header from the in-memory upload before anything is written
+        dicom_header = None
+        if ext.lower() in ['.dcm', '.dicom'] or file.mimetype == "application/dicom":
+            try:
+                dicom_header = DicomService.read_header(file.stream)
+            except Exception as e:
+                raise ValueError(f"Invalid DICOM file: {str(e)}")
+            finally:
+                file.stream.seek(0)
+
         # Create resource record with owner and dataset info
         resource = Resource(
             name=file.filename,
@@ -64,28 +90,70 @@ class FileService:
             owner_id=session.get('user_id'),
             dataset_id=dataset_id
         )
-        db.session.add(resource)
-        db.session.commit()
+        dicom_resource = DicomService.build(resource, dicom_header) if dicom_header is not None else None
+        return resource, dicom_resource
 
-        # Determine save folder (root or dataset subfolder)
+    @staticmethod
+    def folder(dataset_id=None):
+        """Upload folder (root or dataset subfolder), created if missing."""
         base_folder = current_app.config['UPLOAD_FOLDER']
         if dataset_id:
             base_folder = os.path.join(base_folder, str(dataset_id))
         os.makedirs(base_folder, exist_ok=True)
+        return base_folder
 
-        # Save file to disk under the generated name
-        file_path = os.path.join(base_folder, unique_name)
-        file.save(file_path)
+    @staticmethod
+    def write(stream, file_path):
+        """Copy an upload stream to disk in one buffered pass."""
+        with open(file_path, 'wb') as out:
+            shutil.copyfileobj(stream, out, COPY_BUFFER_SIZE)
+
+    @staticmethod
+    def upload(file, type, dataset_id=None):
+        """
+        Save an uploaded file; optionally associate it with a dataset.
+        """
+        resource, dicom_resource = FileService.prepare(file, type, dataset_id)
+        db.session.add(resource)
+        if dicom_resource is not None:
+            db.session.add(dicom_resource)
+
+        # Save file to disk under the generated name, then commit the
+        # Resource and DicomResource rows together
+        file_path = os.path.join(FileService.folder(dataset_id), resource.path)
+        try:
+            FileService.write(file.stream, file_path)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            raise
 
-        # DICOM processing
-        if ext.lower() in ['.dcm', '.dicom'] or file.mimetype == "application/dicom":
-            DicomService.save(resource)
         return resource
 
     @staticmethod
     def find(resource_id):
         return Resource.query.get(resource_id)
 
+    @staticmethod
+    def find_for_user(resource_id, owner_id):
+        """The resource if it belongs to owner_id, else None."""
+        return Resource.query.filter_by(id=resource_id, owner_id=owner_id).first()
+
+    @staticmethod
+    def find_with_dicom(resource_id, owner_id):
+        """
+        (resource, its DicomResource or None) if the resource belongs to
+        owner_id, else None. One outer-joined query, as in page().
+        """
+        return (
+            db.session.query(Resource, DicomResource)
+                      .outerjoin(DicomResource, DicomResource.resource_id == Resource.id)
+                      .filter(Resource.id == resource_id, Resource.owner_id == owner_id)
+                      .first()
+        )
+
     @staticmethod
     def load(path, dataset_id=None):
         # Load binary data from disk
@@ -130,6 +198,7 @@ class FileService:
         filepath = os.path.join(base_folder, resource.path)
         if os.path.exists(filepath):
             os.remove(filepath)
+        ThumbnailService.discard(resource)
 
         return True
 
@@ -142,3 +211,65 @@ class FileService:
         if dataset_id is not None:
             query = query.filter_by(dataset_id=dataset_id)
         return query.all()
+
+    @staticmethod
+    def listing(dataset_id, owner_id, type="AImage"):
+        """
+        (id, name, path, mime) rows for every file of a dataset, in upload
+        order. Reads only those columns, for pages that need the whole
+        slice list but not full Resource objects.
+        """
+        return (
+            db.session.query(Resource.id, Resource.name, Resource.path, Resource.mime)
+                      .filter(Resource.dataset_id == dataset_id,
+                              Resource.owner_id == owner_id,
+                              Resource.type == type)
+                      .order_by(Resource.id)
+                      .all()
+        )
+
+    @staticmethod
+    def page(dataset_id, cursor=None, limit=None, order="id", type="AImage"):
+        """
+        One keyset page of a dataset's files as (Resource, instance_number)
+        rows. order is 'id' (upload order) or 'instance' (DICOM
+        InstanceNumber, files without one first). Raises ValueError for a
+        bad order or cursor.
+        """
+        query = (
+            db.session.query(Resource, DicomResource.instance_number)
+                      .outerjoin(DicomResource, DicomResource.resource_id == Resource.id)
+                      .filter(Resource.dataset_id == dataset_id, Resource.type == type)
+        )
+        if order == "instance":
+            keys = [func.coalesce(DicomResource.instance_number, -1), Resource.id]
+            row_keys = lambda row: (row[1] if row[1] is not None else -1, row[0].id)
+        elif order == "id":
+            keys = [Resource.id]
+            row_keys = lambda row: (row[0].id,)
+        else:
+            raise ValueError("order must be 'id' or 'instance'")
+        return PaginationService.keyset(query, keys, cursor, PaginationService.limit(limit), row_keys)
+
+    @staticmethod
+    def project(resource, fields=None, instance_number=None, annotations=None):
+        """
+        A resource as a dict restricted to fields (all when None).
+        annotations, if given, is the already serialized list.
+        """
+        values = {
+            "resource_id": resource.id,
+            "type": resource.type,
+            "name": resource.name,
+            "mime": resource.mime,
+            "path": resource.path,
+            "owner_id": resource.owner_id,
+            "dataset_id": resource.dataset_id,
+            "created_at": resource.created_at.isoformat() if resource.created_at else None,
+            "instance_number": instance_number,
+        }
+        if annotations is not None:
+            values["annotations"] = annotations
+        if fields is None:
+            return values
+        return {name: values.get(name) for name in fields}
@@ -0,0 +1,216 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from uuid import uuid4
+
+import cv2
+import numpy as np
+from flask import current_app
+
+from app.filters import apply_step
+from app.services.BaseService import Base
+from app.services.SliceService import SliceService
+
+# Bump when filter implementations change so stale renders are not served
+CACHE_VERSION = 1
+
+
+class FilterCache:
+    """
+    Disk-backed, content-addressed store of rendered filter-chain prefixes.
+
+    Entries are PNGs keyed by (file content hash, chain prefix, parameters).
+    PNG is lossless for the 8-bit frames filters produce, so an entry can be
+    both served to the browser and decoded to continue a longer chain.
+    Least recently used entries (by mtime) are evicted past max_bytes.
+    """
+
+    def __init__(self, folder, max_bytes):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self._total = None
+        self._lock = threading.Lock()
+        self._hashes = OrderedDict()
+        os.makedirs(folder, exist_ok=True)
+
+    def content_hash(self, path):
+        """SHA-1 of the file bytes, memoized on (path, mtime, size)."""
+        st = os.stat(path)
+        stamp = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            hit = self._hashes.get(path)
+            if hit and hit[0] == stamp:
+                self._hashes.move_to_end(path)
+                return hit[1]
+
+        sha = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                sha.update(block)
+        digest = sha.hexdigest()
+
+        with self._lock:
+            self._hashes[path] = (stamp, digest)
+            while len(self._hashes) > 10000:
+                self._hashes.popitem(last=False)
+        return digest
+
+    @staticmethod
+    def key(content_hash, names, params=None):
+        payload = json.dumps({
+            'v': CACHE_VERSION,
+            'file': content_hash,
+            'chain': list(names),
+            'params': params or {},
+        }, sort_keys=True)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.folder, key[:2], key + '.png')
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        try:
+            os.utime(path)  # mark as recently used
+        except OSError:
+            pass
+        return data
+
+    def put(self, key, data):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f'{path}.{uuid4().hex}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+        with self._lock:
+            if self._total is None:
+                self._total = self._scan()[1]
+            else:
+                self._total += len(data)
+            if self._total > self.max_bytes:
+                self._evict()
+
+    def _scan(self):
+        entries, total = [], 0
+        for root, _, names in os.walk(self.folder):
+            for name in names:
+                if not name.endswith('.png'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+        return entries, total
+
+    def _evict(self):
+        # Rescan so entries written by other worker processes are counted too
+        entries, total = self._scan()
+        target = int(self.max_bytes * 0.9)
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self._total = total
+
+    def render(self, path, is_dicom, names, params=None):
+        """
+        Return (etag, png_bytes) for the chain applied to the file at path.
+        The longest cached prefix is reused so only the new steps run, and
+        every intermediate prefix computed along the way is stored.
+        """
+        names = list(names)
+        digest = self.content_hash(path)
+        keys = [self.key(digest, names[:i], params) for i in range(len(names) + 1)]
+
+        start, data = None, None
+        for i in range(len(names), -1, -1):
+            data = self.get(keys[i])
+            if data is not None:
+                start = i
+                break
+
+        if start == len(names):
+            return keys[-1], data
+
+        if start is None:
+            img = SliceService.read_slide(path, is_dicom)
+            data = encode_png(img)
+            self.put(keys[0], data)
+            start = 0
+        else:
+            img = decode_png(data)
+        raw = img if start == 0 else None
+
+        for i in range(start, len(names)):
+            # 'Original' needs the decoded slide; fetch it only when asked
+            if names[i] == 'Original' and raw is None:
+                raw = decode_png(self.get(keys[0]))
+                if raw is None:
+                    raw = SliceService.read_slide(path, is_dicom)
+            img = apply_step(raw, img, names[i])
+            data = encode_png(img)
+            self.put(keys[i + 1], data)
+
+        return keys[-1], data
+
+
+def render_file(path, is_dicom, names, cache_folder, cache_max_bytes, params=None):
+    """Worker-process entry point: PNG bytes of the chain applied to one file."""
+    return FilterCache(cache_folder, cache_max_bytes).render(path, is_dicom, names, params)[1]
+
+
+def encode_png(img):
+    ok, buf = cv2.imencode('.png', img)
+    if not ok:
+        raise ValueError('Error encoding image')
+    return buf.tobytes()
+
+
+def decode_png(data):
+    if data is None:
+        return None
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_UNCHANGED)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+class FilterCacheService(Base):
+    @staticmethod
+    def cache():
+        global _cache
+        if _cache is None:
+            with _cache_lock:
+                if _cache is None:
+                    _cache = FilterCache(
+                        current_app.config['FILTER_CACHE_FOLDER'],
+                        current_app.config['FILTER_CACHE_MAX_BYTES'],
+                    )
+        return _cache
+
+    @staticmethod
+    def etag(path, names, params=None):
+        """ETag of a render without touching the cache or decoding anything."""
+        cache = FilterCacheService.cache()
+        return cache.key(cache.content_hash(path), names, params)
+
+    @staticmethod
+    def render(path, is_dicom, names, params=None):
+        return FilterCacheService.cache().render(path, is_dicom, names, params)
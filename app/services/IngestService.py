@@ -0,0 +1,131 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+from werkzeug.datastructures import FileStorage
+
+from app.extensions import db
+from app.services.BaseService import Base
+from app.services.FileService import FileService
+
+
+class IngestResult:
+    def __init__(self, filename):
+        self.filename = filename
+        self.resource = None
+        self.dicom_resource = None
+        self.path = None
+        self.error = None
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def serialize(self):
+        return {
+            "filename": self.filename,
+            "ok": self.ok,
+            "resource_id": self.resource.id if self.ok and self.resource is not None else None,
+            "error": self.error,
+        }
+
+
+class IngestService(Base):
+    @staticmethod
+    def ingest(files, dataset_id, type='AImage'):
+        """
+        Store a batch of uploaded files in one go.
+
+        Every file is validated and its header parsed from memory first,
+        then all accepted files are written to disk concurrently and their
+        Resource/DicomResource rows are inserted in a single transaction.
+        Returns one IngestResult per non-empty file, in input order; a bad
+        file fails on its own without affecting the rest.
+        """
+        results = []
+        accepted = []
+        folder = FileService.folder(dataset_id)
+        for f in files:
+            if not f or not f.filename:
+                continue
+            result = IngestResult(f.filename)
+            results.append(result)
+            try:
+                result.resource, result.dicom_resource = FileService.prepare(f, type, dataset_id)
+            except ValueError as e:
+                result.error = str(e)
+                continue
+            except Exception as e:
+                print(f"Error preparing upload {f.filename}: {str(e)}")
+                result.error = "An error occurred during upload"
+                continue
+            result.path = os.path.join(folder, result.resource.path)
+            accepted.append((f, result))
+
+        if not accepted:
+            return results
+
+        def write(item):
+            f, result = item
+            try:
+                FileService.write(f.stream, result.path)
+            except Exception as e:
+                print(f"Error writing upload {f.filename}: {str(e)}")
+                result.error = "An error occurred during upload"
+
+        with ThreadPoolExecutor(max_workers=current_app.config['INGEST_WRITERS']) as pool:
+            list(pool.map(write, accepted))
+
+        written = [result for _, result in accepted if result.ok]
+        try:
+            for result in written:
+                db.session.add(result.resource)
+                if result.dicom_resource is not None:
+                    db.session.add(result.dicom_resource)
+            db.session.commit()
+        except Exception as e:
+            print(f"Error committing upload batch: {str(e)}")
+            db.session.rollback()
+            for result in written:
+                result.error = "An error occurred during upload"
+
+        # Files whose rows were not stored must not linger on disk
+        for _, result in accepted:
+            if not result.ok and os.path.exists(result.path):
+                os.remove(result.path)
+
+        return results
+
+    @staticmethod
+    def ingest_path(path, filename, mimetype, dataset_id, type='AImage'):
+        """
+        Ingest a file that is already on disk (an assembled chunked upload)
+        by renaming it into the dataset folder instead of copying it.
+        """
+        result = IngestResult(filename)
+        try:
+            with open(path, 'rb') as stream:
+                f = FileStorage(stream=stream, filename=filename, content_type=mimetype)
+                result.resource, result.dicom_resource = FileService.prepare(f, type, dataset_id)
+        except ValueError as e:
+            result.error = str(e)
+            return result
+        except Exception as e:
+            print(f"Error preparing upload {filename}: {str(e)}")
+            result.error = "An error occurred during upload"
+            return result
+
+        result.path = os.path.join(FileService.folder(dataset_id), result.resource.path)
+        try:
+            os.replace(path, result.path)
+            db.session.add(result.resource)
+            if result.dicom_resource is not None:
+                db.session.add(result.dicom_resource)
+            db.session.commit()
+        except Exception as e:
+            print(f"Error committing upload {filename}: {str(e)}")
+            db.session.rollback()
+            result.error = "An error occurred during upload"
+            if os.path.exists(result.path):
+                os.remove(result.path)
+        return result
@@ -0,0 +1,187 @@
+import base64
+import binascii
+import os
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from app.services.BaseService import Base
+from app.services.DicomService import DicomService
+from app.services.FileService import FileService
+
+# Pixels of background kept around the annotated region so the distance
+# maps inside the crop match those of the full slice
+ROI_MARGIN = 4
+
+
+def rle_encode(mask):
+    """Uncompressed COCO RLE of a 2D mask: column-major, first run is zeros."""
+    mask = np.asarray(mask, dtype=bool)
+    h, w = mask.shape
+    flat = np.concatenate([[False], mask.T.ravel(), [False]])
+    changes = np.flatnonzero(flat[1:] != flat[:-1])
+    runs = np.diff(np.concatenate([[0], changes, [h * w]]))
+    return {"size": [h, w], "counts": runs.tolist(), "area": int(mask.sum())}
+
+
+def rle_decode(rle):
+    """2D bool mask from an uncompressed COCO RLE dict."""
+    h, w = rle["size"]
+    counts = np.asarray(rle["counts"], dtype=np.int64)
+    if counts.sum() != h * w:
+        raise ValueError("RLE counts do not match its size")
+    values = np.arange(len(counts)) % 2 == 1
+    return np.repeat(values, counts).reshape(w, h).T
+
+
+def decode_mask(value):
+    """A key-slice mask sent as RLE dict or base64 image (non-zero is inside)."""
+    if isinstance(value, dict):
+        return rle_decode(value)
+    if isinstance(value, str):
+        if ',' in value:
+            value = value.split(',', 1)[1]
+        try:
+            data = base64.b64decode(value, validate=True)
+        except (binascii.Error, ValueError):
+            raise ValueError("Mask image is not valid base64")
+        if not data:
+            raise ValueError("Mask image is empty")
+        try:
+            img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_GRAYSCALE)
+        except cv2.error:
+            img = None
+        if img is None:
+            raise ValueError("Could not decode mask image")
+        return img > 0
+    raise ValueError("Masks must be RLE objects or base64 images")
+
+
+class MaskInterpolationService(Base):
+    """
+    Shape-based interpolation of binary annotation masks between key
+    slices. Each key mask becomes a signed distance map (negative inside);
+    every slice between two keys is the zero level set of the maps blended
+    by position. Distances are only computed inside the bounding box of
+    all key masks, and the whole stack is blended in one array operation.
+    """
+
+    @staticmethod
+    def signed_distance(masks):
+        """(k, h, w) float32 signed distances for a stack of bool masks."""
+        out = np.empty(masks.shape, dtype=np.float32)
+        far = float(sum(masks.shape[1:]))
+        empty = []
+        for i, m in enumerate(masks):
+            if not m.any():
+                empty.append(i)
+                continue
+            if m.all():
+                out[i] = -far
+                continue
+            m = m.astype(np.uint8)
+            outside = cv2.distanceTransform(1 - m, cv2.DIST_L2, cv2.DIST_MASK_PRECISE)
+            inside = cv2.distanceTransform(m, cv2.DIST_L2, cv2.DIST_MASK_PRECISE)
+            out[i] = outside - inside
+        if empty:
+            # An empty key slice has no boundary. Giving it the depth of the
+            # thickest object makes shapes shrink away by midway to it
+            filled = [i for i in range(len(masks)) if i not in empty]
+            depth = max(-out[filled].min(), 1.0) if filled else far
+            out[empty] = depth
+        return out
+
+    @staticmethod
+    def interpolate(key_positions, key_masks, positions):
+        """
+        Masks at positions (slice index or mm along the series axis) from
+        key masks at key_positions. Positions outside the keyed range come
+        back empty. Returns a (len(positions), h, w) bool array.
+        """
+        order = np.argsort(key_positions)
+        key_positions = np.asarray(key_positions, dtype=np.float64)[order]
+        key_masks = np.asarray(key_masks, dtype=bool)[order]
+        positions = np.asarray(positions, dtype=np.float64)
+        out = np.zeros((len(positions),) + key_masks.shape[1:], dtype=bool)
+        if len(key_positions) < 2 or not key_masks.any():
+            return out
+
+        # Union ROI of every key mask, padded
+        ys, xs = np.nonzero(key_masks.any(axis=0))
+        h, w = key_masks.shape[1:]
+        y0, y1 = max(ys.min() - ROI_MARGIN, 0), min(ys.max() + ROI_MARGIN + 1, h)
+        x0, x1 = max(xs.min() - ROI_MARGIN, 0), min(xs.max() + ROI_MARGIN + 1, w)
+        sdf = MaskInterpolationService.signed_distance(key_masks[:, y0:y1, x0:x1])
+
+        inside = (positions >= key_positions[0]) & (positions <= key_positions[-1])
+        targets = positions[inside]
+        right = np.clip(np.searchsorted(key_positions, targets, side='right'), 1, len(key_positions) - 1)
+        left = right - 1
+        gap = key_positions[right] - key_positions[left]
+        alpha = np.where(gap > 0, (targets - key_positions[left]) / np.where(gap > 0, gap, 1), 0)
+        alpha = alpha.astype(np.float32)[:, None, None]
+        blended = (1 - alpha) * sdf[left] + alpha * sdf[right]
+        out[inside, y0:y1, x0:x1] = blended < 0
+        return out
+
+    @staticmethod
+    def series_slices(dataset_id, owner_id):
+        """
+        The dataset's slices in series order as (resource_ids, positions,
+        shape). Uses the largest DICOM series and its stored slice positions
+        (mm), falling back to instance order, then upload order with
+        indices. shape is the (rows, columns) of a slice, from the stored
+        DICOM header or the first image's header; None if unknown.
+        """
+        series = DicomService.series(dataset_id)
+        if series:
+            rows = max(series.values(), key=len)
+            ids = [row.resource_id for row in rows]
+            shape = (rows[0].rows, rows[0].columns) if rows[0].rows and rows[0].columns else None
+            if all(row.slice_position is not None for row in rows):
+                return ids, [row.slice_position for row in rows], shape
+            return ids, list(range(len(ids))), shape
+        listing = FileService.listing(dataset_id, owner_id)
+        shape = None
+        if listing:
+            try:
+                with Image.open(os.path.join(FileService.folder(dataset_id), listing[0].path)) as img:
+                    shape = (img.height, img.width)
+            except OSError:
+                pass
+        ids = [row.id for row in listing]
+        return ids, list(range(len(ids))), shape
+
+    @staticmethod
+    def fill_series(dataset_id, owner_id, key_masks):
+        """
+        Interpolate every unannotated slice of a dataset's series from the
+        annotated ones. key_masks maps resource_id to a bool mask; returns
+        {resource_id: mask} for the slices between the first and last key.
+        Raises ValueError for unknown slices, or masks whose sizes differ
+        from each other or from the series' slices.
+        """
+        ids, positions, shape = MaskInterpolationService.series_slices(dataset_id, owner_id)
+        index = {resource_id: i for i, resource_id in enumerate(ids)}
+        unknown = [r for r in key_masks if r not in index]
+        if unknown:
+            raise ValueError(f"Resources not in this series: {', '.join(str(r) for r in unknown)}")
+        if len({m.shape for m in key_masks.values()}) > 1:
+            raise ValueError("Key masks must all have the same size")
+        mask_shape = next(iter(key_masks.values())).shape
+        if shape is not None and tuple(mask_shape) != tuple(shape):
+            raise ValueError(f"Key masks are {mask_shape[0]}x{mask_shape[1]} but the series slices are {shape[0]}x{shape[1]}")
+
+        keys = sorted(key_masks, key=lambda r: index[r])
+        first, last = index[keys[0]], index[keys[-1]]
+        targets = [ids[i] for i in range(first, last + 1) if ids[i] not in key_masks]
+        if not targets or len(keys) < 2:
+            return {}
+
+        masks = MaskInterpolationService.interpolate(
+            [positions[index[r]] for r in keys],
+            np.stack([key_masks[r] for r in keys]),
+            [positions[index[r]] for r in targets],
+        )
+        return dict(zip(targets, masks))
@@ -0,0 +1,275 @@
+import json
+import struct
+
+import cv2
+import numpy as np
+from skimage import measure
+
+from app.services.BaseService import Base
+
+# Bump when surface extraction or decimation changes so cached meshes are revalidated
+MESH_VERSION = 1
+
+# Level of detail: (largest in-plane grid in voxels, target face count).
+# None means native resolution / no decimation.
+MESH_LODS = {
+    'low': (128, 20000),
+    'medium': (256, 100000),
+    'high': (512, 400000),
+    'full': (None, None),
+}
+
+MESH_FORMATS = {
+    'stl': 'model/stl',
+    'ply': 'application/octet-stream',
+    'obj': 'model/obj',
+    'glb': 'model/gltf-binary',
+}
+
+STL_DTYPE = np.dtype([
+    ('normal', '<f4', (3,)),
+    ('vertices', '<f4', (3, 3)),
+    ('attr', '<u2'),
+])
+
+PLY_FACE_DTYPE = np.dtype([('count', 'u1'), ('index', '<i4', (3,))])
+
+# Binary glTF container and the glTF enums used by the writer
+GLB_MAGIC, GLB_JSON, GLB_BIN = 0x46546C67, 0x4E4F534A, 0x004E4942
+GL_UNSIGNED_SHORT, GL_UNSIGNED_INT, GL_FLOAT = 5123, 5125, 5126
+GL_ARRAY_BUFFER, GL_ELEMENT_ARRAY_BUFFER = 34962, 34963
+
+
+def _accumulate(labels, values, size):
+    """Per-label sums of the rows of values (n, k) -> (size, k), via bincount."""
+    return np.stack([np.bincount(labels, weights=values[:, i], minlength=size)
+                     for i in range(values.shape[1])], axis=1)
+
+
+class MeshService(Base):
+    """
+    Surface meshes of binary or occupancy volumes: spacing-aware marching
+    cubes on the region that actually holds the object, decimation to a
+    face budget and binary writers, all on whole NumPy arrays.
+    """
+
+    @staticmethod
+    def lod(name):
+        if name not in MESH_LODS:
+            raise ValueError(f"lod must be one of: {', '.join(MESH_LODS)}")
+        return MESH_LODS[name]
+
+    @staticmethod
+    def downsample(volume, spacing, max_grid):
+        """
+        Shrink each slice of volume so its longest side is at most
+        max_grid, returning float32 occupancy (area-averaged, so the 0.5
+        iso-surface stays sub-voxel accurate) and the matching spacing.
+        """
+        depth, h, w = volume.shape
+        if max_grid is None or max(h, w) <= max_grid:
+            return volume, tuple(spacing)
+        scale = max_grid / float(max(h, w))
+        gh, gw = max(int(round(h * scale)), 1), max(int(round(w * scale)), 1)
+        out = np.empty((depth, gh, gw), dtype=np.float32)
+        for z in range(depth):
+            out[z] = cv2.resize(volume[z].astype(np.float32), (gw, gh), interpolation=cv2.INTER_AREA)
+        return out, (spacing[0], spacing[1] * h / gh, spacing[2] * w / gw)
+
+    @staticmethod
+    def surface(volume, spacing=(1.0, 1.0, 1.0), level=0.5):
+        """
+        Marching cubes over the bounding box of voxels above level, padded
+        by one empty voxel so the surface closes. volume and spacing are
+        (z, y, x); vertices come back as (x, y, z) in mm in the full
+        volume's frame, faces wound outwards. Returns (verts, faces), empty
+        when nothing crosses level.
+        """
+        occupied = volume > level
+        if not occupied.any():
+            return np.zeros((0, 3), np.float32), np.zeros((0, 3), np.int64)
+        lo = [int(np.flatnonzero(occupied.any(axis=tuple(j for j in range(3) if j != i))).min()) for i in range(3)]
+        hi = [int(np.flatnonzero(occupied.any(axis=tuple(j for j in range(3) if j != i))).max()) + 1 for i in range(3)]
+        roi = volume[lo[0]:hi[0], lo[1]:hi[1], lo[2]:hi[2]]
+        roi = np.pad(roi.astype(np.float32, copy=False), 1)
+
+        verts, faces, _, _ = measure.marching_cubes(roi, level=level, spacing=tuple(spacing))
+        offset = (np.array(lo) - 1) * np.asarray(spacing)
+        # Swapping to (x, y, z) mirrors the mesh, which also turns
+        # skimage's inward (z, y, x) winding outwards
+        return (verts + offset)[:, ::-1].astype(np.float32), faces.astype(np.int64)
+
+    @staticmethod
+    def decimate(verts, faces, target_faces):
+        """
+        Reduce a mesh to about target_faces by vertex clustering with
+        quadric error placement: vertices are binned on a uniform grid and
+        each cell collapses to the point minimizing the summed squared
+        distance to its faces' planes. The cell size is searched so the
+        result lands near the target; the closest attempt is kept.
+        Raises ValueError if target_faces is not positive.
+        """
+        if target_faces is None or len(faces) <= target_faces:
+            return verts, faces
+        if target_faces <= 0:
+            raise ValueError("target_faces must be positive")
+
+        tri = verts[faces].astype(np.float64)
+        normal = np.cross(tri[:, 1] - tri[:, 0], tri[:, 2] - tri[:, 0])
+        area2 = np.linalg.norm(normal, axis=1)
+        surface_area = area2.sum() / 2
+        unit = normal / np.where(area2 > 0, area2, 1)[:, None]
+        plane = np.concatenate([unit, -(unit * tri[:, 0]).sum(axis=1, keepdims=True)], axis=1)
+        # Area-weighted plane quadrics, upper triangle of the symmetric 4x4
+        iu = np.triu_indices(4)
+        quadric = (plane[:, :, None] * plane[:, None, :])[:, iu[0], iu[1]] * (area2 / 2)[:, None]
+
+        vmin = verts.min(axis=0)
+        cell = np.sqrt(surface_area / target_faces)
+        best = None
+        for _ in range(8):
+            result = MeshService._cluster(verts, faces, quadric, vmin, cell)
+            if best is None or abs(len(result[1]) - target_faces) < abs(len(best[1]) - target_faces):
+                best = result
+            ratio = len(result[1]) / float(target_faces)
+            if 0.8 <= ratio <= 1.0:
+                break
+            cell *= np.sqrt(ratio) if ratio > 1 else max(np.sqrt(ratio), 0.7)
+        return best
+
+    @staticmethod
+    def _cluster(verts, faces, quadric, vmin, cell):
+        keys = np.floor((verts - vmin) / cell).astype(np.int64)
+        dims = keys.max(axis=0) + 1
+        flat = keys[:, 0] + dims[0] * (keys[:, 1] + dims[1] * keys[:, 2])
+        _, labels = np.unique(flat, return_inverse=True)
+        labels = labels.ravel()
+        n = labels.max() + 1
+
+        new_faces = labels[faces]
+        keep = ((new_faces[:, 0] != new_faces[:, 1]) & (new_faces[:, 1] != new_faces[:, 2])
+                & (new_faces[:, 0] != new_faces[:, 2]))
+        # A cell's quadric gathers the planes of every face touching it
+        q = sum(_accumulate(labels[faces[:, k]], quadric, n) for k in range(3))
+        new_faces = new_faces[keep]
+        _, first = np.unique(np.sort(new_faces, axis=1), axis=0, return_index=True)
+        new_faces = new_faces[np.sort(first)]
+
+        count = np.bincount(labels, minlength=n).astype(np.float64)
+        centroid = _accumulate(labels, verts.astype(np.float64), n) / count[:, None]
+        full = np.zeros((n, 4, 4))
+        full[:, np.triu_indices(4)[0], np.triu_indices(4)[1]] = q
+        full = full + np.triu(full, 1).transpose(0, 2, 1)
+        a, b = full[:, :3, :3], full[:, :3, 3]
+        # Pull towards the centroid so flat or degenerate cells stay put
+        reg = 1e-3 * np.maximum(np.trace(a, axis1=1, axis2=2), 1e-12)[:, None, None] * np.eye(3)
+        position = np.linalg.solve(a + reg, (reg @ centroid[:, :, None]) - b[:, :, None])[..., 0]
+        lo = np.full((n, 3), np.inf)
+        hi = np.full((n, 3), -np.inf)
+        np.minimum.at(lo, labels, verts)
+        np.maximum.at(hi, labels, verts)
+        position = np.clip(position, lo, hi)
+
+        used = np.unique(new_faces)
+        remap = np.full(n, -1, dtype=np.int64)
+        remap[used] = np.arange(len(used))
+        return position[used].astype(np.float32), remap[new_faces]
+
+    @staticmethod
+    def glb(verts, faces, quantize=False, extras=None):
+        """
+        Encode a mesh as binary glTF 2.0: one node holding one indexed
+        triangle primitive, positions as float32 and indices as uint32,
+        each in its own buffer view so a viewer can hand them to WebGL as
+        they are. With quantize, positions are stored as uint16 (padded to
+        8-byte vertices) under KHR_mesh_quantization, and the node's scale
+        and translation map them back to mm. extras is stored as the
+        document's extras. An empty mesh gives a scene without nodes.
+        """
+        verts = np.asarray(verts, dtype=np.float32).reshape(-1, 3)
+        faces = np.asarray(faces, dtype=np.int64).reshape(-1, 3)
+        gltf = {
+            'asset': {'version': '2.0', 'generator': 'CT-Image-Annotation'},
+            'scene': 0,
+            'scenes': [{'nodes': [0] if len(faces) else []}],
+        }
+        if extras:
+            gltf['extras'] = extras
+        binary = b''
+        if len(faces):
+            lo, hi = verts.min(axis=0), verts.max(axis=0)
+            node = {'mesh': 0}
+            if quantize:
+                step = np.where(hi > lo, (hi.astype(np.float64) - lo) / 65535.0, 1.0)
+                stored = np.zeros((len(verts), 4), dtype='<u2')
+                stored[:, :3] = np.rint((verts - lo) / step)
+                position = {'componentType': GL_UNSIGNED_SHORT,
+                            'min': stored[:, :3].min(axis=0).tolist(), 'max': stored[:, :3].max(axis=0).tolist()}
+                stride = 8
+                node.update(scale=step.tolist(), translation=lo.astype(np.float64).tolist())
+                gltf['extensionsUsed'] = ['KHR_mesh_quantization']
+                gltf['extensionsRequired'] = ['KHR_mesh_quantization']
+            else:
+                stored = verts.astype('<f4', copy=False)
+                position = {'componentType': GL_FLOAT, 'min': lo.tolist(), 'max': hi.tolist()}
+                stride = 12
+            positions = stored.tobytes()
+            indices = faces.astype('<u4').tobytes()
+            gltf.update({
+                'nodes': [node],
+                'meshes': [{'primitives': [{'attributes': {'POSITION': 0}, 'indices': 1, 'mode': 4}]}],
+                'accessors': [
+                    dict(position, bufferView=0, count=len(verts), type='VEC3'),
+                    {'bufferView': 1, 'componentType': GL_UNSIGNED_INT, 'count': faces.size, 'type': 'SCALAR',
+                     'min': [int(faces.min())], 'max': [int(faces.max())]},
+                ],
+                'bufferViews': [
+                    {'buffer': 0, 'byteOffset': 0, 'byteLength': len(positions), 'byteStride': stride,
+                     'target': GL_ARRAY_BUFFER},
+                    {'buffer': 0, 'byteOffset': len(positions), 'byteLength': len(indices),
+                     'target': GL_ELEMENT_ARRAY_BUFFER},
+                ],
+                'buffers': [{'byteLength': len(positions) + len(indices)}],
+            })
+            # Both views are whole 4-byte elements, so the chunk needs no padding
+            binary = positions + indices
+
+        header = json.dumps(gltf, separators=(',', ':')).encode('utf-8')
+        header += b' ' * (-len(header) % 4)
+        chunks = struct.pack('<II', len(header), GLB_JSON) + header
+        if binary:
+            chunks += struct.pack('<II', len(binary), GLB_BIN) + binary
+        return struct.pack('<III', GLB_MAGIC, 2, 12 + len(chunks)) + chunks
+
+    @staticmethod
+    def write(verts, faces, fmt='stl'):
+        """Encode a mesh as binary STL, binary little-endian PLY, OBJ or GLB bytes."""
+        verts = np.ascontiguousarray(verts, dtype=np.float32)
+        faces = np.ascontiguousarray(faces, dtype=np.int64)
+        if fmt == 'stl':
+            tri = verts[faces]
+            normal = np.cross(tri[:, 1] - tri[:, 0], tri[:, 2] - tri[:, 0])
+            length = np.linalg.norm(normal, axis=1, keepdims=True)
+            records = np.zeros(len(faces), dtype=STL_DTYPE)
+            records['normal'] = normal / np.where(length > 0, length, 1)
+            records['vertices'] = tri
+            header = b'binary STL'.ljust(80, b'\0')
+            return header + np.uint32(len(faces)).tobytes() + records.tobytes()
+        if fmt == 'ply':
+            header = (
+                "ply\nformat binary_little_endian 1.0\n"
+                f"element vertex {len(verts)}\nproperty float x\nproperty float y\nproperty float z\n"
+                f"element face {len(faces)}\nproperty list uchar int vertex_indices\nend_header\n"
+            ).encode('ascii')
+            records = np.zeros(len(faces), dtype=PLY_FACE_DTYPE)
+            records['count'] = 3
+            records['index'] = faces
+            return header + verts.astype('<f4').tobytes() + records.tobytes()
+        if fmt == 'obj':
+            # One %-format over the flattened arrays instead of a loop per line
+            v = ('v %.5f %.5f %.5f\n' * len(verts)) % tuple(verts.ravel().tolist())
+            f = ('f %d %d %d\n' * len(faces)) % tuple((faces + 1).ravel().tolist())
+            return (v + f).encode('ascii')
+        if fmt == 'glb':
+            return MeshService.glb(verts, faces)
+        raise ValueError(f"format must be one of: {', '.join(MESH_FORMATS)}")
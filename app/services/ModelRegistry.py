@@ -0,0 +1,149 @@
+import threading
+import time
+import traceback
+
+from app.services.BaseService import Base
+
+
+class ModelEntry:
+    """
+    One named model held by the registry: its loader, the loaded instance
+    and the numbers worth reporting (state, load time, memory).
+
+    state: 'idle' (registered, not loaded), 'loading', 'ready' or 'error'
+    """
+
+    def __init__(self, name, loader):
+        self.name = name
+        self.loader = loader
+        self.model = None
+        self.state = 'idle'
+        self.error = None
+        self.load_seconds = None
+        self.param_bytes = None
+        self.device_bytes = None
+        self.loaded_at = None
+        self.hits = 0
+        self.lock = threading.Lock()
+
+    def serialize(self):
+        return {
+            "name": self.name,
+            "state": self.state,
+            "error": self.error,
+            "load_seconds": self.load_seconds,
+            "param_bytes": self.param_bytes,
+            "device_bytes": self.device_bytes,
+            "loaded_at": self.loaded_at,
+            "hits": self.hits,
+        }
+
+
+def _param_bytes(model):
+    """Bytes held by a torch module's parameters and buffers, if it is one."""
+    if not hasattr(model, 'parameters'):
+        return None
+    total = sum(p.numel() * p.element_size() for p in model.parameters())
+    if hasattr(model, 'buffers'):
+        total += sum(b.numel() * b.element_size() for b in model.buffers())
+    return total
+
+
+def _cuda_allocated():
+    try:
+        import torch
+        if torch.cuda.is_available():
+            return torch.cuda.memory_allocated()
+    except ImportError:
+        pass
+    return None
+
+
+_entries = {}
+_entries_lock = threading.Lock()
+
+
+class ModelRegistry(Base):
+    """
+    Process-wide store of loaded models. Each checkpoint is deserialized
+    once per process, on first use, and the warm instance is handed to
+    every caller afterwards. Loaders return the model (typically an
+    nn.Module already moved to its device and put in eval mode); callers
+    wrap it in their own predictor, since predictors hold per-image state.
+    """
+
+    @staticmethod
+    def register(name, loader):
+        """Declare how to build name without loading it. First loader wins."""
+        with _entries_lock:
+            entry = _entries.get(name)
+            if entry is None:
+                entry = ModelEntry(name, loader)
+                _entries[name] = entry
+        return entry
+
+    @staticmethod
+    def get(name, loader=None):
+        """Return the loaded model, loading it now if nobody has yet."""
+        entry = _entries.get(name)
+        if entry is None:
+            if loader is None:
+                raise KeyError(f"Unknown model: {name}")
+            entry = ModelRegistry.register(name, loader)
+
+        if entry.state != 'ready':
+            ModelRegistry._load(entry)
+        entry.hits += 1
+        return entry.model
+
+    @staticmethod
+    def is_ready(name):
+        entry = _entries.get(name)
+        return entry is not None and entry.state == 'ready'
+
+    @staticmethod
+    def status(name=None):
+        if name is not None:
+            entry = _entries.get(name)
+            return entry.serialize() if entry else None
+        return {n: e.serialize() for n, e in list(_entries.items())}
+
+    @staticmethod
+    def unload(name):
+        """Drop a loaded model so the next get() reloads it."""
+        entry = _entries.get(name)
+        if entry is None:
+            return
+        with entry.lock:
+            entry.model = None
+            entry.state = 'idle'
+            entry.loaded_at = None
+
+    @staticmethod
+    def _load(entry):
+        # Concurrent first requests wait on the same load instead of each
+        # deserializing their own copy of the checkpoint
+        with entry.lock:
+            if entry.state == 'ready':
+                return
+            entry.state = 'loading'
+            entry.error = None
+            before = _cuda_allocated()
+            start = time.perf_counter()
+            try:
+                model = entry.loader()
+            except Exception as e:
+                entry.state = 'error'
+                entry.error = str(e)
+                print(f"[ModelRegistry] Failed to load {entry.name}: {e}")
+                print(traceback.format_exc())
+                raise
+            entry.load_seconds = round(time.perf_counter() - start, 3)
+            entry.param_bytes = _param_bytes(model)
+            after = _cuda_allocated()
+            if before is not None and after is not None:
+                entry.device_bytes = after - before
+            entry.model = model
+            entry.loaded_at = time.time()
+            entry.state = 'ready'
+            print(f"[ModelRegistry] Loaded {entry.name} in {entry.load_seconds}s")
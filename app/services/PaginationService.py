@@ -0,0 +1,91 @@
+import base64
+import json
+
+from flask import current_app
+from sqlalchemy import and_, or_
+
+from app.services.BaseService import Base
+
+
+class Page:
+    def __init__(self, items, next_cursor, limit):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.limit = limit
+
+    def serialize(self, project=lambda item: item):
+        return {
+            "items": [project(item) for item in self.items],
+            "next_cursor": self.next_cursor,
+            "limit": self.limit,
+        }
+
+
+class PaginationService(Base):
+    """
+    Keyset pagination shared by the list endpoints. A page is fetched with
+    WHERE (k1, k2, ...) > (last row's keys) ORDER BY k1, k2, ... LIMIT n,
+    so every page costs the same however deep the client has scrolled.
+    Cursors are opaque to clients: base64 of the last row's key values.
+    """
+
+    @staticmethod
+    def limit(value):
+        """Requested page size clamped to [1, API_MAX_PAGE_SIZE]; API_PAGE_SIZE if missing."""
+        config = current_app.config
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            return config['API_PAGE_SIZE']
+        return max(1, min(value, config['API_MAX_PAGE_SIZE']))
+
+    @staticmethod
+    def encode_cursor(values):
+        return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+    @staticmethod
+    def decode_cursor(cursor, size):
+        """Key values of a cursor, or None for the first page. Raises ValueError if malformed."""
+        if not cursor:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        except Exception:
+            raise ValueError("Invalid cursor")
+        if not isinstance(values, list) or len(values) != size:
+            raise ValueError("Invalid cursor")
+        return values
+
+    @staticmethod
+    def keyset(query, keys, cursor, limit, row_keys):
+        """
+        One page of query ordered by the key column expressions in keys.
+        row_keys(row) returns a row's key values in the same order. The last
+        key must be unique (normally the primary key).
+        """
+        after = PaginationService.decode_cursor(cursor, len(keys))
+        if after is not None:
+            # (k1, k2) > (a1, a2) spelled out, since row-value comparison is not portable
+            clauses = []
+            for i, key in enumerate(keys):
+                equal = [keys[j] == after[j] for j in range(i)]
+                clauses.append(and_(*equal, key > after[i]))
+            query = query.filter(or_(*clauses))
+
+        rows = query.order_by(*keys).limit(limit + 1).all()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = PaginationService.encode_cursor(list(row_keys(rows[-1])))
+        return Page(rows, next_cursor, limit)
+
+    @staticmethod
+    def fields(value, allowed):
+        """Requested projection as a list, or None for every field. Raises ValueError for unknown fields."""
+        if not value:
+            return None
+        names = [name.strip() for name in value.split(',') if name.strip()]
+        unknown = [name for name in names if name not in allowed]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(allowed)}")
+        return names
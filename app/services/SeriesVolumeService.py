@@ -0,0 +1,359 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from uuid import uuid4
+
+import numpy as np
+import pydicom
+from flask import current_app
+
+from app.services.BaseService import Base
+from app.services.DecodeService import DecodeService
+from app.services.DicomService import DicomService
+from app.services.SliceService import SliceService
+
+# Bump when the volume layout or decoding changes so stale .npy files are ignored
+VOLUME_VERSION = 1
+
+INT16_MIN, INT16_MAX = np.iinfo(np.int16).min, np.iinfo(np.int16).max
+
+
+def decode_slice(path):
+    """
+    Read one DICOM file into rescaled int16 frames plus the tags used to
+    order and space it within its series. Returns None for files without
+    pixel data. Module-level and Flask-free so it can run in a worker process.
+    """
+    dcm = pydicom.dcmread(path, force=True)
+    if 'PixelData' not in dcm:
+        return None
+
+    arr = dcm.pixel_array
+    if int(dcm.get('SamplesPerPixel', 1) or 1) > 1:
+        arr = arr.mean(axis=-1)
+    slope = float(dcm.get('RescaleSlope', 1) or 1)
+    intercept = float(dcm.get('RescaleIntercept', 0) or 0)
+    frames = np.clip(np.rint(arr * slope + intercept), INT16_MIN, INT16_MAX).astype(np.int16)
+    if frames.ndim == 2:
+        frames = frames[None]
+
+    def floats(name):
+        value = dcm.get(name)
+        if value is None:
+            return None
+        try:
+            return [float(v) for v in value]
+        except (TypeError, ValueError):
+            return None
+
+    def number(name):
+        value = dcm.get(name)
+        try:
+            return float(value) if value not in (None, '') else None
+        except (TypeError, ValueError):
+            return None
+
+    return {
+        'frames': frames,
+        'position': floats('ImagePositionPatient'),
+        'orientation': floats('ImageOrientationPatient'),
+        'instance': number('InstanceNumber'),
+        'pixel_spacing': floats('PixelSpacing'),
+        'thickness': number('SliceThickness'),
+        'spacing_between': number('SpacingBetweenSlices'),
+    }
+
+
+def _slice_order(slices):
+    """
+    Sort decoded slices along the patient axis: by ImagePositionPatient
+    projected on the slice normal when every slice has it, else by
+    InstanceNumber, else in upload order. Returns (ordered, positions).
+    """
+    if all(s['position'] and s['orientation'] and len(s['orientation']) == 6 for s in slices):
+        row = np.array(slices[0]['orientation'][:3])
+        col = np.array(slices[0]['orientation'][3:])
+        normal = np.cross(row, col)
+        positions = [float(np.dot(s['position'], normal)) for s in slices]
+        order = np.argsort(positions, kind='stable')
+        return [slices[i] for i in order], [positions[i] for i in order]
+    if all(s['instance'] is not None for s in slices):
+        return sorted(slices, key=lambda s: s['instance']), None
+    return list(slices), None
+
+
+class SeriesVolume:
+    """
+    A dataset's DICOM slices stacked into one contiguous (z, y, x) int16
+    volume in rescaled units (HU for CT), ordered along the patient axis.
+
+    spacing is (z, y, x) in mm; resource_ids[i] is the resource slice i came from.
+    """
+
+    def __init__(self, voxels, spacing, origin, resource_ids, key):
+        self.voxels = voxels
+        self.spacing = tuple(float(v) for v in spacing)
+        self.origin = list(origin) if origin is not None else None
+        self.resource_ids = list(resource_ids)
+        self.key = key
+
+    @property
+    def shape(self):
+        return self.voxels.shape
+
+    @property
+    def nbytes(self):
+        return self.voxels.nbytes
+
+    def meta(self):
+        return {
+            'shape': list(self.shape),
+            'spacing': list(self.spacing),
+            'origin': self.origin,
+            'resource_ids': self.resource_ids,
+        }
+
+
+def assemble(decoded):
+    """
+    Build (voxels, spacing, origin, resource_ids) from (resource_id, decoded
+    slice) pairs. Slices whose in-plane size differs from the first one are
+    dropped rather than resampled.
+    """
+    slices = []
+    for resource_id, s in decoded:
+        if s is None:
+            continue
+        s = dict(s, resource_id=resource_id)
+        slices.append(s)
+    if not slices:
+        return None
+
+    ordered, positions = _slice_order(slices)
+    plane = ordered[0]['frames'].shape[1:]
+    kept = [s for s in ordered if s['frames'].shape[1:] == plane]
+    if len(kept) != len(ordered):
+        print(f"SeriesVolume: dropped {len(ordered) - len(kept)} slice(s) not matching {plane}")
+        if positions is not None:
+            positions = [p for s, p in zip(ordered, positions) if s['frames'].shape[1:] == plane]
+
+    depth = sum(s['frames'].shape[0] for s in kept)
+    voxels = np.empty((depth,) + plane, dtype=np.int16)
+    resource_ids = []
+    z = 0
+    for s in kept:
+        n = s['frames'].shape[0]
+        voxels[z:z + n] = s['frames']
+        resource_ids.extend([s['resource_id']] * n)
+        z += n
+
+    first = kept[0]
+    row_mm, col_mm = (first['pixel_spacing'] or [1.0, 1.0])[:2]
+    z_mm = None
+    if positions is not None and len(positions) > 1:
+        steps = np.abs(np.diff(positions))
+        steps = steps[steps > 1e-6]
+        if steps.size:
+            z_mm = float(np.median(steps))
+    if z_mm is None:
+        z_mm = first['spacing_between'] or first['thickness'] or 1.0
+
+    return voxels, (z_mm, row_mm, col_mm), first['position'], resource_ids
+
+
+class SeriesVolumeCache:
+    """
+    Two-level cache of assembled volumes: an in-memory LRU bounded by bytes,
+    backed by .npy files on disk that are reopened memory-mapped, so a cold
+    worker pays a page-in instead of re-decoding the series.
+    """
+
+    def __init__(self, max_bytes, folder, max_disk_bytes):
+        self.max_bytes = max_bytes
+        self.folder = folder
+        self.max_disk_bytes = max_disk_bytes
+        self._items = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+
+    def _paths(self, key):
+        base = os.path.join(self.folder, key)
+        return base + '.npy', base + '.json'
+
+    def get(self, key):
+        with self._lock:
+            volume = self._items.get(key)
+            if volume is not None:
+                self._items.move_to_end(key)
+                return volume
+
+        npy_path, meta_path = self._paths(key)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            voxels = np.load(npy_path, mmap_mode='r')
+            os.utime(npy_path)
+        except (OSError, ValueError):
+            return None
+        volume = SeriesVolume(voxels, meta['spacing'], meta['origin'], meta['resource_ids'], key)
+        self._remember(volume)
+        return volume
+
+    def put(self, volume):
+        npy_path, meta_path = self._paths(volume.key)
+        tmp = f"{npy_path}.{uuid4().hex}.tmp"
+        with open(tmp, 'wb') as f:
+            np.save(f, np.ascontiguousarray(volume.voxels))
+        os.replace(tmp, npy_path)
+        tmp = f"{meta_path}.{uuid4().hex}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(volume.meta(), f)
+        os.replace(tmp, meta_path)
+        self._trim_disk()
+
+        # Serve the memory-mapped copy so all workers share one page cache
+        volume.voxels = np.load(npy_path, mmap_mode='r')
+        self._remember(volume)
+        return volume
+
+    def _remember(self, volume):
+        with self._lock:
+            old = self._items.pop(volume.key, None)
+            if old is not None:
+                self._bytes -= old.nbytes
+            self._items[volume.key] = volume
+            self._bytes += volume.nbytes
+            while self._bytes > self.max_bytes and len(self._items) > 1:
+                _, evicted = self._items.popitem(last=False)
+                self._bytes -= evicted.nbytes
+
+    def _trim_disk(self):
+        entries, total = [], 0
+        for name in os.listdir(self.folder):
+            if not name.endswith('.npy'):
+                continue
+            path = os.path.join(self.folder, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+        for _, size, path in sorted(entries):
+            if total <= self.max_disk_bytes:
+                break
+            for victim in (path, path[:-4] + '.json'):
+                try:
+                    os.remove(victim)
+                except OSError:
+                    pass
+            total -= size
+
+
+_cache = None
+_cache_lock = threading.Lock()
+_build_locks = {}
+
+
+class SeriesVolumeService(Base):
+    @staticmethod
+    def cache():
+        global _cache
+        if _cache is None:
+            with _cache_lock:
+                if _cache is None:
+                    config = current_app.config
+                    _cache = SeriesVolumeCache(
+                        config['SERIES_CACHE_BYTES'],
+                        config['SERIES_CACHE_FOLDER'],
+                        config['SERIES_CACHE_DISK_BYTES'],
+                    )
+        return _cache
+
+    @staticmethod
+    def key(ds_id, files):
+        """Hash of the dataset's DICOM files as they are on disk right now."""
+        parts = []
+        for f in sorted(files, key=lambda r: r.id):
+            try:
+                st = os.stat(SliceService.path(f))
+            except OSError:
+                continue
+            parts.append([f.id, f.path, st.st_mtime_ns, st.st_size])
+        payload = json.dumps({'v': VOLUME_VERSION, 'dataset': ds_id, 'files': parts})
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _primary_series(ds_id, dicom_files):
+        """
+        Restrict a dataset that mixes several series to its largest one, in
+        stored slice order. Uses the header columns saved at upload; files
+        without them are left as they are and sorted after decoding.
+        """
+        series = DicomService.series(ds_id)
+        by_id = {f.id: f for f in dicom_files}
+        if sum(len(rows) for rows in series.values()) != len(by_id):
+            return dicom_files
+        primary = max(series.values(), key=len)
+        if len(series) > 1:
+            print(f"SeriesVolume: dataset {ds_id} has {len(series)} series, using the largest ({len(primary)} slices)")
+        return [by_id[row.resource_id] for row in primary if row.resource_id in by_id]
+
+    @staticmethod
+    def stamp(ds_id, files):
+        """
+        Cache key of the volume load() would return for files, from the
+        files' stat() alone: cheap enough to validate responses derived
+        from the volume without decoding anything. None without DICOM files.
+        """
+        dicom_files = [f for f in files if SliceService.is_dicom(f)]
+        if not dicom_files:
+            return None
+        return SeriesVolumeService.key(ds_id, SeriesVolumeService._primary_series(ds_id, dicom_files))
+
+    @staticmethod
+    def load(ds_id, files):
+        """
+        The dataset's series volume, from cache or assembled once from its
+        DICOM files. Returns None if none of the files hold pixel data.
+        """
+        dicom_files = [f for f in files if SliceService.is_dicom(f)]
+        if not dicom_files:
+            return None
+        dicom_files = SeriesVolumeService._primary_series(ds_id, dicom_files)
+
+        key = SeriesVolumeService.key(ds_id, dicom_files)
+        cache = SeriesVolumeService.cache()
+        volume = cache.get(key)
+        if volume is not None:
+            return volume
+
+        # Concurrent requests for the same series wait for one build
+        with _cache_lock:
+            lock = _build_locks.setdefault(key, threading.Lock())
+        with lock:
+            volume = cache.get(key)
+            if volume is not None:
+                return volume
+
+            # Slices decode in parallel on the decode pool, in file order
+            paths = [SliceService.path(f) for f in dicom_files]
+            results = DecodeService.imap(decode_slice, [(p,) for p in paths], return_exceptions=True)
+            decoded = []
+            for f, path, result in zip(dicom_files, paths, results):
+                if isinstance(result, Exception):
+                    print(f"SeriesVolume: skipping {path}: {str(result)}")
+                    continue
+                decoded.append((f.id, result))
+            built = assemble(decoded)
+            if built is None:
+                return None
+            voxels, spacing, origin, resource_ids = built
+            volume = cache.put(SeriesVolume(voxels, spacing, origin, resource_ids, key))
+
+        with _cache_lock:
+            _build_locks.pop(key, None)
+        return volume
@@ -0,0 +1,217 @@
+import os
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+from flask import current_app
+
+from app.services.BaseService import Base
+from app.services.DecodeService import DecodeService
+from app.services.SeriesVolumeService import decode_slice
+from app.services.SliceService import SliceService
+
+# Slices sent to a worker per task, so pickling overhead is paid per batch
+SERIES_BATCH = 16
+
+# Rough per-contour bookkeeping cost counted against the cache budget
+CONTOUR_OVERHEAD = 100
+
+
+def threshold_slice(img, method='adaptive', user_threshold=50):
+    """Normalize one slice to 8-bit and binarize it with the chosen method."""
+    img = cv2.normalize(img, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)
+    if method == 'adaptive':
+        mask = cv2.adaptiveThreshold(
+            img, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+            cv2.THRESH_BINARY, 51, 2
+        )
+    elif method == 'canny':
+        mask = cv2.Canny(img, 50, 150)
+    elif method == 'manual':
+        _, mask = cv2.threshold(img, user_threshold, 255, cv2.THRESH_BINARY)
+    else:  # fallback to Otsu
+        _, mask = cv2.threshold(img, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    return mask
+
+
+def segment_pixels(img, method='adaptive', user_threshold=50):
+    """
+    Threshold one slice once and derive both outputs from it: the mask
+    bit-packed, and the outer contours with at least 3 points as (n, 2)
+    int32 arrays. Returns (packed, shape, contours).
+    """
+    mask = threshold_slice(img, method, user_threshold)
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    contours = [c.reshape(-1, 2).astype(np.int32) for c in contours if c.shape[0] >= 3]
+    return np.packbits(mask > 0), mask.shape, contours
+
+
+def segment_frames(source, indices, method, user_threshold):
+    """
+    segment_pixels of the slices at indices of a volume. source is the
+    volume itself or the path of its .npy file, which is memory-mapped so
+    only the file name crosses the process boundary. Module-level for the
+    decode pool.
+    """
+    volume = np.load(source, mmap_mode='r') if isinstance(source, str) else source
+    return [segment_pixels(volume[z], method, user_threshold) for z in indices]
+
+
+def segment_file(path, method, user_threshold):
+    """
+    segment_pixels of a DICOM file's first frame, decoded the same way as
+    series volumes so per-slice and series results agree. None without
+    pixel data.
+    """
+    decoded = decode_slice(path)
+    if decoded is None:
+        return None
+    return segment_pixels(decoded['frames'][0], method, user_threshold)
+
+
+class SliceMask:
+    """One thresholded slice: its packed binary mask and outer contours."""
+
+    def __init__(self, packed, shape, contours):
+        self.packed = packed
+        self.shape = tuple(shape)
+        self.contours = contours
+
+    @property
+    def mask(self):
+        """The mask as a (h, w) uint8 array of 0/1."""
+        count = self.shape[0] * self.shape[1]
+        return np.unpackbits(self.packed, count=count).reshape(self.shape)
+
+    @property
+    def nbytes(self):
+        return self.packed.nbytes + sum(c.nbytes + CONTOUR_OVERHEAD for c in self.contours)
+
+    def serialize_contours(self):
+        return [c.tolist() for c in self.contours]
+
+
+class SliceMaskCache:
+    """
+    In-memory LRU of thresholded slices, bounded by total bytes. Keys carry
+    the file's (mtime, size), so a replaced upload is never served.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                self._items.move_to_end(key)
+            return item
+
+    def put(self, key, item):
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= old.nbytes
+            self._items[key] = item
+            self._bytes += item.nbytes
+            while self._bytes > self.max_bytes and len(self._items) > 1:
+                _, evicted = self._items.popitem(last=False)
+                self._bytes -= evicted.nbytes
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+class SliceMaskService(Base):
+    """
+    Thresholded masks and contours of DICOM slices, computed once per
+    (file, frame, method, threshold) and shared by the contour overlay,
+    the mask mesh and the contour-interpolated volume.
+    """
+
+    @staticmethod
+    def cache():
+        global _cache
+        if _cache is None:
+            with _cache_lock:
+                if _cache is None:
+                    _cache = SliceMaskCache(current_app.config['SLICE_MASK_CACHE_BYTES'])
+        return _cache
+
+    @staticmethod
+    def key(path, frame, method, user_threshold):
+        """Cache key of one frame of a file as it is on disk right now. Raises OSError."""
+        st = os.stat(path)
+        # The threshold only changes the result of the manual method
+        threshold = int(user_threshold) if method == 'manual' else None
+        return (path, st.st_mtime_ns, st.st_size, int(frame), method, threshold)
+
+    @staticmethod
+    def slice(resource, method='adaptive', user_threshold=50):
+        """
+        SliceMask of a resource's first frame, or None if the file holds no
+        pixel data. Raises ValueError if the file is missing.
+        """
+        path = SliceService.path(resource)
+        try:
+            key = SliceMaskService.key(path, 0, method, user_threshold)
+        except OSError:
+            raise ValueError('File not found')
+
+        cache = SliceMaskService.cache()
+        item = cache.get(key)
+        if item is not None:
+            return item
+        result = segment_file(path, method, user_threshold)
+        if result is None:
+            return None
+        item = SliceMask(*result)
+        cache.put(key, item)
+        return item
+
+    @staticmethod
+    def series(series, files, method='adaptive', user_threshold=50):
+        """
+        SliceMask of every slice of an assembled SeriesVolume, in series
+        order. files are the dataset's resources; slices are keyed by the
+        file and frame they came from, so they share cache entries with
+        slice(). Misses are thresholded in batches on the decode pool.
+        """
+        paths = {f.id: SliceService.path(f) for f in files}
+        keys = []
+        frames = {}
+        for resource_id in series.resource_ids:
+            frame = frames.get(resource_id, 0)
+            frames[resource_id] = frame + 1
+            try:
+                keys.append(SliceMaskService.key(paths[resource_id], frame, method, user_threshold))
+            except (KeyError, OSError):
+                keys.append(None)
+
+        cache = SliceMaskService.cache()
+        items = [cache.get(key) if key is not None else None for key in keys]
+        missing = [z for z, item in enumerate(items) if item is None]
+        batches = [missing[i:i + SERIES_BATCH] for i in range(0, len(missing), SERIES_BATCH)]
+        # Cached volumes are memory-mapped .npy files: workers map the same
+        # file instead of receiving pixel copies
+        source = getattr(series.voxels, 'filename', None)
+        if source is not None:
+            args = [(str(source), batch, method, user_threshold) for batch in batches]
+        else:
+            args = [(series.voxels[batch], range(len(batch)), method, user_threshold) for batch in batches]
+        results = DecodeService.imap(segment_frames, args, return_exceptions=True)
+        for batch, batch_results in zip(batches, results):
+            if isinstance(batch_results, Exception):
+                # e.g. the .npy was trimmed from disk meanwhile; the mapping in hand still reads
+                print(f"SliceMask: batch failed in worker, thresholding inline: {str(batch_results)}")
+                batch_results = segment_frames(series.voxels, batch, method, user_threshold)
+            for z, result in zip(batch, batch_results):
+                items[z] = SliceMask(*result)
+                if keys[z] is not None:
+                    cache.put(keys[z], items[z])
+        return items
@@ -0,0 +1,147 @@
+import os
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+import pydicom
+from flask import current_app
+
+from app.filters import run_chain
+from app.services.BaseService import Base
+
+
+class SliceCache:
+    """
+    In-memory LRU of decoded 8-bit frames, bounded by total bytes. Keys
+    carry the file's (mtime, size) so a replaced upload is never served.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            frame = self._items.get(key)
+            if frame is not None:
+                self._items.move_to_end(key)
+            return frame
+
+    def put(self, key, frame):
+        frame.setflags(write=False)  # shared between requests
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= old.nbytes
+            self._items[key] = frame
+            self._bytes += frame.nbytes
+            while self._bytes > self.max_bytes and len(self._items) > 1:
+                _, evicted = self._items.popitem(last=False)
+                self._bytes -= evicted.nbytes
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+class SliceService(Base):
+    @staticmethod
+    def is_dicom(resource):
+        return resource.mime == 'application/dicom' or resource.path.lower().endswith('.dcm')
+
+    @staticmethod
+    def path(resource):
+        """Absolute path of an uploaded resource inside its dataset folder."""
+        base = current_app.config['UPLOAD_FOLDER']
+        if resource.dataset_id:
+            base = os.path.join(base, str(resource.dataset_id))
+        return os.path.join(base, resource.path)
+
+    @staticmethod
+    def read_slide(path, is_dicom, index=0, window=None):
+        """
+        Decode a stored slide into the 8-bit BGR frame the viewer works on.
+        index picks the frame of a multi-frame DICOM; window is an optional
+        (center, width) in rescaled units, otherwise the frame is min-max
+        stretched. Raises ValueError with a user-facing message if the file
+        cannot be turned into an image.
+        """
+        if not is_dicom:
+            raw = cv2.imread(path)
+            if raw is None:
+                raise ValueError('File not found')
+            return raw
+
+        try:
+            dcm = pydicom.dcmread(path, force=True)
+            if 'PixelData' not in dcm:
+                raise ValueError('DICOM file has no pixel data')
+            arr = dcm.pixel_array
+        except ValueError:
+            raise
+        except Exception as e:
+            raise ValueError(f'Error reading DICOM file: {str(e)}')
+        # Handle different array shapes
+        if len(arr.shape) == 3:  # Multi-slice DICOM
+            if not 0 <= index < arr.shape[0]:
+                raise ValueError('Slice index out of range')
+            arr = arr[index]
+        elif len(arr.shape) != 2:
+            raise ValueError('Unexpected DICOM array shape')
+        elif index != 0:
+            raise ValueError('Slice index out of range')
+
+        if window is not None:
+            slope = float(getattr(dcm, 'RescaleSlope', 1) or 1)
+            intercept = float(getattr(dcm, 'RescaleIntercept', 0) or 0)
+            center, width = window
+            width = max(float(width), 1.0)
+            lo = center - width / 2
+            hu = arr.astype(np.float32) * slope + intercept
+            raw = np.clip((hu - lo) * (255.0 / width), 0, 255).astype(np.uint8)
+        else:
+            # Normalize to 8-bit
+            raw = cv2.normalize(arr, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)
+        return cv2.cvtColor(raw, cv2.COLOR_GRAY2BGR)
+
+    @staticmethod
+    def cache():
+        global _cache
+        if _cache is None:
+            with _cache_lock:
+                if _cache is None:
+                    _cache = SliceCache(current_app.config['SLICE_CACHE_BYTES'])
+        return _cache
+
+    @staticmethod
+    def stamp(resource, index=0, window=None, chain=()):
+        """Cache key identifying one rendered frame of a resource's current file."""
+        path = SliceService.path(resource)
+        st = os.stat(path)
+        window = tuple(float(v) for v in window) if window is not None else None
+        return (path, st.st_mtime_ns, st.st_size, int(index), window, tuple(chain))
+
+    @staticmethod
+    def load(resource, index=0, window=None, chain=()):
+        """
+        Decoded (and optionally filtered) BGR frame of a resource, served
+        from the in-memory slice cache. The returned array is read-only.
+        """
+        try:
+            key = SliceService.stamp(resource, index, window, chain)
+        except OSError:
+            raise ValueError('File not found')
+
+        cache = SliceService.cache()
+        frame = cache.get(key)
+        if frame is not None:
+            return frame
+
+        frame = SliceService.read_slide(key[0], SliceService.is_dicom(resource), index, window)
+        if chain:
+            frame = run_chain(frame, chain)
+        cache.put(key, frame)
+        return frame
@@ -0,0 +1,89 @@
+import os
+from uuid import uuid4
+
+import cv2
+from flask import current_app
+
+from app.models.DicomResource import DicomResource
+from app.services.BaseService import Base
+from app.services.SliceService import SliceService
+
+
+def render_thumbnail(path, is_dicom, size, ext, window=None):
+    """
+    Encode a small preview of a stored slide: the first frame, windowed
+    when a (center, width) is given, scaled down to fit in size x size.
+    Returns the encoded bytes. Raises ValueError if the file is unreadable.
+    """
+    frame = SliceService.read_slide(path, is_dicom, 0, window)
+    h, w = frame.shape[:2]
+    scale = min(size / max(h, w), 1.0)
+    if scale < 1.0:
+        frame = cv2.resize(frame, (max(int(w * scale), 1), max(int(h * scale), 1)), interpolation=cv2.INTER_AREA)
+    params = [cv2.IMWRITE_WEBP_QUALITY, 80] if ext == '.webp' else []
+    ok, buf = cv2.imencode(ext, frame, params)
+    if not ok:
+        raise ValueError('Could not encode thumbnail')
+    return buf.tobytes()
+
+
+class ThumbnailService(Base):
+    """
+    Small previews for listings, written once into a .thumbs folder next
+    to the upload and served as static files. A thumbnail older than its
+    source file is regenerated.
+    """
+
+    @staticmethod
+    def ext():
+        return '.' + current_app.config['THUMBNAIL_FORMAT']
+
+    @staticmethod
+    def path(resource):
+        source = SliceService.path(resource)
+        folder = os.path.join(os.path.dirname(source), '.thumbs')
+        return os.path.join(folder, f"{resource.path}.{current_app.config['THUMBNAIL_SIZE']}{ThumbnailService.ext()}")
+
+    @staticmethod
+    def mimetype():
+        return 'image/webp' if ThumbnailService.ext() == '.webp' else 'image/png'
+
+    @staticmethod
+    def _window(resource):
+        """Stored DICOM display window, if the header carried one."""
+        dicom = DicomResource.query.get(resource.id)
+        if dicom is None or dicom.window_center is None or not dicom.window_width:
+            return None
+        return dicom.window_center, dicom.window_width
+
+    @staticmethod
+    def ensure(resource):
+        """Path of the resource's thumbnail, rendering it first if missing or stale."""
+        source = SliceService.path(resource)
+        thumb = ThumbnailService.path(resource)
+        try:
+            source_mtime = os.stat(source).st_mtime_ns
+        except OSError:
+            raise ValueError('File not found')
+        try:
+            if os.stat(thumb).st_mtime_ns >= source_mtime:
+                return thumb
+        except OSError:
+            pass
+
+        is_dicom = SliceService.is_dicom(resource)
+        window = ThumbnailService._window(resource) if is_dicom else None
+        data = render_thumbnail(source, is_dicom, current_app.config['THUMBNAIL_SIZE'],
+                                ThumbnailService.ext(), window)
+        os.makedirs(os.path.dirname(thumb), exist_ok=True)
+        tmp = f"{thumb}.{uuid4().hex}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, thumb)
+        return thumb
+
+    @staticmethod
+    def discard(resource):
+        thumb = ThumbnailService.path(resource)
+        if os.path.exists(thumb):
+            os.remove(thumb)
@@ -0,0 +1,235 @@
+import json
+import os
+import time
+import zipfile
+from contextlib import contextmanager
+from uuid import uuid4
+
+from flask import current_app
+from werkzeug.datastructures import FileStorage
+
+from app.services.BaseService import Base
+from app.services.FileService import COPY_BUFFER_SIZE
+from app.services.IngestService import IngestService
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX
+    fcntl = None
+
+# Sessions untouched for this long are removed when a new one is opened
+SESSION_TTL = 24 * 3600
+
+# Members ingested per transaction when unpacking an archive
+ZIP_BATCH_SIZE = 64
+
+
+def _merge(ranges, start, end):
+    """Add [start, end) to a sorted list of disjoint [start, end) ranges."""
+    merged = []
+    for s, e in sorted(ranges + [[start, end]]):
+        if merged and s <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], e)
+        else:
+            merged.append([s, e])
+    return merged
+
+
+class UploadSessionService(Base):
+    """
+    Resumable chunked uploads. A session is a preallocated .part file plus
+    a JSON state file under UPLOAD_SESSION_FOLDER. Chunks are written
+    straight from the request stream at their offset, in any order and
+    from any worker, and the received byte ranges are recorded so a client
+    can resume after a dropped connection. Finalizing moves the assembled
+    file into the dataset folder (or unpacks it, for a ZIP) and runs the
+    normal ingest.
+    """
+
+    @staticmethod
+    def _folder():
+        folder = current_app.config['UPLOAD_SESSION_FOLDER']
+        os.makedirs(folder, exist_ok=True)
+        return folder
+
+    @staticmethod
+    def _paths(upload_id):
+        if not upload_id.isalnum():
+            raise KeyError(upload_id)
+        base = os.path.join(UploadSessionService._folder(), upload_id)
+        return base + '.part', base + '.json'
+
+    @staticmethod
+    @contextmanager
+    def _locked_state(upload_id):
+        """Read-modify-write the session state under an exclusive file lock."""
+        _, state_path = UploadSessionService._paths(upload_id)
+        try:
+            f = open(state_path, 'r+')
+        except FileNotFoundError:
+            raise KeyError(upload_id)
+        with f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            state = json.load(f)
+            yield state
+            state['updated_at'] = time.time()
+            f.seek(0)
+            f.truncate()
+            json.dump(state, f)
+
+    @staticmethod
+    def open(dataset_id, owner_id, filename, size, mimetype=None):
+        if size <= 0:
+            raise ValueError("Upload size must be positive")
+        if size > current_app.config['UPLOAD_SESSION_MAX_BYTES']:
+            raise ValueError("Upload is too large")
+
+        UploadSessionService._prune()
+        upload_id = uuid4().hex
+        part_path, state_path = UploadSessionService._paths(upload_id)
+        with open(part_path, 'wb') as f:
+            f.truncate(size)
+        state = {
+            'upload_id': upload_id,
+            'dataset_id': dataset_id,
+            'owner_id': owner_id,
+            'filename': filename,
+            'mimetype': mimetype or 'application/octet-stream',
+            'size': size,
+            'received': [],
+            'created_at': time.time(),
+            'updated_at': time.time(),
+        }
+        with open(state_path, 'w') as f:
+            json.dump(state, f)
+        return UploadSessionService.describe(state)
+
+    @staticmethod
+    def read(upload_id):
+        _, state_path = UploadSessionService._paths(upload_id)
+        try:
+            with open(state_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def describe(state):
+        received = sum(e - s for s, e in state['received'])
+        return {
+            'upload_id': state['upload_id'],
+            'dataset_id': state['dataset_id'],
+            'filename': state['filename'],
+            'size': state['size'],
+            'received_bytes': received,
+            'received': state['received'],
+            'complete': received == state['size'],
+            'chunk_size': current_app.config['UPLOAD_CHUNK_SIZE'],
+        }
+
+    @staticmethod
+    def write_chunk(upload_id, offset, stream, length):
+        """Copy length bytes of stream into the session file at offset."""
+        state = UploadSessionService.read(upload_id)
+        if state is None:
+            raise KeyError(upload_id)
+        if offset < 0 or length < 0 or offset + length > state['size']:
+            raise ValueError("Chunk lies outside the declared upload size")
+
+        part_path, _ = UploadSessionService._paths(upload_id)
+        written = 0
+        with open(part_path, 'r+b') as f:
+            f.seek(offset)
+            while written < length:
+                block = stream.read(min(COPY_BUFFER_SIZE, length - written))
+                if not block:
+                    break
+                f.write(block)
+                written += len(block)
+
+        # Only the bytes that actually arrived count as received
+        with UploadSessionService._locked_state(upload_id) as state:
+            if written:
+                state['received'] = _merge(state['received'], offset, offset + written)
+            result = UploadSessionService.describe(state)
+        if written < length:
+            raise ValueError(f"Chunk truncated: got {written} of {length} bytes")
+        return result
+
+    @staticmethod
+    def finalize(upload_id):
+        """
+        Ingest a completely received upload. A ZIP is unpacked member by
+        member without extracting it to disk first; anything else is moved
+        into the dataset folder as is. Returns per-file IngestResults.
+        """
+        state = UploadSessionService.read(upload_id)
+        if state is None:
+            raise KeyError(upload_id)
+        if not UploadSessionService.describe(state)['complete']:
+            raise ValueError("Upload is not complete")
+
+        part_path, _ = UploadSessionService._paths(upload_id)
+        try:
+            if state['filename'].lower().endswith('.zip'):
+                results = UploadSessionService._ingest_zip(part_path, state['dataset_id'])
+            else:
+                results = [IngestService.ingest_path(
+                    part_path, state['filename'], state['mimetype'], state['dataset_id'])]
+        finally:
+            UploadSessionService.discard(upload_id)
+        return results
+
+    @staticmethod
+    def discard(upload_id):
+        for path in UploadSessionService._paths(upload_id):
+            if os.path.exists(path):
+                os.remove(path)
+
+    @staticmethod
+    def _ingest_zip(part_path, dataset_id):
+        results = []
+        with zipfile.ZipFile(part_path) as archive:
+            members = [
+                m for m in archive.infolist()
+                if not m.is_dir()
+                and not os.path.basename(m.filename).startswith('.')
+                and not m.filename.startswith('__MACOSX/')
+            ]
+            for i in range(0, len(members), ZIP_BATCH_SIZE):
+                batch = [UploadSessionService._member(archive, m) for m in members[i:i + ZIP_BATCH_SIZE]]
+                try:
+                    results.extend(IngestService.ingest(batch, dataset_id))
+                finally:
+                    for member in batch:
+                        member.stream.close()
+        return results
+
+    @staticmethod
+    def _member(archive, info):
+        """FileStorage over a ZIP member, streamed from the archive."""
+        stream = archive.open(info)
+        name = os.path.basename(info.filename)
+        mimetype = 'application/octet-stream'
+        # Series exports often name slices without an extension; sniff the DICOM preamble
+        if '.' not in name:
+            head = stream.read(132)
+            stream.seek(0)
+            if head[128:132] == b'DICM':
+                name += '.dcm'
+        if name.lower().endswith(('.dcm', '.dicom')):
+            mimetype = 'application/dicom'
+        return FileStorage(stream=stream, filename=name, content_type=mimetype)
+
+    @staticmethod
+    def _prune():
+        folder = UploadSessionService._folder()
+        cutoff = time.time() - SESSION_TTL
+        for name in os.listdir(folder):
+            path = os.path.join(folder, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,49 @@
+import atexit
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from app.services.BaseService import Base
+
+_pools = {}
+_lock = threading.Lock()
+
+
+class WorkerPool(Base):
+    """
+    Named, lazily created local process pools. No external broker: work is
+    handed to worker processes started with 'spawn', so they never inherit
+    the web worker's threads, DB connections or loaded models.
+    """
+
+    @staticmethod
+    def get(name, max_workers):
+        pool = _pools.get(name)
+        if pool is None:
+            with _lock:
+                pool = _pools.get(name)
+                if pool is None:
+                    pool = ProcessPoolExecutor(
+                        max_workers=max_workers,
+                        mp_context=multiprocessing.get_context('spawn'),
+                    )
+                    _pools[name] = pool
+        return pool
+
+    @staticmethod
+    def discard(name):
+        """Drop a pool (e.g. after BrokenProcessPool) so the next get() rebuilds it."""
+        with _lock:
+            pool = _pools.pop(name, None)
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    @staticmethod
+    def shutdown():
+        with _lock:
+            for pool in _pools.values():
+                pool.shutdown(wait=False, cancel_futures=True)
+            _pools.clear()
+
+
+atexit.register(WorkerPool.shutdown)
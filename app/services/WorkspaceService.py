@@ -0,0 +1,162 @@
+import threading
+from collections import OrderedDict
+from uuid import uuid4
+
+import numpy as np
+from flask import current_app, session
+
+from app.services.BaseService import Base
+
+
+class Workspace:
+    """
+    Single-image workspace: the original frame, the current frame and the
+    operation log that turns one into the other.
+
+    History is kept as the log itself rather than as full frame copies, so
+    undo replays the remaining operations from the original image.
+    """
+
+    def __init__(self, original):
+        self.original = original
+        self.current = original
+        self.operations = []
+
+    @property
+    def processes(self):
+        """Operation names in the order they were applied."""
+        return [op['name'] for op in self.operations]
+
+    @property
+    def nbytes(self):
+        size = self.original.nbytes
+        if self.current is not self.original:
+            size += self.current.nbytes
+        for op in self.operations:
+            payload = op.get('payload') or {}
+            size += sum(getattr(v, 'nbytes', 0) for v in payload.values())
+        return size
+
+
+class WorkspaceStore:
+    """
+    Thread-safe LRU store of workspaces bounded by a total memory budget.
+    """
+
+    def __init__(self, budget_bytes):
+        self.budget_bytes = budget_bytes
+        self._items = OrderedDict()
+        self._sizes = {}
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            ws = self._items.get(key)
+            if ws is not None:
+                self._items.move_to_end(key)
+            return ws
+
+    def put(self, key, ws):
+        with self._lock:
+            self._total -= self._sizes.pop(key, 0)
+            self._items[key] = ws
+            self._items.move_to_end(key)
+            self._sizes[key] = ws.nbytes
+            self._total += self._sizes[key]
+            self._evict(keep=key)
+
+    def discard(self, key):
+        with self._lock:
+            if self._items.pop(key, None) is not None:
+                self._total -= self._sizes.pop(key, 0)
+
+    def _evict(self, keep):
+        # Least recently used first; never evict the workspace just written.
+        while self._total > self.budget_bytes and len(self._items) > 1:
+            oldest = next(iter(self._items))
+            if oldest == keep:
+                break
+            self._items.pop(oldest)
+            self._total -= self._sizes.pop(oldest, 0)
+
+    @property
+    def total_bytes(self):
+        return self._total
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+class WorkspaceService(Base):
+    @staticmethod
+    def store():
+        global _store
+        if _store is None:
+            with _store_lock:
+                if _store is None:
+                    _store = WorkspaceStore(current_app.config['WORKSPACE_MEMORY_BUDGET'])
+        return _store
+
+    @staticmethod
+    def key(file_id):
+        """Workspaces are scoped to the browser session and the file."""
+        if 'workspace_id' not in session:
+            session['workspace_id'] = uuid4().hex
+        return session['workspace_id'], file_id
+
+    @staticmethod
+    def get(file_id):
+        return WorkspaceService.store().get(WorkspaceService.key(file_id))
+
+    @staticmethod
+    def open(file_id, loader):
+        """
+        Return the workspace for file_id, creating it from loader() if the
+        session has none (or it was evicted). Returns None if loader does.
+        """
+        key = WorkspaceService.key(file_id)
+        ws = WorkspaceService.store().get(key)
+        if ws is None:
+            original = loader()
+            if original is None:
+                return None
+            ws = Workspace(original)
+            WorkspaceService.store().put(key, ws)
+        return ws
+
+    @staticmethod
+    def push(file_id, ws, name, result, payload=None):
+        """
+        Record an operation and its resulting frame. payload is an optional
+        dict of compact arrays needed to replay the operation later.
+        """
+        ws.operations.append({'name': name, 'payload': payload})
+        ws.current = result
+        WorkspaceService.store().put(WorkspaceService.key(file_id), ws)
+
+    @staticmethod
+    def undo(file_id, ws, replay):
+        """Drop the last operation and rebuild the current frame via replay(ws)."""
+        if not ws.operations:
+            return
+        ws.operations.pop()
+        ws.current = replay(ws) if ws.operations else ws.original
+        WorkspaceService.store().put(WorkspaceService.key(file_id), ws)
+
+    @staticmethod
+    def reset(file_id):
+        WorkspaceService.store().discard(WorkspaceService.key(file_id))
+
+    @staticmethod
+    def pack_mask(mask):
+        """Bit-pack a boolean mask so it can live in the operation log."""
+        mask = np.asarray(mask, dtype=bool)
+        return {'shape': mask.shape, 'bits': np.packbits(mask)}
+
+    @staticmethod
+    def unpack_mask(packed):
+        shape = packed['shape']
+        count = int(np.prod(shape))
+        return np.unpackbits(packed['bits'], count=count).astype(bool).reshape(shape)
@@ -4,7 +4,19 @@ import cv2
 from segment_anything import sam_model_registry, SamPredictor
 from flask import current_app
 from .download_medsam import download_medsam_model
+from .EmbeddingCacheService import EmbeddingCacheService
+from .ModelRegistry import ModelRegistry
 import os
+import threading
+
+# Arrays stored per embedding-cache entry for SamPredictor
+FEATURE_NAMES = ('features', 'original_size', 'input_size')
+
+def _load_sam(model_type, checkpoint, device):
+    model = sam_model_registry[model_type](checkpoint=checkpoint)
+    model.to(device=device)
+    model.eval()
+    return model
 
 class MedSAMService:
     _instance = None
@@ -20,6 +32,7 @@ class MedSAMService:
             self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
             self.model = None
             self.predictor = None
+            self._lock = threading.Lock()
             self._initialized = True
 
     def initialize_model(self):
@@ -40,8 +53,10 @@ class MedSAMService:
                     "Please download it manually and place it in the models directory."
                 )
             
-        self.model = sam_model_registry[model_type](checkpoint=checkpoint)
-        self.model.to(device=self.device)
+        self.model = ModelRegistry.get(
+            f"medsam_{model_type}:{self.device}",
+            lambda: _load_sam(model_type, checkpoint, self.device),
+        )
         self.predictor = SamPredictor(self.model)
 
     def segment_image(self, image, box):
@@ -58,21 +73,47 @@ class MedSAMService:
         if self.predictor is None:
             self.initialize_model()
 
-        # Set the image in the predictor
-        self.predictor.set_image(image)
+        # The predictor holds per-image state, so serialize access to it
+        with self._lock:
+            self._set_image(image)
 
-        # Convert box to the format expected by MedSAM
-        input_box = np.array(box)
+            # Convert box to the format expected by MedSAM
+            input_box = np.array(box)
 
-        # Generate the mask
-        masks, _, _ = self.predictor.predict(
-            box=input_box,
-            multimask_output=False
-        )
+            # Generate the mask
+            masks, _, _ = self.predictor.predict(
+                box=input_box,
+                multimask_output=False
+            )
 
         # Return the first mask
         return masks[0]
 
+    def _set_image(self, image):
+        """
+        Load image into the predictor, reusing a cached image embedding when
+        the same pixels were encoded before so only the decoder runs.
+        """
+        image = np.asarray(image)
+        cache = EmbeddingCacheService.cache()
+        key = cache.key(image, {'model': 'medsam_vit_h', 'preprocess': 'sam_resize_1024'})
+
+        cached = cache.get(key, FEATURE_NAMES)
+        if cached is not None:
+            self.predictor.reset_image()
+            self.predictor.features = torch.from_numpy(cached['features']).to(self.device)
+            self.predictor.original_size = tuple(int(v) for v in cached['original_size'])
+            self.predictor.input_size = tuple(int(v) for v in cached['input_size'])
+            self.predictor.is_image_set = True
+            return
+
+        self.predictor.set_image(image)
+        cache.put(key, {
+            'features': self.predictor.features.detach().cpu().numpy(),
+            'original_size': np.array(self.predictor.original_size),
+            'input_size': np.array(self.predictor.input_size),
+        })
+
     def overlay_mask(self, image, mask, alpha=0.5):
         """
         Overlay the segmentation mask on the original image.
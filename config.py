@@ -13,6 +13,60 @@ class Config:
     
     MEDSAM_PATH = os.path.join(basedir, "app/vendors/MedSAM")
 
+    # Per-session single-image workspaces (original + current frame + op log)
+    WORKSPACE_MEMORY_BUDGET = int(os.environ.get('WORKSPACE_MEMORY_BUDGET', 512 * 1024 * 1024))
+
+    # Rendered filter-chain prefixes served by /process/image
+    FILTER_CACHE_FOLDER = os.path.join(basedir, 'cache', 'filters')
+    FILTER_CACHE_MAX_BYTES = int(os.environ.get('FILTER_CACHE_MAX_BYTES', 1024 * 1024 * 1024))
+
+    # Dataset-wide batch render jobs (local process pool, no broker)
+    BATCH_WORKERS = int(os.environ.get('BATCH_WORKERS', os.cpu_count() or 2))
+    BATCH_JOB_FOLDER = os.path.join(basedir, 'cache', 'jobs')
+
+    # Decoded slices kept in memory for the AI endpoints
+    SLICE_CACHE_BYTES = int(os.environ.get('SLICE_CACHE_BYTES', 256 * 1024 * 1024))
+
+    # Series-wide DICOM decoding (local process pool) and its per-request time budget in seconds
+    DECODE_WORKERS = int(os.environ.get('DECODE_WORKERS', os.cpu_count() or 2))
+    DECODE_TIME_BUDGET = float(os.environ.get('DECODE_TIME_BUDGET', 60))
+
+    # Assembled per-dataset int16 volumes for the 3D endpoints (memory LRU + memmapped .npy)
+    SERIES_CACHE_BYTES = int(os.environ.get('SERIES_CACHE_BYTES', 1024 * 1024 * 1024))
+    SERIES_CACHE_FOLDER = os.path.join(basedir, 'cache', 'volumes')
+    SERIES_CACHE_DISK_BYTES = int(os.environ.get('SERIES_CACHE_DISK_BYTES', 8 * 1024 * 1024 * 1024))
+
+    # Thresholded slice masks and contours shared by the contour overlay and the 3D endpoints
+    SLICE_MASK_CACHE_BYTES = int(os.environ.get('SLICE_MASK_CACHE_BYTES', 128 * 1024 * 1024))
+
+    # Largest contour-interpolated volume (voxels) built for mesh export
+    VOLUME_MAX_VOXELS = int(os.environ.get('VOLUME_MAX_VOXELS', 128 * 1024 * 1024))
+
+    # MedSAM image-encoder outputs reused across prompts on the same image; entries evicted
+    # from memory spill to EMBEDDING_CACHE_FOLDER (set it empty to keep the cache in memory only)
+    EMBEDDING_CACHE_SIZE = int(os.environ.get('EMBEDDING_CACHE_SIZE', 32))
+    EMBEDDING_CACHE_FOLDER = os.environ.get('EMBEDDING_CACHE_FOLDER', os.path.join(basedir, 'cache', 'embeddings'))
+    EMBEDDING_CACHE_DISK_ENTRIES = int(os.environ.get('EMBEDDING_CACHE_DISK_ENTRIES', 512))
+
+    # Load MedSAM2 in a background thread at startup instead of on first use
+    MEDSAM2_WARMUP = os.environ.get('MEDSAM2_WARMUP', '0').lower() in ('1', 'true', 'yes')
+
+    # Concurrent disk writers per bulk upload
+    INGEST_WRITERS = int(os.environ.get('INGEST_WRITERS', 8))
+
+    # Resumable chunked uploads: session files live under UPLOAD_FOLDER so finalizing is a rename
+    UPLOAD_SESSION_FOLDER = os.path.join(UPLOAD_FOLDER, '.sessions')
+    UPLOAD_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024))
+    UPLOAD_SESSION_MAX_BYTES = int(os.environ.get('UPLOAD_SESSION_MAX_BYTES', 4 * 1024 * 1024 * 1024))
+
+    # Keyset-paginated API listings: default and maximum items per page
+    API_PAGE_SIZE = int(os.environ.get('API_PAGE_SIZE', 100))
+    API_MAX_PAGE_SIZE = int(os.environ.get('API_MAX_PAGE_SIZE', 1000))
+
+    # Listing previews stored next to each upload (longest side in px, 'webp' or 'png')
+    THUMBNAIL_SIZE = int(os.environ.get('THUMBNAIL_SIZE', 160))
+    THUMBNAIL_FORMAT = os.environ.get('THUMBNAIL_FORMAT', 'webp')
+
     if not os.path.exists(UPLOAD_FOLDER):
         os.makedirs(UPLOAD_FOLDER)
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'dcm', 'dicom'}